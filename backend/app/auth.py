@@ -1,5 +1,8 @@
 from typing import Optional
-from fastapi import Header
+from fastapi import Header, HTTPException
+import hmac
+
+from .config import settings
 
 
 async def get_current_user_id(authorization: Optional[str] = Header(default=None)) -> Optional[str]:
@@ -10,3 +13,15 @@ async def get_current_user_id(authorization: Optional[str] = Header(default=None
     return None
 
 
+async def require_admin(
+    x_admin_token: Optional[str] = Header(default=None),
+    authorization: Optional[str] = Header(default=None),
+) -> None:
+    """调试/管理接口的鉴权：未配置 ADMIN_TOKEN 时接口视为不存在"""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = x_admin_token
+    if token is None and authorization and authorization.lower().startswith("bearer "):
+        token = authorization[7:].strip()
+    if not token or not hmac.compare_digest(token.encode("utf-8"), settings.ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Forbidden")
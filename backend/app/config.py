@@ -22,12 +22,78 @@ class Settings(BaseModel):
     LLM_API_KEY: str = os.getenv("LLM_API_KEY", "")
     LLM_MODEL_CHAT: str = os.getenv("LLM_MODEL_CHAT", "gpt-4o-mini")
     LLM_MODEL_MODERATION: str = os.getenv("LLM_MODEL_MODERATION", "")
+    # 安全检查：本地规则与主生成并行，无法判定时才调用 LLM_MODEL_MODERATION；输出中的手机号/身份证号打码
+    SAFETY_ENABLED: bool = os.getenv("SAFETY_ENABLED", "true").lower() == "true"
+    SAFETY_MODERATION_TIMEOUT: float = float(os.getenv("SAFETY_MODERATION_TIMEOUT", "3"))
+    SAFETY_REDACT_PII: bool = os.getenv("SAFETY_REDACT_PII", "true").lower() == "true"
+    # 意图路由：寒暄走 fast 档，编程问题走 code 档，未配置时均回退到 LLM_MODEL_CHAT
+    LLM_ROUTING_ENABLED: bool = os.getenv("LLM_ROUTING_ENABLED", "true").lower() == "true"
+    LLM_ROUTING_MIN_CONFIDENCE: float = float(os.getenv("LLM_ROUTING_MIN_CONFIDENCE", "0.5"))
+    LLM_MODEL_FAST: str = os.getenv("LLM_MODEL_FAST", "")
+    LLM_MODEL_CODE: str = os.getenv("LLM_MODEL_CODE", "")
+    # 多端点 LLM 池：JSON 数组或逗号分隔的 "base_url|api_key"，为空时使用 LLM_API_BASE/LLM_API_KEY
+    LLM_ENDPOINTS: str = os.getenv("LLM_ENDPOINTS", "")
+    LLM_BREAKER_THRESHOLD: int = int(os.getenv("LLM_BREAKER_THRESHOLD", "3"))
+    LLM_BREAKER_COOLDOWN: float = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+    # 对冲请求：首 token 超过该端点历史 TTFT 的指定分位（限制在 MIN/MAX 之间）仍未到达时，向下一个端点再发一次
+    LLM_HEDGE_ENABLED: bool = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_PERCENTILE: float = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+    LLM_HEDGE_MIN_MS: float = float(os.getenv("LLM_HEDGE_MIN_MS", "300"))
+    LLM_HEDGE_MAX_MS: float = float(os.getenv("LLM_HEDGE_MAX_MS", "5000"))
+    LLM_HEDGE_MIN_SAMPLES: int = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+    # 合并相同的进行中 LLM 请求（模型、消息与参数都相同）
+    LLM_SINGLEFLIGHT_ENABLED: bool = os.getenv("LLM_SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+    # LLM 调用优先级调度：总并发与 interactive / nearline / background 各级预算；
+    # background 只能使用总并发减去预留量的部分，交互请求排队达到阈值时抢占排队中的后台请求
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+    LLM_INTERACTIVE_LIMIT: int = int(os.getenv("LLM_INTERACTIVE_LIMIT", "32"))
+    LLM_NEARLINE_LIMIT: int = int(os.getenv("LLM_NEARLINE_LIMIT", "8"))
+    LLM_BACKGROUND_LIMIT: int = int(os.getenv("LLM_BACKGROUND_LIMIT", "4"))
+    LLM_BACKGROUND_RESERVE: int = int(os.getenv("LLM_BACKGROUND_RESERVE", "8"))
+    LLM_PREEMPT_QUEUE_DEPTH: int = int(os.getenv("LLM_PREEMPT_QUEUE_DEPTH", "4"))
+    LLM_PREEMPT_BACKOFF: float = float(os.getenv("LLM_PREEMPT_BACKOFF", "2"))
+    LLM_PREEMPT_MAX_RETRIES: int = int(os.getenv("LLM_PREEMPT_MAX_RETRIES", "5"))
     
     # 向量大模型配置 (用于嵌入向量生成)
     EMBEDDING_API_BASE: str = os.getenv("EMBEDDING_API_BASE", "")
     EMBEDDING_API_KEY: str = os.getenv("EMBEDDING_API_KEY", "")
     EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
     EMBEDDING_DIM: int = int(os.getenv("EMBEDDING_DIM", "1536"))
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+    EMBEDDING_CACHE_SIZE: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "50000"))
+
+    # 聊天接口准入控制：全局/单会话并发上限与有界等待队列
+    CHAT_MAX_CONCURRENCY: int = int(os.getenv("CHAT_MAX_CONCURRENCY", "64"))
+    CHAT_MAX_CONCURRENCY_PER_KEY: int = int(os.getenv("CHAT_MAX_CONCURRENCY_PER_KEY", "2"))
+    CHAT_QUEUE_SIZE: int = int(os.getenv("CHAT_QUEUE_SIZE", "128"))
+    CHAT_QUEUE_TIMEOUT: float = float(os.getenv("CHAT_QUEUE_TIMEOUT", "10"))
+    # SSE 帧合并：首 token 立即发送，其后按时间/字节阈值合并增量；客户端可通过 coalesce_ms / coalesce_bytes 覆盖（不超过上限）
+    SSE_COALESCE_MS: float = float(os.getenv("SSE_COALESCE_MS", "15"))
+    SSE_COALESCE_BYTES: int = int(os.getenv("SSE_COALESCE_BYTES", "512"))
+    SSE_COALESCE_MAX_MS: float = float(os.getenv("SSE_COALESCE_MAX_MS", "200"))
+    SSE_COALESCE_MAX_BYTES: int = int(os.getenv("SSE_COALESCE_MAX_BYTES", "8192"))
+    # SSE 断线续传：每轮保留最近的事件，结束后保留 TTL 秒，客户端凭 Last-Event-ID 重连续读
+    SSE_REPLAY_TTL: float = float(os.getenv("SSE_REPLAY_TTL", "60"))
+    SSE_REPLAY_BUFFER_EVENTS: int = int(os.getenv("SSE_REPLAY_BUFFER_EVENTS", "1024"))
+    SSE_RETRY_MS: int = int(os.getenv("SSE_RETRY_MS", "1000"))
+    # 最后一个客户端断开后等待重连的秒数，超时仍无人续传则取消本轮生成（0 表示立即取消）
+    TURN_DISCONNECT_GRACE: float = float(os.getenv("TURN_DISCONNECT_GRACE", "10"))
+    # WebSocket 聊天：每轮未确认事件的窗口（0 表示不做流控）、单连接并发轮次与发送队列上限
+    WS_TURN_WINDOW: int = int(os.getenv("WS_TURN_WINDOW", "64"))
+    WS_MAX_TURNS_PER_CONNECTION: int = int(os.getenv("WS_MAX_TURNS_PER_CONNECTION", "8"))
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+    # 会话标题：首轮结束先用截断的临时标题，后台攒批（最多 TITLE_BATCH_SIZE 个或等待 TITLE_BATCH_WINDOW 秒）一次生成
+    TITLE_BATCH_SIZE: int = int(os.getenv("TITLE_BATCH_SIZE", "8"))
+    TITLE_BATCH_WINDOW: float = float(os.getenv("TITLE_BATCH_WINDOW", "1.0"))
+    # 会话事件流（/api/sessions/{id}/events）等待正式标题的最长秒数，超时后客户端保留临时标题
+    TITLE_WAIT_TIMEOUT: float = float(os.getenv("TITLE_WAIT_TIMEOUT", "10"))
+
+    # 回复缓存（可选）：精确匹配 + 语义相似度匹配，阈值为 0 时关闭语义层
+    RESPONSE_CACHE_ENABLED: bool = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+    RESPONSE_CACHE_TTL: int = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    RESPONSE_CACHE_MAX_ITEMS: int = int(os.getenv("RESPONSE_CACHE_MAX_ITEMS", "1000"))
+    RESPONSE_CACHE_SEMANTIC_THRESHOLD: float = float(os.getenv("RESPONSE_CACHE_SEMANTIC_THRESHOLD", "0.95"))
+    RESPONSE_CACHE_REPLAY_CHUNK: int = int(os.getenv("RESPONSE_CACHE_REPLAY_CHUNK", "8"))
 
     # Supabase
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
@@ -55,8 +121,36 @@ class Settings(BaseModel):
     # Observability
     OTEL_EXPORTER_OTLP_ENDPOINT: str = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
     OTEL_SERVICE_NAME: str = os.getenv("OTEL_SERVICE_NAME", "ai-chat-backend")
+    # 追踪采样：头部按比例记录，导出前尾部采样——出错或慢于 OTEL_TAIL_LATENCY_MS 的 trace 全部保留，其余按比例抽样
+    OTEL_HEAD_SAMPLE_RATIO: float = float(os.getenv("OTEL_HEAD_SAMPLE_RATIO", "1.0"))
+    OTEL_TAIL_SAMPLING: bool = os.getenv("OTEL_TAIL_SAMPLING", "true").lower() == "true"
+    OTEL_TAIL_SAMPLE_RATIO: float = float(os.getenv("OTEL_TAIL_SAMPLE_RATIO", "0.05"))
+    OTEL_TAIL_LATENCY_MS: float = float(os.getenv("OTEL_TAIL_LATENCY_MS", "3000"))
+    OTEL_TAIL_MAX_TRACES: int = int(os.getenv("OTEL_TAIL_MAX_TRACES", "2000"))
     PROM_ENABLED: bool = os.getenv("PROM_ENABLED", "true").lower() == "true"
+    # 日志：json / text；LOG_LEVELS 为 "logger=LEVEL" 逗号分隔的模块级别，运行时可通过 /api/debug/log-levels 调整
     LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVELS: str = os.getenv("LOG_LEVELS", "")
+    # 日志写入后台线程前的有界队列，满时丢弃而不阻塞请求
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    # 重复的 WARNING 及以上日志：每个窗口内同一条最多输出 BURST 次（0 表示不限流）
+    LOG_RATE_LIMIT_BURST: int = int(os.getenv("LOG_RATE_LIMIT_BURST", "5"))
+    LOG_RATE_LIMIT_WINDOW: float = float(os.getenv("LOG_RATE_LIMIT_WINDOW", "60"))
+    # 事件循环看门狗：每 INTERVAL 测一次循环延迟，阻塞超过 THRESHOLD 时每 SAMPLE 毫秒采样一次循环线程的调用栈
+    LOOP_MONITOR_ENABLED: bool = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+    LOOP_MONITOR_INTERVAL_MS: float = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100"))
+    LOOP_BLOCK_THRESHOLD_MS: float = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100"))
+    LOOP_STACK_SAMPLE_MS: float = float(os.getenv("LOOP_STACK_SAMPLE_MS", "20"))
+    LOOP_MAX_SITES: int = int(os.getenv("LOOP_MAX_SITES", "200"))
+    # /api/debug/profile 单次采样的最长秒数
+    PROFILE_MAX_SECONDS: float = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+    # 启动预热：单项超时秒数、必需项（数据库、对话图）失败后的重试间隔、预先建立的数据库连接数
+    WARMUP_TIMEOUT: float = float(os.getenv("WARMUP_TIMEOUT", "30"))
+    WARMUP_RETRY_INTERVAL: float = float(os.getenv("WARMUP_RETRY_INTERVAL", "5"))
+    DB_WARMUP_CONNECTIONS: int = int(os.getenv("DB_WARMUP_CONNECTIONS", "2"))
+    # 调试/管理接口的令牌（X-Admin-Token 或 Bearer），为空时这些接口不可用
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")
 
     # Redis
     REDIS_URL: str = os.getenv("REDIS_URL", "")
@@ -69,6 +163,33 @@ class Settings(BaseModel):
     MEM0_API_KEY: str = os.getenv("MEM0_API_KEY", "")
     MEM0_BASE_URL: str = os.getenv("MEM0_BASE_URL", "")
 
+    # 记忆画像（高重要性记忆预编译后直接注入系统消息）
+    MEMORY_PROFILE_ENABLED: bool = os.getenv("MEMORY_PROFILE_ENABLED", "true").lower() == "true"
+    MEMORY_PROFILE_MAX_ITEMS: int = int(os.getenv("MEMORY_PROFILE_MAX_ITEMS", "20"))
+    MEMORY_PROFILE_TTL: int = int(os.getenv("MEMORY_PROFILE_TTL", "600"))
+    MEMORY_PROFILE_SCAN_LIMIT: int = int(os.getenv("MEMORY_PROFILE_SCAN_LIMIT", "200"))
+    # 缓存画像的用户数上限（LRU）
+    MEMORY_PROFILE_MAX_USERS: int = int(os.getenv("MEMORY_PROFILE_MAX_USERS", "1000"))
+
+    # 记忆检索：vector / lexical / hybrid / auto（向量检索变慢时自动退化为仅倒排索引）
+    MEMORY_RETRIEVAL_MODE: str = os.getenv("MEMORY_RETRIEVAL_MODE", "vector")
+    MEMORY_RRF_K: int = int(os.getenv("MEMORY_RRF_K", "60"))
+    MEMORY_LEXICAL_FALLBACK_MS: float = float(os.getenv("MEMORY_LEXICAL_FALLBACK_MS", "800"))
+    MEMORY_VECTOR_PROBE_INTERVAL: float = float(os.getenv("MEMORY_VECTOR_PROBE_INTERVAL", "30"))
+    # 每个用户保留的记忆变更条数（增量同步窗口）
+    MEMORY_CHANGE_LOG_SIZE: int = int(os.getenv("MEMORY_CHANGE_LOG_SIZE", "1000"))
+    # 保留变更日志的用户数上限（按最近变更淘汰）
+    MEMORY_CHANGE_LOG_USERS: int = int(os.getenv("MEMORY_CHANGE_LOG_USERS", "10000"))
+    # 批量检索时参与计算的记忆条数上限
+    MEMORY_BATCH_SEARCH_SCAN_LIMIT: int = int(os.getenv("MEMORY_BATCH_SEARCH_SCAN_LIMIT", "1000"))
+    MEMORY_BATCH_SEARCH_MAX_QUERIES: int = int(os.getenv("MEMORY_BATCH_SEARCH_MAX_QUERIES", "100"))
+    # 向量库不支持分页遍历（API 模式）时导出的记忆条数上限
+    MEMORY_EXPORT_FALLBACK_LIMIT: int = int(os.getenv("MEMORY_EXPORT_FALLBACK_LIMIT", "10000"))
+    # 导入时请求体在内存中暂存的字节数上限，超过后写入临时文件
+    MEMORY_IMPORT_SPOOL_BYTES: int = int(os.getenv("MEMORY_IMPORT_SPOOL_BYTES", str(8 * 1024 * 1024)))
+    # API 模式下导入的并发 add 调用数（嵌入在服务端完成，无法批量）
+    MEMORY_IMPORT_API_CONCURRENCY: int = int(os.getenv("MEMORY_IMPORT_API_CONCURRENCY", "8"))
+
 
 settings = Settings()
 
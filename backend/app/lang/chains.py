@@ -1,15 +1,19 @@
 from typing import Any
 
 
+# 各意图的提示链：在基础系统消息（含记忆）之上追加针对性指令，返回最终系统消息
+
 async def general_qa_chain(prompt: str, context: dict[str, Any]) -> str:
-    return f"[general_qa] {prompt}"
+    return context["system_content"] + "\n\n请准确、简洁地回答用户的问题。"
 
 
 async def code_helper_chain(prompt: str, context: dict[str, Any]) -> str:
-    return f"[code_helper] {prompt}"
+    return context["system_content"] + "\n\n用户在咨询编程相关问题：给出可运行的代码，使用标注语言的 Markdown 代码块，并简要说明关键点。"
 
 
-async def fallback_chain(prompt: str, context: dict[str, Any]) -> str:
-    return f"[fallback] {prompt}"
+async def chitchat_chain(prompt: str, context: dict[str, Any]) -> str:
+    return context["system_content"] + "\n\n用户在寒暄，请用一两句话自然、友好地回应。"
 
 
+async def fallback_chain(prompt: str, context: dict[str, Any]) -> str:
+    return context["system_content"]
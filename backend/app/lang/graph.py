@@ -1,12 +1,23 @@
-from typing import Any, Dict, AsyncIterator
-from langchain_openai import ChatOpenAI
+from typing import Any, Dict, AsyncIterator, Optional
 from langchain_core.messages import HumanMessage, SystemMessage
 from ..config import settings
 from ..services.memory import memory_manager
+from ..services.metrics import BACKGROUND_QUEUE_DEPTH
+from ..services.timing import record_stage, stage
+from ..services.tracing import mark_error, tracer
+from .response_cache import ResponseCache, CacheLookup, replay_stream
+from .router import RouteDecision, RouteStats, route_turn
+from .singleflight import SingleFlight, make_key
+from .llm_pool import LLMPool, llm_pool
+from .safety import REFUSAL, SafetyAbort, SafetyStage
+import asyncio
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+BASE_SYSTEM = "你是一个有帮助的AI助手。"
+
 
 class ConversationGraph:
     """
@@ -15,34 +26,52 @@ class ConversationGraph:
     """
 
     def __init__(self) -> None:
-        self.llm = None
+        # 多端点 LLM 池，负责端点选择、故障转移与对冲
+        self.pool: Optional[LLMPool] = None
+        self.temperature = 0.7
+        self.route_stats = RouteStats()
+        # 合并相同的进行中 LLM 请求
+        self.inflight = SingleFlight()
+        # 后台记忆提取任务（保留引用，避免被回收）
+        self._background_tasks = set()
+        BACKGROUND_QUEUE_DEPTH.labels(queue="memory_extraction").set_function(lambda: len(self._background_tasks))
+        self.response_cache: Optional[ResponseCache] = None
+        if settings.RESPONSE_CACHE_ENABLED:
+            self.response_cache = ResponseCache(
+                max_items=settings.RESPONSE_CACHE_MAX_ITEMS,
+                ttl=settings.RESPONSE_CACHE_TTL,
+                semantic_threshold=settings.RESPONSE_CACHE_SEMANTIC_THRESHOLD,
+            )
         self._initialize_llm()
     
     def _initialize_llm(self):
         """延迟初始化 LLM"""
-        if not settings.LLM_API_KEY:
+        if not llm_pool.available:
             print("Warning: LLM_API_KEY 未配置，LLM 功能将不可用")
             return
         
-        try:
-            llm_kwargs = {
-                "model": settings.LLM_MODEL_CHAT,
-                "streaming": True,
-                "temperature": 0.7,
-            }
-            if settings.LLM_API_BASE:
-                llm_kwargs["base_url"] = settings.LLM_API_BASE
-            if settings.LLM_API_KEY:
-                llm_kwargs["api_key"] = settings.LLM_API_KEY
-            
-            self.llm = ChatOpenAI(**llm_kwargs)
-        except Exception as e:
-            print(f"Error initializing LLM: {e}")
-            self.llm = None
+        self.pool = llm_pool
+        logger.info(f"LLM pool ready with {len(llm_pool.endpoints)} endpoint(s), hedging={llm_pool.hedge_enabled}")
+    
+    async def _build_messages(self, user_input: str, session_context: Dict[str, Any]):
+        """构建系统消息并做意图路由，返回 (路由结果, 消息列表, 是否含用户相关记忆)"""
+        system_content = await self._build_system_message(user_input, session_context)
+        personalized = system_content != BASE_SYSTEM
+        
+        with stage("route"):
+            decision = await route_turn(user_input)
+            system_content = await decision.chain(user_input, {"system_content": system_content, **session_context})
+        logger.debug(f"System message length: {len(system_content)}, intent={decision.intent}, model={decision.model}")
+        
+        messages = [
+            SystemMessage(content=system_content),
+            HumanMessage(content=user_input),
+        ]
+        return decision, messages, personalized
 
     async def _build_system_message(self, user_input: str, session_context: Dict[str, Any]) -> str:
         """构建系统消息，包含相关记忆"""
-        base_system = "你是一个有帮助的AI助手。"
+        base_system = BASE_SYSTEM
         
         # 获取用户ID
         session_id = session_context.get("session_id")
@@ -53,25 +82,48 @@ class ConversationGraph:
         user_id = memory_manager.get_user_id(session_id)
         logger.debug(f"Building system message for session_id={session_id}, user_id={user_id}")
         
+        system_content = base_system
+        
+        # 画像：高重要性记忆预编译后直接注入，无需检索
+        profile = None
+        try:
+            profile = await memory_manager.get_memory_profile(user_id)
+            if profile is not None and profile.text:
+                system_content += "\n\n用户画像：\n" + profile.text
+                logger.debug(f"Injected memory profile with {len(profile.texts)} items")
+        except Exception as e:
+            logger.error(f"Error loading memory profile: {e}", exc_info=True)
+        
+        # 长尾记忆仍走向量检索；画像已覆盖全部记忆时直接跳过
+        if profile is not None and not profile.needs_search:
+            logger.debug("Memory profile covers all memories, skipping vector search")
+            return system_content
+        
         # 获取相关记忆
         try:
             memories = await memory_manager.get_relevant_memories(user_input, user_id)
-            logger.debug(f"Retrieved {len(memories)} relevant memories for query: {user_input[:50]}...")
+            logger.debug(f"Retrieved {len(memories)} relevant memories")
+            # 检索结果可能是字符串或 mem0 返回的 dict，统一为文本再与画像去重
+            memories = [mem.get("memory", "") if isinstance(mem, dict) else str(mem) for mem in memories]
+            memories = [mem for mem in memories if mem]
+            if profile is not None:
+                profile_texts = set(profile.texts)
+                memories = [mem for mem in memories if mem not in profile_texts]
             
             if memories:
                 memory_context = "\n\n相关记忆：\n" + "\n".join([f"- {mem}" for mem in memories])
                 logger.debug(f"Added {len(memories)} memories to system message")
-                return base_system + memory_context
+                return system_content + memory_context
         except Exception as e:
             logger.error(f"Error retrieving memories: {e}", exc_info=True)
         
-        return base_system
+        return system_content
 
     async def run_stream(self, user_input: str, session_context: Dict[str, Any]) -> AsyncIterator[str]:
         """流式返回回复"""
-        logger.info(f"run_stream called: user_input={user_input[:100]}..., session_context={session_context}")
+        logger.debug(f"run_stream called: input_length={len(user_input)}, session_id={session_context.get('session_id')}")
         
-        if not self.llm:
+        if not self.pool:
             if not settings.LLM_API_KEY:
                 logger.error("LLM_API_KEY not configured")
                 yield "错误: LLM_API_KEY 未配置，请在 .env 文件中设置 LLM_API_KEY"
@@ -80,49 +132,68 @@ class ConversationGraph:
                 yield "错误: LLM 初始化失败，请检查配置"
             return
         
-        # 构建包含记忆的系统消息
-        system_content = await self._build_system_message(user_input, session_context)
-        logger.debug(f"System message length: {len(system_content)}")
+        # 安全检查与主生成并行：本地规则立即出结果，需要审核模型时在后台进行
+        safety = SafetyStage(user_input) if settings.SAFETY_ENABLED else None
+        if safety is not None and safety.blocked:
+            yield REFUSAL
+            return
         
-        messages = [
-            SystemMessage(content=system_content),
-            HumanMessage(content=user_input),
-        ]
+        # 构建包含记忆的系统消息，并按意图选择提示链与模型
+        decision, messages, personalized = await self._build_messages(user_input, session_context)
         
         full_response = ""
         session_id = session_context.get("session_id")
+        started = time.perf_counter()
+        ttft_ms = None
         try:
-            logger.info(f"Starting LLM stream for session_id={session_id}")
-            async for chunk in self.llm.astream(messages):
-                if chunk.content:
-                    full_response += chunk.content
-                    yield chunk.content
+            with stage("cache"):
+                cache_lookup = await self._lookup_cache(user_input, messages[0].content, decision.model, personalized)
+            if cache_lookup is not None and cache_lookup.answer is not None:
+                logger.info(f"Response cache hit ({cache_lookup.tier}) for session_id={session_id}")
+                stream = replay_stream(cache_lookup.answer, settings.RESPONSE_CACHE_REPLAY_CHUNK)
+                if safety is not None:
+                    stream = safety.guard(stream)
+                async for chunk in stream:
+                    full_response += chunk
+                    yield chunk
+            else:
+                logger.info(f"Starting LLM stream for session_id={session_id}")
+                llm_started = time.perf_counter()
+                stream = self._astream_llm(decision.model, messages)
+                if safety is not None:
+                    stream = safety.guard(stream)
+                async for content in stream:
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - started) * 1000
+                        record_stage("llm_ttft", (time.perf_counter() - llm_started) * 1000)
+                    full_response += content
+                    yield content
+                record_stage("llm", (time.perf_counter() - llm_started) * 1000)
+                self._record_route(decision, started, ttft_ms)
+                self._store_cache(cache_lookup, full_response)
             
             logger.info(f"LLM stream completed, response length: {len(full_response)}")
             
-            # 对话结束后，将对话内容添加到记忆
-            if session_id:
-                user_id = memory_manager.get_user_id(session_id)
-                logger.info(f"Attempting to add conversation memories: session_id={session_id}, user_id={user_id}")
-                # 使用智能提取方法，只保存关键信息
-                await memory_manager.add_conversation_memories(
-                    user_input=user_input,
-                    assistant_reply=full_response,
-                    user_id=user_id,
-                    session_id=session_id
-                )
-                logger.info(f"Memory addition process completed for session_id={session_id}")
+            # 对话结束后在后台提取记忆；本轮已被取消时跳过
+            cancel_token = session_context.get("cancel_token")
+            if cancel_token is not None and cancel_token.cancelled:
+                logger.info(f"Turn cancelled ({cancel_token.reason}), skipping memory extraction")
             else:
-                logger.warning("No session_id available, skipping memory addition")
+                self._remember_later(user_input, full_response, session_id)
+        except SafetyAbort:
+            # 由调用方撤回已发送的内容
+            self._record_route(decision, started, ttft_ms)
+            raise
         except Exception as e:
             logger.error(f"Error in run_stream: {e}", exc_info=True)
+            self._record_route(decision, started, ttft_ms, error=True)
             yield f"错误: LLM调用失败 - {str(e)}"
 
     async def run(self, user_input: str, session_context: Dict[str, Any]) -> str:
         """非流式返回完整回复"""
-        logger.info(f"run called: user_input={user_input[:100]}..., session_context={session_context}")
+        logger.debug(f"run called: input_length={len(user_input)}, session_id={session_context.get('session_id')}")
         
-        if not self.llm:
+        if not self.pool:
             if not settings.LLM_API_KEY:
                 logger.error("LLM_API_KEY not configured")
                 return "错误: LLM_API_KEY 未配置，请在 .env 文件中设置 LLM_API_KEY"
@@ -130,40 +201,116 @@ class ConversationGraph:
                 logger.error("LLM initialization failed")
                 return "错误: LLM 初始化失败，请检查配置"
         
-        # 构建包含记忆的系统消息
-        system_content = await self._build_system_message(user_input, session_context)
-        logger.debug(f"System message length: {len(system_content)}")
+        # 安全检查与主生成并行
+        safety = SafetyStage(user_input) if settings.SAFETY_ENABLED else None
+        if safety is not None and safety.blocked:
+            return REFUSAL
         
-        messages = [
-            SystemMessage(content=system_content),
-            HumanMessage(content=user_input),
-        ]
+        # 构建包含记忆的系统消息，并按意图选择提示链与模型
+        decision, messages, personalized = await self._build_messages(user_input, session_context)
         
         session_id = session_context.get("session_id")
+        started = time.perf_counter()
         try:
-            logger.info(f"Calling LLM invoke for session_id={session_id}")
-            response = await self.llm.ainvoke(messages)
-            reply = response.content
+            with stage("cache"):
+                cache_lookup = await self._lookup_cache(user_input, messages[0].content, decision.model, personalized)
+            if cache_lookup is not None and cache_lookup.answer is not None:
+                logger.info(f"Response cache hit ({cache_lookup.tier}) for session_id={session_id}")
+                reply = cache_lookup.answer
+                cache_lookup = None
+            else:
+                logger.info(f"Calling LLM invoke for session_id={session_id}")
+                with stage("llm"):
+                    reply = await self._invoke_llm(decision.model, messages)
+                self._record_route(decision, started, None)
+            if safety is not None:
+                try:
+                    reply = "".join([chunk async for chunk in safety.guard(replay_stream(reply, len(reply) or 1))])
+                except SafetyAbort:
+                    return REFUSAL
+            self._store_cache(cache_lookup, reply)
             logger.info(f"LLM response received, length: {len(reply)}")
             
-            # 对话结束后，将对话内容添加到记忆
-            if session_id:
-                user_id = memory_manager.get_user_id(session_id)
-                logger.info(f"Attempting to add conversation memories: session_id={session_id}, user_id={user_id}")
-                # 使用智能提取方法，只保存关键信息
-                await memory_manager.add_conversation_memories(
-                    user_input=user_input,
-                    assistant_reply=reply,
-                    user_id=user_id,
-                    session_id=session_id
-                )
-                logger.info(f"Memory addition process completed for session_id={session_id}")
-            else:
-                logger.warning("No session_id available, skipping memory addition")
+            # 对话结束后在后台提取记忆
+            self._remember_later(user_input, reply, session_id)
             
             return reply
         except Exception as e:
             logger.error(f"Error in run: {e}", exc_info=True)
+            self._record_route(decision, started, None, error=True)
             return f"错误: LLM调用失败 - {str(e)}"
 
+    async def _astream_llm(self, model: str, messages: list) -> AsyncIterator[str]:
+        """流式调用 LLM，只产出非空文本；相同请求在进行中时共享同一上游流"""
+        async def upstream() -> AsyncIterator[str]:
+            async for content in self.pool.astream(messages, model, self.temperature):
+                yield content
+        
+        if not settings.LLM_SINGLEFLIGHT_ENABLED:
+            async for content in upstream():
+                yield content
+            return
+        
+        key = make_key(model, messages, {"temperature": self.temperature, "stream": True})
+        async for content in self.inflight.stream(key, upstream):
+            yield content
+
+    async def _invoke_llm(self, model: str, messages: list) -> str:
+        """非流式调用 LLM；相同请求在进行中时共享同一上游调用"""
+        async def upstream() -> str:
+            return await self.pool.ainvoke(messages, model, self.temperature)
+        
+        if not settings.LLM_SINGLEFLIGHT_ENABLED:
+            return await upstream()
+        
+        key = make_key(model, messages, {"temperature": self.temperature, "stream": False})
+        return await self.inflight.call(key, upstream)
+
+    def _record_route(self, decision: RouteDecision, started: float, ttft_ms: Optional[float], error: bool = False) -> None:
+        latency_ms = (time.perf_counter() - started) * 1000
+        # 非流式调用没有首 token 时间，记为总耗时
+        self.route_stats.record(decision, ttft_ms if ttft_ms is not None else latency_ms, latency_ms, error)
 
+    async def _lookup_cache(self, user_input: str, system_content: str, model: str, personalized: bool) -> Optional[CacheLookup]:
+        """查询回复缓存；系统消息中带有用户相关记忆时不走缓存"""
+        if self.response_cache is None or personalized:
+            return None
+        try:
+            return await self.response_cache.lookup(user_input, system_content, model)
+        except Exception as e:
+            logger.warning(f"Response cache lookup failed: {e}")
+            return None
+
+    def _store_cache(self, cache_lookup: Optional[CacheLookup], reply: str) -> None:
+        if cache_lookup is None or not reply:
+            return
+        self.response_cache.store(cache_lookup, reply)
+
+    def _remember_later(self, user_input: str, reply: str, session_id: Optional[str]) -> None:
+        """在后台任务中提取记忆，不阻塞本轮回复结束"""
+        task = asyncio.create_task(self._remember(user_input, reply, session_id))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _remember(self, user_input: str, reply: str, session_id: Optional[str]) -> None:
+        """对话结束后提取关键信息写入记忆"""
+        if not session_id:
+            logger.warning("No session_id available, skipping memory addition")
+            return
+        
+        user_id = memory_manager.get_user_id(session_id)
+        logger.info(f"Attempting to add conversation memories: session_id={session_id}, user_id={user_id}")
+        # 使用智能提取方法，只保存关键信息
+        with tracer.start_as_current_span("memory.extract", attributes={"chat.session_id": session_id, "chat.reply_chars": len(reply)}):
+            try:
+                await memory_manager.add_conversation_memories(
+                    user_input=user_input,
+                    assistant_reply=reply,
+                    user_id=user_id,
+                    session_id=session_id
+                )
+            except Exception as e:
+                logger.error(f"Failed to add conversation memories: {e}", exc_info=True)
+                mark_error(e)
+                return
+        logger.info(f"Memory addition process completed for session_id={session_id}")
@@ -1,13 +1,37 @@
 from typing import Tuple
+import re
 
 
-INTENTS = ("general_qa", "code_helper", "other")
+INTENTS = ("general_qa", "code_helper", "chitchat", "other")
+
+_CODE_KEYWORDS = ["code", "bug", "error", "sql", "api", "python", "报错", "代码", "函数", "编译", "异常"]
+_CHITCHAT_KEYWORDS = ["你好", "您好", "hi", "hello", "hey", "谢谢", "thanks", "早上好", "晚上好", "晚安", "再见", "哈哈", "在吗"]
+# 寒暄中可以跟在问候语后面的词与语气词
+_CHITCHAT_FILLERS = ["there", "all", "啊", "呀", "呢", "哦", "哈", "吧"]
+# 超过该长度的输入不再视为寒暄
+_CHITCHAT_MAX_LEN = 20
+
+
+def _alternation(keywords) -> str:
+    """英文关键词按整词匹配（"api" 不匹配 "capital"），中文关键词按子串匹配"""
+    return "|".join(
+        rf"\b{re.escape(k)}\b" if k.isascii() else re.escape(k)
+        for k in sorted(keywords, key=len, reverse=True)
+    )
+
+
+_CODE_RE = re.compile(_alternation(_CODE_KEYWORDS))
+# 整条消息只由问候语、语气词和标点组成才算寒暄（"which is faster?" 里的 "hi" 不算）
+_CHITCHAT_RE = re.compile(
+    rf"(?:(?:{_alternation(_CHITCHAT_KEYWORDS)})[\W_]*)+(?:(?:{_alternation(_CHITCHAT_FILLERS)})[\W_]*)*"
+)
 
 
 async def classify_intent(text: str) -> Tuple[str, float]:
-    """占位意图分类，返回 (intent, confidence)。"""
-    if any(k in text.lower() for k in ["code", "bug", "error", "sql", "api"]):
+    """基于规则的意图分类，返回 (intent, confidence)。"""
+    lowered = text.lower().strip()
+    if "```" in text or _CODE_RE.search(lowered):
         return "code_helper", 0.7
+    if len(lowered) <= _CHITCHAT_MAX_LEN and _CHITCHAT_RE.fullmatch(lowered):
+        return "chitchat", 0.7
     return "general_qa", 0.6
-
-
@@ -0,0 +1,410 @@
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import time
+
+from opentelemetry import trace
+from opentelemetry.trace import Status, StatusCode
+
+from ..config import settings
+from ..services.metrics import LLM_CALL_SECONDS, LLM_TOKENS_PER_SEC, LLM_TTFT, model_label
+from ..services.tracing import tracer
+from .scheduler import Priority, llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class LLMEndpoint:
+    """一个 OpenAI 兼容端点及其健康状态（EWMA 延迟、错误率、熔断）"""
+
+    def __init__(self, name: str, base_url: str, api_key: str, alpha: float = 0.2):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.alpha = alpha
+        self.ttft_ms: Optional[float] = None
+        self.latency_ms: Optional[float] = None
+        self.error_rate = 0.0
+        self.consecutive_errors = 0
+        self.open_until = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self._ttft_samples: Deque[float] = deque(maxlen=256)
+        self._llms: Dict[Tuple[str, float], Any] = {}
+
+    def llm(self, model: str, temperature: float):
+        key = (model, temperature)
+        llm = self._llms.get(key)
+        if llm is None:
+            # langchain_openai 导入较慢，首次创建客户端时才导入
+            from langchain_openai import ChatOpenAI
+
+            llm_kwargs = {
+                "model": model,
+                "streaming": True,
+                "temperature": temperature,
+                # 由连接池负责故障转移，关闭 SDK 自身的重试
+                "max_retries": 0,
+            }
+            if self.base_url:
+                llm_kwargs["base_url"] = self.base_url
+            if self.api_key:
+                llm_kwargs["api_key"] = self.api_key
+            llm = self._llms[key] = ChatOpenAI(**llm_kwargs)
+        return llm
+
+    def _ewma(self, current: Optional[float], value: float) -> float:
+        return value if current is None else current + self.alpha * (value - current)
+
+    @property
+    def is_open(self) -> bool:
+        return time.monotonic() < self.open_until
+
+    def score(self) -> float:
+        """越小越优先：首 token 延迟 × 错误率惩罚 × 并发惩罚；未有样本的端点优先探测"""
+        base = self.ttft_ms if self.ttft_ms is not None else 0.0
+        return (base + 1.0) * (1 + 4 * self.error_rate) * (1 + 0.1 * self.in_flight)
+
+    def record_ttft(self, ttft_ms: float) -> None:
+        self.ttft_ms = self._ewma(self.ttft_ms, ttft_ms)
+        self._ttft_samples.append(ttft_ms)
+
+    def record_success(self, latency_ms: float) -> None:
+        self.requests += 1
+        self.latency_ms = self._ewma(self.latency_ms, latency_ms)
+        self.error_rate = self._ewma(self.error_rate, 0.0)
+        self.consecutive_errors = 0
+
+    def record_error(self, error: BaseException) -> None:
+        self.requests += 1
+        self.error_rate = self._ewma(self.error_rate, 1.0)
+        self.consecutive_errors += 1
+        if self.consecutive_errors >= settings.LLM_BREAKER_THRESHOLD:
+            self.open_until = time.monotonic() + settings.LLM_BREAKER_COOLDOWN
+            logger.warning(f"LLM endpoint {self.name} opened circuit after {self.consecutive_errors} errors: {error}")
+        else:
+            logger.warning(f"LLM endpoint {self.name} error: {error}")
+
+    def ttft_percentile(self, pct: float) -> Optional[float]:
+        if len(self._ttft_samples) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._ttft_samples)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "ttft_ms": round(self.ttft_ms, 1) if self.ttft_ms is not None else None,
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "circuit_open": self.is_open,
+        }
+
+
+class _Attempt:
+    """对某个端点的一次流式尝试，first 为拉取首块的任务"""
+
+    def __init__(self, endpoint: LLMEndpoint, stream: AsyncIterator[str]):
+        self.endpoint = endpoint
+        self.stream = stream
+        self.started = time.perf_counter()
+        self.first = asyncio.ensure_future(stream.__anext__())
+
+    async def cancel(self) -> None:
+        if not self.first.done():
+            self.first.cancel()
+            try:
+                await self.first
+            except BaseException:
+                pass
+        await self.stream.aclose()
+
+
+class LLMPool:
+    """
+    多端点 LLM 连接池：按 EWMA 首 token 延迟与错误率选择端点，出错时故障转移；
+    开启对冲后，若首 token 超过该端点历史 TTFT 的指定分位仍未到达，则向下一个端点
+    发起第二个请求，先出首 token 者胜出，另一个被取消。
+    """
+
+    def __init__(self, endpoints: List[LLMEndpoint], hedge_enabled: bool = False, hedge_percentile: float = 95):
+        self.endpoints = endpoints
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.stats = {"hedged": 0, "hedge_wins": 0, "failovers": 0}
+
+    @classmethod
+    def from_settings(cls) -> "LLMPool":
+        return cls(
+            parse_endpoints(settings.LLM_ENDPOINTS),
+            hedge_enabled=settings.LLM_HEDGE_ENABLED,
+            hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+        )
+
+    @property
+    def available(self) -> bool:
+        return bool(self.endpoints)
+
+    def ranked(self) -> List[LLMEndpoint]:
+        """按得分排序；熔断中的端点排在最后（全部熔断时仍会尝试）"""
+        return sorted(self.endpoints, key=lambda ep: (ep.is_open, ep.score()))
+
+    def _hedge_deadline(self, endpoint: LLMEndpoint) -> float:
+        p = endpoint.ttft_percentile(self.hedge_percentile)
+        deadline = p if p is not None else settings.LLM_HEDGE_MAX_MS
+        return min(max(deadline, settings.LLM_HEDGE_MIN_MS), settings.LLM_HEDGE_MAX_MS) / 1000
+
+    @staticmethod
+    async def _raw_stream(endpoint: LLMEndpoint, messages: list, model: str, temperature: float) -> AsyncIterator[str]:
+        endpoint.in_flight += 1
+        try:
+            async for chunk in endpoint.llm(model, temperature).astream(messages):
+                if chunk.content:
+                    yield chunk.content
+        finally:
+            endpoint.in_flight -= 1
+
+    async def astream(
+        self, messages: list, model: str, temperature: float = 0.7, priority: Priority = Priority.INTERACTIVE
+    ) -> AsyncIterator[str]:
+        """流式调用，按优先级在调度器中占用一个名额直到流结束"""
+        label = model_label(model)
+        requested = time.perf_counter()
+        # 生成器跨 yield 不能切换当前 span，这里只创建、不激活
+        span = tracer.start_span("llm.stream", attributes={
+            "gen_ai.request.model": model,
+            "llm.priority": priority.name.lower(),
+            "llm.prompt_messages": len(messages),
+        })
+        first_at: Optional[float] = None
+        chunks = 0
+        outcome = "error"
+        try:
+            async with llm_scheduler.slot(priority):
+                started = time.perf_counter()
+                span.add_event("scheduler.acquired")
+                try:
+                    async for chunk in self._astream(messages, model, temperature):
+                        if first_at is None:
+                            first_at = time.perf_counter()
+                            LLM_TTFT.labels(model=label).observe(first_at - requested)
+                            span.add_event("first_token")
+                            span.set_attribute("llm.ttft_ms", round((first_at - requested) * 1000, 1))
+                        chunks += 1
+                        yield chunk
+                    outcome = "ok"
+                except (asyncio.CancelledError, GeneratorExit):
+                    outcome = "cancelled"
+                    raise
+                finally:
+                    finished = time.perf_counter()
+                    LLM_CALL_SECONDS.labels(model=label, kind="stream", outcome=outcome).observe(finished - started)
+                    if outcome == "ok" and chunks > 1 and finished > first_at:
+                        LLM_TOKENS_PER_SEC.labels(model=label).observe((chunks - 1) / (finished - first_at))
+        except Exception as e:
+            span.record_exception(e)
+            span.set_status(Status(StatusCode.ERROR, str(e)[:200]))
+            raise
+        finally:
+            # 流式响应不带 usage，按块数近似输出 token 数（OpenAI 兼容接口通常一块一个 token）
+            span.set_attribute("llm.output_chunks", chunks)
+            span.set_attribute("gen_ai.usage.output_tokens", chunks)
+            span.set_attribute("llm.outcome", outcome)
+            span.end()
+
+    async def _astream(self, messages: list, model: str, temperature: float) -> AsyncIterator[str]:
+        """只产出非空文本。首 token 之前的错误会转移到下一个端点，之后的错误直接抛出"""
+        candidates = self.ranked()
+        if not candidates:
+            raise RuntimeError("No LLM endpoint configured")
+
+        pending: List[_Attempt] = []
+        next_index = 0
+        hedged = False
+        last_error: Optional[BaseException] = None
+        winner: Optional[_Attempt] = None
+        first_chunk: Optional[str] = None
+
+        def launch() -> None:
+            nonlocal next_index
+            endpoint = candidates[next_index]
+            next_index += 1
+            pending.append(_Attempt(endpoint, self._raw_stream(endpoint, messages, model, temperature)))
+
+        try:
+            launch()
+            primary = pending[0]
+            while winner is None:
+                if not pending:
+                    if next_index >= len(candidates):
+                        raise last_error or RuntimeError("All LLM endpoints failed")
+                    self.stats["failovers"] += 1
+                    launch()
+                    continue
+
+                timeout = None
+                if self.hedge_enabled and not hedged and len(pending) == 1 and next_index < len(candidates):
+                    elapsed = time.perf_counter() - pending[0].started
+                    timeout = max(self._hedge_deadline(pending[0].endpoint) - elapsed, 0)
+
+                done, _ = await asyncio.wait([a.first for a in pending], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    self.stats["hedged"] += 1
+                    logger.info(f"First token from {pending[0].endpoint.name} is late, hedging to {candidates[next_index].name}")
+                    launch()
+                    continue
+
+                for attempt in list(pending):
+                    if attempt.first not in done:
+                        continue
+                    try:
+                        first_chunk = attempt.first.result()
+                    except StopAsyncIteration:
+                        first_chunk = None
+                    except Exception as e:
+                        attempt.endpoint.record_error(e)
+                        pending.remove(attempt)
+                        await attempt.stream.aclose()
+                        last_error = e
+                        continue
+                    winner = attempt
+                    break
+        finally:
+            for attempt in pending:
+                if attempt is not winner:
+                    await attempt.cancel()
+
+        if hedged and winner is not primary:
+            self.stats["hedge_wins"] += 1
+        winner.endpoint.record_ttft((time.perf_counter() - winner.started) * 1000)
+
+        try:
+            if first_chunk is not None:
+                yield first_chunk
+                async for chunk in winner.stream:
+                    yield chunk
+            winner.endpoint.record_success((time.perf_counter() - winner.started) * 1000)
+        except Exception as e:
+            winner.endpoint.record_error(e)
+            raise
+        finally:
+            await winner.stream.aclose()
+
+    async def ainvoke(
+        self, messages: list, model: str, temperature: float = 0.7, priority: Priority = Priority.INTERACTIVE
+    ) -> str:
+        """非流式调用，按优先级排队"""
+        with tracer.start_as_current_span("llm.invoke", attributes={
+            "gen_ai.request.model": model,
+            "llm.priority": priority.name.lower(),
+            "llm.prompt_messages": len(messages),
+        }):
+            async with llm_scheduler.slot(priority):
+                started = time.perf_counter()
+                outcome = "error"
+                try:
+                    result = await self._ainvoke(messages, model, temperature)
+                    outcome = "ok"
+                    return result
+                except asyncio.CancelledError:
+                    outcome = "cancelled"
+                    raise
+                finally:
+                    LLM_CALL_SECONDS.labels(model=model_label(model), kind="invoke", outcome=outcome).observe(time.perf_counter() - started)
+
+    async def _ainvoke(self, messages: list, model: str, temperature: float) -> str:
+        """出错时依次转移到下一个端点"""
+        last_error: Optional[BaseException] = None
+        for index, endpoint in enumerate(self.ranked()):
+            if index:
+                self.stats["failovers"] += 1
+            started = time.perf_counter()
+            endpoint.in_flight += 1
+            try:
+                response = await endpoint.llm(model, temperature).ainvoke(messages)
+            except Exception as e:
+                endpoint.record_error(e)
+                last_error = e
+                continue
+            finally:
+                endpoint.in_flight -= 1
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            endpoint.record_ttft(elapsed_ms)
+            endpoint.record_success(elapsed_ms)
+            usage = getattr(response, "usage_metadata", None)
+            if usage:
+                trace.get_current_span().set_attributes({
+                    "gen_ai.usage.input_tokens": usage.get("input_tokens", 0),
+                    "gen_ai.usage.output_tokens": usage.get("output_tokens", 0),
+                    "llm.endpoint": endpoint.name,
+                })
+            return response.content
+        raise last_error or RuntimeError("No LLM endpoint configured")
+
+    async def warm_up(self, model: str, temperature: float) -> bool:
+        """
+        启动预热：在线程池中创建各端点的客户端（含 langchain_openai 的导入），
+        再各请求一次 /models，让 HTTP 连接池提前完成 TCP/TLS 握手。返回是否至少一个端点可达。
+        """
+        if not self.available:
+            return False
+
+        async def one(endpoint: LLMEndpoint) -> bool:
+            llm = await asyncio.to_thread(endpoint.llm, model, temperature)
+            client = getattr(llm, "root_async_client", None)
+            if client is None:
+                return False
+            try:
+                await client.models.list()
+                return True
+            except Exception as e:
+                logger.warning(f"LLM endpoint {endpoint.name} warm-up request failed: {e}")
+                return False
+
+        return any(await asyncio.gather(*(one(endpoint) for endpoint in self.endpoints)))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "endpoints": [ep.snapshot() for ep in self.ranked()],
+            "scheduler": llm_scheduler.snapshot(),
+            **self.stats,
+        }
+
+
+def parse_endpoints(raw: str) -> List[LLMEndpoint]:
+    """
+    解析 LLM_ENDPOINTS：JSON 数组（[{"name", "base_url", "api_key"}]）或逗号分隔的
+    "base_url|api_key" 列表；未写 api_key 时使用 LLM_API_KEY。为空时使用单个 LLM_API_BASE。
+    """
+    entries: List[Dict[str, str]] = []
+    raw = raw.strip()
+    if raw.startswith("["):
+        entries = json.loads(raw)
+    elif raw:
+        for item in raw.split(","):
+            base_url, _, api_key = item.strip().partition("|")
+            entries.append({"base_url": base_url, "api_key": api_key})
+    elif settings.LLM_API_KEY:
+        entries.append({"name": "default", "base_url": settings.LLM_API_BASE, "api_key": settings.LLM_API_KEY})
+
+    endpoints = []
+    for index, entry in enumerate(entries):
+        api_key = entry.get("api_key") or settings.LLM_API_KEY
+        if not api_key:
+            continue
+        endpoints.append(LLMEndpoint(
+            name=entry.get("name") or f"endpoint{index}",
+            base_url=entry.get("base_url", ""),
+            api_key=api_key,
+        ))
+    return endpoints
+
+
+# 全局 LLM 连接池
+llm_pool = LLMPool.from_settings()
@@ -0,0 +1,117 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, AsyncIterator
+import asyncio
+import hashlib
+import logging
+import re
+import time
+
+import numpy as np
+
+from ..services.embedding import embedding_client
+
+logger = logging.getLogger(__name__)
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?？!！。.,，~～]+$")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """归一化提问：小写、合并空白、去掉结尾标点"""
+    text = _WHITESPACE_RE.sub(" ", prompt.strip().lower())
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+@dataclass
+class _Entry:
+    answer: str
+    context: str
+    expires_at: float
+    vector: Optional[np.ndarray] = None
+
+
+@dataclass
+class CacheLookup:
+    """一次查询的结果；未命中时保留 key 与向量，供写入时复用"""
+    key: str
+    context: str
+    answer: Optional[str] = None
+    tier: Optional[str] = None
+    vector: Optional[np.ndarray] = None
+
+
+class ResponseCache:
+    """
+    回复缓存，两级：
+    - exact：归一化提问 + 系统上下文哈希 + 模型 精确匹配
+    - semantic：同一上下文下，提问向量相似度超过阈值时复用回复（阈值为 0 时关闭）
+    按 TTL 过期、按 LRU 淘汰。
+    """
+
+    def __init__(self, max_items: int = 1000, ttl: float = 3600, semantic_threshold: float = 0.0):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    @staticmethod
+    def _context(system_content: str, model: str) -> str:
+        return hashlib.sha256(f"{model}\0{system_content}".encode("utf-8")).hexdigest()
+
+    async def lookup(self, prompt: str, system_content: str, model: str) -> CacheLookup:
+        context = self._context(system_content, model)
+        normalized = normalize_prompt(prompt)
+        key = hashlib.sha256(f"{context}\0{normalized}".encode("utf-8")).hexdigest()
+        result = CacheLookup(key=key, context=context)
+
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at > now:
+                self._entries.move_to_end(key)
+                result.answer, result.tier = entry.answer, "exact"
+                return result
+            del self._entries[key]
+
+        if self.semantic_threshold <= 0 or not embedding_client.available:
+            return result
+
+        try:
+            result.vector = (await embedding_client.embed([normalized]))[0]
+        except Exception as e:
+            logger.warning(f"Response cache embedding failed, skipping semantic tier: {e}")
+            return result
+
+        best_key, best_score = None, self.semantic_threshold
+        for candidate_key, candidate in self._entries.items():
+            if candidate.context != context or candidate.vector is None or candidate.expires_at <= now:
+                continue
+            score = float(candidate.vector @ result.vector)
+            if score >= best_score:
+                best_key, best_score = candidate_key, score
+        if best_key is not None:
+            self._entries.move_to_end(best_key)
+            result.answer, result.tier = self._entries[best_key].answer, "semantic"
+            logger.debug(f"Semantic cache hit with score={best_score:.3f}")
+        return result
+
+    def store(self, lookup: CacheLookup, answer: str) -> None:
+        self._entries[lookup.key] = _Entry(
+            answer=answer,
+            context=lookup.context,
+            expires_at=time.monotonic() + self.ttl,
+            vector=lookup.vector,
+        )
+        self._entries.move_to_end(lookup.key)
+        while len(self._entries) > self.max_items:
+            self._entries.popitem(last=False)
+
+
+async def replay_stream(answer: str, chunk_size: int = 8) -> AsyncIterator[str]:
+    """把缓存的完整回复切成小块逐个产出，SSE 客户端看到的仍是 token 流"""
+    for start in range(0, len(answer), chunk_size):
+        yield answer[start:start + chunk_size]
+        # 让出事件循环，保持与真实流一致的调度行为
+        await asyncio.sleep(0)
@@ -0,0 +1,96 @@
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict
+import logging
+
+from ..config import settings
+from .chains import general_qa_chain, code_helper_chain, chitchat_chain, fallback_chain
+from .intent import classify_intent
+
+logger = logging.getLogger(__name__)
+
+
+Chain = Callable[[str, Dict[str, Any]], Awaitable[str]]
+
+# intent -> (提示链, 模型档位)
+_ROUTES: Dict[str, tuple] = {
+    "chitchat": (chitchat_chain, "fast"),
+    "code_helper": (code_helper_chain, "code"),
+    "general_qa": (general_qa_chain, "default"),
+}
+
+
+def tier_model(tier: str) -> str:
+    """档位对应的模型，未配置时回退到 LLM_MODEL_CHAT"""
+    if tier == "fast":
+        return settings.LLM_MODEL_FAST or settings.LLM_MODEL_CHAT
+    if tier == "code":
+        return settings.LLM_MODEL_CODE or settings.LLM_MODEL_CHAT
+    return settings.LLM_MODEL_CHAT
+
+
+@dataclass
+class RouteDecision:
+    intent: str
+    confidence: float
+    tier: str
+    model: str
+    chain: Chain
+
+
+async def route_turn(user_input: str) -> RouteDecision:
+    """对本轮输入做意图分类，选出提示链与模型档位"""
+    if not settings.LLM_ROUTING_ENABLED:
+        return RouteDecision("other", 0.0, "default", settings.LLM_MODEL_CHAT, fallback_chain)
+
+    intent, confidence = await classify_intent(user_input)
+    chain, tier = _ROUTES.get(intent, (fallback_chain, "default"))
+    if confidence < settings.LLM_ROUTING_MIN_CONFIDENCE:
+        chain, tier = fallback_chain, "default"
+    return RouteDecision(intent, confidence, tier, tier_model(tier), chain)
+
+
+@dataclass
+class TierStats:
+    count: int = 0
+    errors: int = 0
+    ttft_ms: float = 0.0
+    latency_ms: float = 0.0
+
+    def record(self, ttft_ms: float, latency_ms: float, error: bool, alpha: float = 0.2) -> None:
+        self.count += 1
+        self.errors += int(error)
+        if self.count == 1:
+            self.ttft_ms, self.latency_ms = ttft_ms, latency_ms
+        else:
+            self.ttft_ms += alpha * (ttft_ms - self.ttft_ms)
+            self.latency_ms += alpha * (latency_ms - self.latency_ms)
+
+
+@dataclass
+class RouteStats:
+    """按档位统计路由次数与延迟（EWMA）"""
+    tiers: Dict[str, TierStats] = field(default_factory=dict)
+    intents: Dict[str, int] = field(default_factory=dict)
+
+    def record(self, decision: RouteDecision, ttft_ms: float, latency_ms: float, error: bool = False) -> None:
+        self.intents[decision.intent] = self.intents.get(decision.intent, 0) + 1
+        self.tiers.setdefault(decision.tier, TierStats()).record(ttft_ms, latency_ms, error)
+        logger.info(
+            f"Turn routed: intent={decision.intent}, confidence={decision.confidence:.2f}, tier={decision.tier}, "
+            f"model={decision.model}, ttft_ms={ttft_ms:.0f}, latency_ms={latency_ms:.0f}, error={error}"
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "intents": dict(self.intents),
+            "tiers": {
+                tier: {
+                    "model": tier_model(tier),
+                    "count": s.count,
+                    "errors": s.errors,
+                    "ttft_ms": round(s.ttft_ms, 1),
+                    "latency_ms": round(s.latency_ms, 1),
+                }
+                for tier, s in self.tiers.items()
+            },
+        }
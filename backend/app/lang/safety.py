@@ -1,8 +1,239 @@
-from typing import Tuple
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional, Pattern, Tuple
+import asyncio
+import logging
+import re
+import time
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from ..config import settings
+from ..services.metrics import SAFETY_STAGE_SECONDS, SAFETY_VERDICTS
+from .llm_pool import llm_pool
+from .scheduler import Priority
+
+logger = logging.getLogger(__name__)
+
+ALLOW = "allow"
+BLOCK = "block"
+UNCERTAIN = "uncertain"
+
+REFUSAL = "抱歉，这个问题涉及不安全的内容，我无法回答。"
+
+
+@dataclass
+class Verdict:
+    action: str
+    reason: Optional[str] = None
+    source: str = "rules"
+
+
+class SafetyAbort(Exception):
+    """安全检查要求中止本轮输出"""
+
+    def __init__(self, verdict: Verdict):
+        super().__init__(verdict.reason or "blocked by safety policy")
+        self.verdict = verdict
+
+
+def _compile(patterns: List[Tuple[str, str]]) -> List[Tuple[Pattern, str]]:
+    return [(re.compile(pattern, re.I), reason) for pattern, reason in patterns]
+
+
+# 明确违规：直接拦截
+_BLOCK_RULES = _compile([
+    (r"(制作|制造|自制|合成).{0,6}(炸弹|炸药|爆炸物|毒品|冰毒|枪支)", "weapons_or_drugs_manufacturing"),
+    (r"how\s+to\s+(make|build|synthesi[sz]e)\s+(a\s+)?(bomb|explosive|meth|nerve\s+agent)", "weapons_or_drugs_manufacturing"),
+    (r"(儿童|未成年|幼女|幼童).{0,6}(色情|性交|裸照)", "sexual_minors"),
+    (r"(child|minor)s?\s+(porn|sexual)", "sexual_minors"),
+])
+
+# 可能相关：本地无法判定，交给审核模型
+_UNCERTAIN_RULES = _compile([
+    (r"炸弹|炸药|爆炸|枪支|弹药|毒品|自杀|自残|杀人|黑客攻击|病毒木马", "sensitive_topic"),
+    (r"\b(bomb|explosive|suicide|self[-\s]?harm|kill|weapon|malware|ransomware)\b", "sensitive_topic"),
+])
+
+# 输出中的个人敏感信息：打码
+_PII_RULES = _compile([
+    (r"(?<!\d)\d{17}[\dXx](?![\dXx])", "id_card"),
+    (r"(?<!\d)1[3-9]\d{9}(?!\d)", "phone"),
+])
+# 块末尾可能是未写完的敏感信息时暂缓发送：最多 18 位数字，或 17 位数字加校验位 X；
+# 刚好写完的身份证号也要等到下一块确认后面没有数字。普通英文单词结尾的 x 不会被暂缓
+_PII_HOLD_RE = re.compile(r"(?:\d{1,18}|\d{17}[Xx])$")
+_OUTPUT_OVERLAP = 32
+# 输出命中拦截规则时送审的上下文长度（回复末尾的字符数）
+_OUTPUT_MODERATION_CHARS = 2000
+
+_INPUT_MODERATION_PROMPT = ("你是内容安全审核员。判断用户消息是否在寻求危害他人或自身、违法犯罪或色情未成年人等不安全内容。"
+                            "只回答 SAFE 或 UNSAFE: <原因>。")
+_OUTPUT_MODERATION_PROMPT = ("你是内容安全审核员。判断助手回复是否给出了危害他人或自身、违法犯罪的具体方法，或涉及色情未成年人的内容；"
+                             "拒绝回答、劝阻、安全提示与常识性介绍都属于安全。只回答 SAFE 或 UNSAFE: <原因>。")
+
+
+def check_rules(text: str) -> Verdict:
+    """本地规则分类：block / uncertain / allow"""
+    started = time.perf_counter()
+    try:
+        for pattern, reason in _BLOCK_RULES:
+            if pattern.search(text):
+                return Verdict(BLOCK, reason)
+        for pattern, reason in _UNCERTAIN_RULES:
+            if pattern.search(text):
+                return Verdict(UNCERTAIN, reason)
+        return Verdict(ALLOW)
+    finally:
+        SAFETY_STAGE_SECONDS.labels(stage="rules").observe(time.perf_counter() - started)
+
+
+def redact(text: str) -> str:
+    if not settings.SAFETY_REDACT_PII:
+        return text
+    for pattern, _ in _PII_RULES:
+        text = pattern.sub(lambda m: "*" * len(m.group(0)), text)
+    return text
+
+
+async def moderate_with_llm(text: str, output: bool = False) -> Verdict:
+    """调用 LLM_MODEL_MODERATION 审核用户消息（output=True 时审核助手回复）；未配置时放行"""
+    if not settings.LLM_MODEL_MODERATION or not llm_pool.available:
+        return Verdict(ALLOW, "moderation_unavailable", source="rules")
+    source = "output_llm" if output else "llm"
+    started = time.perf_counter()
+    try:
+        response = await llm_pool.ainvoke(
+            [
+                SystemMessage(content=_OUTPUT_MODERATION_PROMPT if output else _INPUT_MODERATION_PROMPT),
+                HumanMessage(content=text[:2000]),
+            ],
+            settings.LLM_MODEL_MODERATION,
+            temperature=0,
+            priority=Priority.INTERACTIVE,
+        )
+    finally:
+        SAFETY_STAGE_SECONDS.labels(stage="moderation_llm").observe(time.perf_counter() - started)
+    answer = response.strip()
+    if answer.upper().startswith("UNSAFE"):
+        return Verdict(BLOCK, answer.partition(":")[2].strip() or "moderation_model", source=source)
+    return Verdict(ALLOW, source=source)
 
 
 async def safety_check(text: str) -> Tuple[bool, str | None]:
-    """占位：返回 (是否通过, 拒绝原因)。"""
-    return True, None
+    """返回 (是否通过, 拒绝原因)：先走本地规则，无法判定时再调用审核模型"""
+    verdict = check_rules(text)
+    if verdict.action == UNCERTAIN:
+        verdict = await moderate_with_llm(text)
+    SAFETY_VERDICTS.labels(action=verdict.action, source=verdict.source).inc()
+    return verdict.action != BLOCK, verdict.reason if verdict.action == BLOCK else None
+
+
+class SafetyStage:
+    """
+    与主生成并行的安全阶段：
+    - 输入先过本地规则（微秒级）；明确违规时不调用主模型，无法判定时在后台调用审核模型，
+      主生成照常进行，审核结果为违规时在下一个块到达前中止输出；
+    - 输出逐块检查拦截规则，并对手机号、身份证号打码（块尾可能是未写完的号码时暂缓这几个字符）；
+      输出命中规则不直接中止（拒答本身也会提到“制作炸弹”），而是把回复送审，审核判定违规才中止；
+    - 输出结束时若审核仍未返回，最多再等 SAFETY_MODERATION_TIMEOUT 秒，超时放行。
+    正常路径上不增加任何网络往返。
+    """
+
+    def __init__(self, user_input: str):
+        self.user_input = user_input
+        self.verdict = check_rules(user_input)
+        # 进行中的审核：输入审核最多一个，输出审核同一时间最多一个
+        self._moderations: List[asyncio.Task] = []
+        self._output_moderation: Optional[asyncio.Task] = None
+        self._output = ""
+        if self.verdict.action == UNCERTAIN:
+            self._moderations.append(asyncio.create_task(moderate_with_llm(user_input)))
+        elif self.verdict.action == BLOCK:
+            self._record(self.verdict)
+
+    @property
+    def blocked(self) -> bool:
+        return self.verdict.action == BLOCK
+
+    @staticmethod
+    def _record(verdict: Verdict) -> None:
+        SAFETY_VERDICTS.labels(action=verdict.action, source=verdict.source).inc()
+        if verdict.action == BLOCK:
+            logger.warning(f"Safety stage blocked turn ({verdict.source}): {verdict.reason}")
+
+    def _check_moderation(self) -> None:
+        for task in [task for task in self._moderations if task.done()]:
+            self._moderations.remove(task)
+            try:
+                verdict = task.result()
+            except Exception as e:
+                logger.warning(f"Moderation call failed, allowing: {e}")
+                verdict = Verdict(ALLOW, "moderation_error")
+            self._record(verdict)
+            if verdict.action == BLOCK:
+                self.verdict = verdict
+                raise SafetyAbort(verdict)
+
+    async def _finish_moderation(self) -> None:
+        if not self._moderations:
+            return
+        _, pending = await asyncio.wait(self._moderations, timeout=settings.SAFETY_MODERATION_TIMEOUT)
+        if pending:
+            logger.warning(f"{len(pending)} moderation call(s) still pending at end of stream, allowing")
+            for task in pending:
+                task.cancel()
+                self._moderations.remove(task)
+        self._check_moderation()
 
+    def _check_output(self, tail: str, chunk: str) -> None:
+        """
+        输出命中拦截规则时把回复末尾送审（同一时间最多一个），由审核结果决定是否中止。
+        tail 是上一块留下的重叠部分，只有结束在新块内的匹配才触发，已送审的匹配不会重复送审。
+        """
+        started = time.perf_counter()
+        try:
+            if self._output_moderation is not None and not self._output_moderation.done():
+                return
+            window = tail + chunk
+            for pattern, reason in _BLOCK_RULES:
+                if any(match.end() > len(tail) for match in pattern.finditer(window)):
+                    logger.info(f"Output matched safety rule {reason}, escalating to moderation")
+                    self._output_moderation = asyncio.create_task(
+                        moderate_with_llm(self._output[-_OUTPUT_MODERATION_CHARS:], output=True)
+                    )
+                    self._moderations.append(self._output_moderation)
+                    return
+        finally:
+            SAFETY_STAGE_SECONDS.labels(stage="output_rules").observe(time.perf_counter() - started)
 
+    async def guard(self, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        """包装主生成的输出流；违规时抛出 SafetyAbort（上游流随之关闭）"""
+        if self.blocked:
+            raise SafetyAbort(self.verdict)
+        pending = ""
+        tail = ""
+        try:
+            async for chunk in chunks:
+                self._check_moderation()
+                self._output = (self._output + chunk)[-_OUTPUT_MODERATION_CHARS:]
+                self._check_output(tail, chunk)
+                tail = (tail + chunk)[-_OUTPUT_OVERLAP:]
+                text = pending + chunk
+                hold = _PII_HOLD_RE.search(text) if settings.SAFETY_REDACT_PII else None
+                if hold:
+                    text, pending = text[:hold.start()], text[hold.start():]
+                else:
+                    pending = ""
+                if text:
+                    yield redact(text)
+            await self._finish_moderation()
+            if pending:
+                yield redact(pending)
+        finally:
+            for task in self._moderations:
+                if not task.done():
+                    task.cancel()
+            # 中止时立即关闭上游流，连带取消 LLM 请求
+            aclose = getattr(chunks, "aclose", None)
+            if aclose is not None:
+                await aclose()
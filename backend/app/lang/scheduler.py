@@ -0,0 +1,172 @@
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import AsyncIterator, Dict, List
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from ..config import settings
+from ..services.metrics import LLM_SCHED_ACTIVE, LLM_SCHED_PREEMPTED, LLM_SCHED_QUEUE_DEPTH, LLM_SCHED_WAIT
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """LLM 调用优先级：数值越小越优先"""
+    INTERACTIVE = 0  # 用户正在等待的对话回复
+    NEARLINE = 1     # 用户很快会看到的结果，如会话标题
+    BACKGROUND = 2   # 记忆提取等后台任务
+
+
+class LLMCallPreempted(Exception):
+    """排队中的低优先级调用多次被抢占后放弃"""
+
+
+class _Preempted(Exception):
+    pass
+
+
+class _Waiter:
+    def __init__(self, priority: Priority, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMScheduler:
+    """
+    LLM 调用的中心调度器：总并发上限 + 各优先级的并发预算。
+    - 按优先级出队，有放不进去的交互请求排队时不会放行近线/后台请求；
+    - 后台请求只能使用总容量减去预留量的部分，为交互请求留出余量；
+    - 交互请求排队数达到阈值时，排队中的后台请求被抢占（退避后重新排队，多次被抢占则放弃）。
+    """
+
+    def __init__(self, total_limit: int, class_limits: Dict[Priority, int], background_reserve: int, preempt_depth: int):
+        self.total_limit = total_limit
+        self.class_limits = class_limits
+        self.background_reserve = background_reserve
+        self.preempt_depth = preempt_depth
+        self.active: Dict[Priority, int] = {p: 0 for p in Priority}
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+
+    @property
+    def total_active(self) -> int:
+        return sum(self.active.values())
+
+    def _queued(self, priority: Priority) -> int:
+        return sum(1 for w in self._queue if w.priority == priority and not w.future.done())
+
+    def _can_run(self, priority: Priority) -> bool:
+        if self.total_active >= self.total_limit:
+            return False
+        if self.active[priority] >= self.class_limits[priority]:
+            return False
+        if priority == Priority.BACKGROUND and self.total_active >= self.total_limit - self.background_reserve:
+            return False
+        return True
+
+    def _update_gauges(self) -> None:
+        for p in Priority:
+            LLM_SCHED_QUEUE_DEPTH.labels(priority=p.name.lower()).set(self._queued(p))
+            LLM_SCHED_ACTIVE.labels(priority=p.name.lower()).set(self.active[p])
+
+    def _start(self, priority: Priority) -> None:
+        self.active[priority] += 1
+
+    def _dispatch(self) -> None:
+        while self._queue and self._queue[0].future.done():
+            heapq.heappop(self._queue)
+        for waiter in sorted(self._queue):
+            if waiter.future.done():
+                continue
+            if self._can_run(waiter.priority):
+                self._start(waiter.priority)
+                waiter.future.set_result(None)
+            elif waiter.priority == Priority.INTERACTIVE:
+                # 只有放不进去的交互请求才挡住更低优先级；近线 / 后台只受自身类别上限限制，
+                # 不影响其他类别
+                break
+        self._queue = [w for w in self._queue if not w.future.done()]
+        heapq.heapify(self._queue)
+        self._update_gauges()
+
+    def _preempt_background(self) -> None:
+        if self._queued(Priority.INTERACTIVE) < self.preempt_depth:
+            return
+        for waiter in self._queue:
+            if waiter.priority == Priority.BACKGROUND and not waiter.future.done():
+                waiter.future.set_exception(_Preempted())
+                LLM_SCHED_PREEMPTED.labels(priority="background").inc()
+        self._queue = [w for w in self._queue if not w.future.done()]
+        heapq.heapify(self._queue)
+
+    async def _acquire_once(self, priority: Priority) -> None:
+        if not self._queue and self._can_run(priority):
+            self._start(priority)
+            self._update_gauges()
+            return
+        waiter = _Waiter(priority, next(self._seq))
+        heapq.heappush(self._queue, waiter)
+        if priority == Priority.INTERACTIVE:
+            self._preempt_background()
+        # 队列里可能只有因类别上限或预留量而停住的低优先级请求，新请求有容量时应立即放行
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # 名额已分配但调用方被取消：归还
+                self._release(priority)
+            else:
+                waiter.future.cancel()
+                self._dispatch()
+            raise
+
+    async def acquire(self, priority: Priority) -> None:
+        started = time.monotonic()
+        for attempt in range(settings.LLM_PREEMPT_MAX_RETRIES + 1):
+            try:
+                await self._acquire_once(priority)
+                LLM_SCHED_WAIT.labels(priority=priority.name.lower()).observe(time.monotonic() - started)
+                return
+            except _Preempted:
+                logger.info(f"{priority.name} LLM call preempted (attempt {attempt + 1}), backing off")
+                await asyncio.sleep(settings.LLM_PREEMPT_BACKOFF * (attempt + 1))
+        raise LLMCallPreempted(f"{priority.name} LLM call preempted too many times")
+
+    def _release(self, priority: Priority) -> None:
+        self.active[priority] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority) -> AsyncIterator[None]:
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {
+            p.name.lower(): {"active": self.active[p], "queued": self._queued(p), "limit": self.class_limits[p]}
+            for p in Priority
+        }
+
+
+# 全局 LLM 调度器
+llm_scheduler = LLMScheduler(
+    total_limit=settings.LLM_MAX_CONCURRENCY,
+    class_limits={
+        Priority.INTERACTIVE: settings.LLM_INTERACTIVE_LIMIT,
+        Priority.NEARLINE: settings.LLM_NEARLINE_LIMIT,
+        Priority.BACKGROUND: settings.LLM_BACKGROUND_LIMIT,
+    },
+    background_reserve=settings.LLM_BACKGROUND_RESERVE,
+    preempt_depth=settings.LLM_PREEMPT_QUEUE_DEPTH,
+)
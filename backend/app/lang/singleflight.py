@@ -0,0 +1,122 @@
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, TypeVar
+import asyncio
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def make_key(model: str, messages: Sequence[Any], params: Optional[Dict[str, Any]] = None) -> str:
+    """按模型、消息与调用参数生成合并键"""
+    payload = {
+        "model": model,
+        "messages": [[getattr(m, "type", type(m).__name__), getattr(m, "content", str(m))] for m in messages],
+        "params": params or {},
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class _StreamFlight:
+    """一次进行中的上游流式调用：缓存已产出的块，并唤醒所有订阅者"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self) -> None:
+        await self._changed.wait()
+
+
+class _CallFlight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.subscribers = 0
+
+
+class SingleFlight:
+    """
+    合并相同的进行中 LLM 请求：同一键只发起一次上游调用。
+    流式调用的输出扇出给所有订阅者（后加入者从头回放）；最后一个订阅者离开时取消上游调用。
+    """
+
+    def __init__(self):
+        self._streams: Dict[str, _StreamFlight] = {}
+        self._calls: Dict[str, _CallFlight] = {}
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = self._streams[key] = _StreamFlight()
+            flight.task = asyncio.create_task(self._pump(key, flight, factory))
+        else:
+            logger.debug(f"Joined in-flight stream {key[:12]} ({flight.subscribers} subscribers)")
+
+        flight.subscribers += 1
+        try:
+            index = 0
+            while True:
+                if index < len(flight.chunks):
+                    chunk = flight.chunks[index]
+                    index += 1
+                    yield chunk
+                    continue
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                logger.debug(f"Last subscriber left, cancelling upstream stream {key[:12]}")
+                flight.task.cancel()
+                self._discard(self._streams, key, flight)
+
+    async def _pump(self, key: str, flight: _StreamFlight, factory: Callable[[], AsyncIterator[str]]) -> None:
+        try:
+            async for chunk in factory():
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            flight.notify()
+            self._discard(self._streams, key, flight)
+
+    async def call(self, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        flight = self._calls.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(factory())
+            flight = self._calls[key] = _CallFlight(task)
+            task.add_done_callback(lambda _t, f=flight: self._discard(self._calls, key, f))
+        else:
+            logger.debug(f"Joined in-flight call {key[:12]} ({flight.subscribers} subscribers)")
+
+        flight.subscribers += 1
+        try:
+            # shield：单个等待者被取消时不影响其他等待者共享的上游调用
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    @staticmethod
+    def _discard(flights: Dict[str, Any], key: str, flight: Any) -> None:
+        if flights.get(key) is flight:
+            del flights[key]
@@ -1,51 +1,239 @@
+import atexit
+import copy
+import json
 import logging
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from typing import Dict, Optional
 
-# 配置日志格式
-LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+from .config import settings
+
+try:
+    import orjson
+
+    def _json_dumps(payload: dict) -> str:
+        return orjson.dumps(payload, default=str).decode("utf-8")
+except ImportError:
+    def _json_dumps(payload: dict) -> str:
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+try:
+    from opentelemetry import trace as _otel_trace
+except ImportError:
+    _otel_trace = None
+
+# 配置日志格式（LOG_FORMAT=text 时使用）
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 # 创建日志目录
 LOG_DIR = Path(__file__).parent.parent / "logs"
 LOG_DIR.mkdir(exist_ok=True)
 
+# LogRecord 自带的属性，其余（logger.info(..., extra={...}) 传入的）作为 JSON 字段输出
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_exc_formatter = logging.Formatter()
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional["_DroppingQueueHandler"] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一行 JSON：时间、级别、logger、消息，附带 trace_id/span_id 与 extra 字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc"] = record.exc_text
+        if record.stack_info:
+            payload["stack"] = record.stack_info
+        return _json_dumps(payload)
+
+
+class _TraceContextFilter(logging.Filter):
+    """在调用线程上记下当前 trace_id/span_id（格式化发生在后台线程，那里拿不到请求上下文）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if _otel_trace is None:
+            return True
+        context = _otel_trace.get_current_span().get_span_context()
+        if context.is_valid:
+            record.trace_id = format(context.trace_id, "032x")
+            record.span_id = format(context.span_id, "016x")
+        return True
+
+
+class _RateLimitFilter(logging.Filter):
+    """
+    重复错误的限流采样：WARNING 及以上按 (logger, 级别, 消息模板) 计数，
+    每个窗口内最多放行 burst 条，其余丢弃，并在下一条放行的日志上附带被丢弃的条数。
+    """
+
+    def __init__(self, burst: int, window: float, max_keys: int = 1000):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.max_keys = max_keys
+        self._buckets: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.burst <= 0:
+            return True
+        # 本仓库多用 f-string 记日志，模板即消息本身：按前 200 字符归并，足以把同一处反复出现的错误算作一类
+        key = (record.name, record.levelno, str(record.msg)[:200])
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None or now - bucket[0] >= self.window:
+                suppressed = bucket[2] if bucket else 0
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.clear()
+                self._buckets[key] = [now, 1, 0]
+            elif bucket[1] < self.burst:
+                bucket[1] += 1
+                suppressed, bucket[2] = bucket[2], 0
+            else:
+                bucket[2] += 1
+                return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """有界队列写满时丢弃并计数，绝不阻塞事件循环"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 调用线程上只合并消息参数、展开异常栈（traceback 不能跨线程延后引用），格式化与 JSON 序列化留给后台线程
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _formatter(fmt: str) -> logging.Formatter:
+    if fmt == "text":
+        return logging.Formatter(TEXT_FORMAT, DATE_FORMAT)
+    return JsonFormatter()
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    """解析 "app.services.memory=DEBUG,httpx=WARNING" 形式的模块级别配置"""
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
 # 配置根日志记录器
-def setup_logging(level: str = "INFO"):
-    """设置日志配置"""
+def setup_logging(level: str = "INFO", fmt: Optional[str] = None, log_dir: Optional[Path] = None, stream=None) -> QueueListener:
+    """
+    设置日志配置：请求线程只把日志记录放进有界队列，格式化与写终端/文件都在 QueueListener 的后台线程完成。
+    fmt 为 json（默认，取 LOG_FORMAT）或 text；LOG_LEVELS 可为个别模块单独设置级别。
+    """
+    global _listener, _queue_handler
+    fmt = (fmt or settings.LOG_FORMAT).lower()
+    log_dir = log_dir or LOG_DIR
     log_level = getattr(logging, level.upper(), logging.INFO)
-    
+
+    # 重复调用时先停掉上一个后台线程
+    if _listener is not None:
+        _listener.stop()
+
     # 清除现有的处理器
     root_logger = logging.getLogger()
     root_logger.handlers.clear()
-    
+
     # 设置日志级别
     root_logger.setLevel(log_level)
-    
+
+    formatter = _formatter(fmt)
+
     # 控制台处理器（输出到终端）
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(log_level)
-    console_formatter = logging.Formatter(LOG_FORMAT, DATE_FORMAT)
-    console_handler.setFormatter(console_formatter)
-    root_logger.addHandler(console_handler)
-    
+    console_handler = logging.StreamHandler(stream or sys.stdout)
+    console_handler.setFormatter(formatter)
+
     # 文件处理器（输出到文件）
     file_handler = RotatingFileHandler(
-        LOG_DIR / "app.log",
+        Path(log_dir) / "app.log",
         maxBytes=10 * 1024 * 1024,  # 10MB
         backupCount=5,
         encoding="utf-8"
     )
-    file_handler.setLevel(log_level)
-    file_formatter = logging.Formatter(LOG_FORMAT, DATE_FORMAT)
-    file_handler.setFormatter(file_formatter)
-    root_logger.addHandler(file_handler)
-    
-    # 为特定模块设置更详细的日志级别
-    logging.getLogger("app.services.memory").setLevel(logging.DEBUG)
-    logging.getLogger("app.lang.graph").setLevel(logging.DEBUG)
-    logging.getLogger("app.routes.chat").setLevel(logging.DEBUG)
-    
-    logging.info(f"Logging configured: level={level}, log_dir={LOG_DIR}")
+    file_handler.setFormatter(formatter)
+
+    _queue_handler = _DroppingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    _queue_handler.addFilter(_RateLimitFilter(settings.LOG_RATE_LIMIT_BURST, settings.LOG_RATE_LIMIT_WINDOW))
+    _queue_handler.addFilter(_TraceContextFilter())
+    root_logger.addHandler(_queue_handler)
+
+    _listener = QueueListener(_queue_handler.queue, console_handler, file_handler, respect_handler_level=True)
+    _listener.start()
+
+    # 个别模块的级别（默认不再强制 DEBUG，需要时通过 LOG_LEVELS 或 /api/debug/log-levels 打开）
+    for name, module_level in _parse_levels(settings.LOG_LEVELS).items():
+        set_log_level(name, module_level)
+
+    logging.info(f"Logging configured: level={level}, format={fmt}, log_dir={log_dir}")
+    return _listener
+
+
+def stop_logging() -> None:
+    """停止后台线程并写完队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+def set_log_level(name: str, level: str) -> str:
+    """运行时调整 logger 级别；name 为 "root" 或空时调整根 logger，level 为 NOTSET 时恢复继承"""
+    level = level.upper()
+    if not isinstance(logging.getLevelName(level), int):
+        raise ValueError(f"Unknown log level: {level}")
+    logger = logging.getLogger(None if name in ("", "root") else name)
+    logger.setLevel(level)
+    return logging.getLevelName(logger.getEffectiveLevel())
+
 
+def get_log_levels() -> Dict[str, object]:
+    """根 logger 与所有显式设置过级别的 logger，以及队列丢弃的条数"""
+    levels = {"root": logging.getLevelName(logging.getLogger().level)}
+    for name, logger in sorted(logging.root.manager.loggerDict.items()):
+        if isinstance(logger, logging.Logger) and logger.level != logging.NOTSET:
+            levels[name] = logging.getLevelName(logger.level)
+    return {"levels": levels, "dropped": _queue_handler.dropped if _queue_handler else 0}
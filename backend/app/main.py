@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, JSONResponse
@@ -7,17 +8,59 @@ import logging
 
 from .config import settings
 from .routes.session import router as session_router
-from .routes.chat import router as chat_router
+from .routes.chat import router as chat_router, get_graph
 from .routes.memory import router as memory_router
+from .routes.ws import router as ws_router
+from .routes.debug import router as debug_router
 from .logging_config import setup_logging
+from .services.metrics import setup_metrics
+from .services.tracing import init_tracing
+from .services.loop_monitor import loop_monitor
+from .services.readiness import readiness
+from .services import db
+from .services.embedding import embedding_client
+from .services.memory import memory_manager
+from .lang.llm_pool import llm_pool
+
+
+async def warm_up() -> None:
+    """
+    并行预热：数据库（表反射 + 预建连接）、对话图、mem0 向量库、LLM 与嵌入服务的 HTTP 连接。
+    阻塞的初始化都放到线程池，事件循环在此期间照常响应 /healthz 与 /readyz。
+    """
+    async def graph_then_llm():
+        # LLM 客户端按对话图的温度创建，与对话路径共用同一个连接池
+        await readiness.run("graph", lambda: asyncio.to_thread(get_graph))
+        await readiness.run("llm", lambda: llm_pool.warm_up(settings.LLM_MODEL_CHAT, get_graph().temperature), required=False)
+
+    await asyncio.gather(
+        readiness.run("database", lambda: asyncio.to_thread(db.warm_up, settings.DB_WARMUP_CONNECTIONS)),
+        readiness.run("memory", lambda: asyncio.to_thread(memory_manager.warm_up), required=False),
+        readiness.run("embedding", embedding_client.warm_up, required=False),
+        graph_then_llm(),
+    )
+    readiness.finish()
 
 
 def create_app() -> FastAPI:
     # 初始化日志
-    setup_logging(level="INFO")
+    setup_logging(level=settings.LOG_LEVEL)
     logger = logging.getLogger(__name__)
     
-    app = FastAPI(title="AI Chat Demo", version="0.1.0")
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if settings.LOOP_MONITOR_ENABLED:
+            loop_monitor.start()
+        # 预热在后台进行，不阻塞开始接受连接；完成前 /readyz 返回 503
+        warm_up_task = asyncio.create_task(warm_up())
+        try:
+            yield
+        finally:
+            warm_up_task.cancel()
+            await asyncio.gather(warm_up_task, return_exceptions=True)
+            await loop_monitor.stop()
+
+    app = FastAPI(title="AI Chat Demo", version="0.1.0", lifespan=lifespan)
 
     app.add_middleware(
         CORSMiddleware,
@@ -29,11 +72,27 @@ def create_app() -> FastAPI:
 
     @app.get("/healthz")
     async def healthz():
+        """存活探针：进程在运行即返回 ok"""
         return {"status": "ok"}
 
+    @app.get("/readyz")
+    async def readyz():
+        """就绪探针：数据库与对话图预热完成前返回 503，附各项预热状态与耗时"""
+        return JSONResponse(readiness.snapshot(), status_code=200 if readiness.ready else 503)
+
     app.include_router(session_router, prefix="/api")
     app.include_router(chat_router, prefix="/api")
     app.include_router(memory_router, prefix="/api")
+    app.include_router(ws_router, prefix="/api")
+    # ADMIN_TOKEN 未配置时 /api/debug/* 均返回 404
+    app.include_router(debug_router, prefix="/api")
+
+    # OTEL_EXPORTER_OTLP_ENDPOINT 未配置时不启用，span 均为 no-op
+    init_tracing(app)
+
+    if settings.PROM_ENABLED:
+        setup_metrics(app)
+        logger.info("Prometheus metrics exposed at /metrics")
 
     return app
 
@@ -1,18 +1,38 @@
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Request, Response, HTTPException, Query
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import json
+from typing import Optional
+import asyncio
 import logging
+import threading
+from ..config import settings
 from ..lang.graph import ConversationGraph
-from ..services.session import create_session as create_session_service, get_session, update_session_title as update_session_title_service
+from ..lang.safety import REFUSAL, SafetyAbort
+from ..services.session import create_session as create_session_service, get_session
 from ..services.message import save_message, count_messages_by_session
-from ..services.summary import generate_summary
+from ..services.summary import session_titler
+from ..services.admission import chat_admission, AdmissionRejected, AdmissionTicket
+from ..services.sse import DONE_FRAME, coalesce, data_frame, retry_frame
+from ..services.timing import stage, start_timing
+from ..services.tracing import mark_error, tracer
+from ..services.turns import Turn, turn_registry
 
 logger = logging.getLogger(__name__)
 
 
 router = APIRouter(prefix="/chat", tags=["chat"])
-graph = ConversationGraph()
+_graph: Optional[ConversationGraph] = None
+_graph_lock = threading.Lock()
+
+
+def get_graph() -> ConversationGraph:
+    """对话图在启动预热（或首个请求）时创建，导入本模块时不做初始化"""
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                _graph = ConversationGraph()
+    return _graph
 
 
 class ChatRequest(BaseModel):
@@ -20,82 +40,138 @@ class ChatRequest(BaseModel):
     content: str
 
 
+def _admission_key(request: Request, session_id: str = None) -> str:
+    """准入控制的并发键：有会话按会话，否则按客户端地址"""
+    if session_id:
+        return f"session:{session_id}"
+    return f"client:{request.client.host if request.client else 'unknown'}"
+
+
+async def _admit(request: Request, session_id: str = None) -> AdmissionTicket:
+    """申请聊天名额，被拒绝时返回 429 与 Retry-After"""
+    try:
+        return await chat_admission.acquire(_admission_key(request, session_id))
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many concurrent chat requests ({e.reason}), please retry later",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
 @router.post("")
-async def chat(body: ChatRequest):
-    """非流式聊天接口"""
+async def chat(request: Request, response: Response, body: ChatRequest):
+    """非流式聊天接口；Server-Timing 头给出各阶段耗时（admission / db / memory_* / route / cache / llm / title）"""
     logger.info(f"Chat request received: session_id={body.session_id}, content_length={len(body.content)}")
+    ticket = await _admit(request, body.session_id)
+    timing = start_timing()
+    timing.record("admission", ticket.queued_ms)
     try:
         # 确保 session 存在
-        if not body.session_id:
-            logger.info("No session_id provided, creating new session")
-            session = create_session_service()
-            body.session_id = session["id"]
-            logger.info(f"Created new session: {body.session_id}")
-        else:
-            session = get_session(body.session_id)
-            if not session:
-                logger.warning(f"Session {body.session_id} not found, creating new one")
+        with tracer.start_as_current_span("chat.session_lookup"):
+            if not body.session_id:
+                logger.info("No session_id provided, creating new session")
                 session = create_session_service()
                 body.session_id = session["id"]
+                logger.info(f"Created new session: {body.session_id}")
+            else:
+                session = get_session(body.session_id)
+                if not session:
+                    logger.warning(f"Session {body.session_id} not found, creating new one")
+                    session = create_session_service()
+                    body.session_id = session["id"]
         
         # 保存用户消息
         logger.debug(f"Saving user message to session {body.session_id}")
-        save_message(body.session_id, "user", body.content)
+        with tracer.start_as_current_span("chat.persist_user_message"):
+            save_message(body.session_id, "user", body.content)
         
         # 获取回复
         logger.info(f"Calling graph.run for session {body.session_id}")
-        reply = await graph.run(body.content, {"session_id": body.session_id})
+        reply = await get_graph().run(body.content, {"session_id": body.session_id})
         logger.info(f"Received reply, length: {len(reply)}")
         
         # 保存助手消息
         logger.debug(f"Saving assistant message to session {body.session_id}")
-        save_message(body.session_id, "assistant", reply)
+        with tracer.start_as_current_span("chat.persist_reply", attributes={"chat.reply_chars": len(reply)}):
+            save_message(body.session_id, "assistant", reply)
         
         # 检查是否是首次对话
         message_count = count_messages_by_session(body.session_id)
         logger.debug(f"Message count for session {body.session_id}: {message_count}")
         if message_count == 2:  # 用户消息 + 助手消息
-            # 首次对话，生成摘要并更新标题
+            # 首次对话：先写入临时标题，正式标题在后台批量生成
             try:
-                logger.info(f"First conversation, generating summary for session {body.session_id}")
-                summary = await generate_summary(body.content, reply)
-                update_session_title_service(body.session_id, summary)
-                logger.info(f"Updated session title: {summary}")
+                with stage("title"):
+                    title = session_titler.schedule(body.session_id, body.content, reply)
+                logger.info(f"First conversation, placeholder title set: {title}")
             except Exception as e:
-                logger.error(f"Failed to generate summary: {e}", exc_info=True)
+                logger.error(f"Failed to schedule title generation: {e}", exc_info=True)
         
+        response.headers["Server-Timing"] = timing.server_timing()
         logger.info(f"Chat request completed successfully for session {body.session_id}")
         return {"reply": reply, "session_id": body.session_id}
     except Exception as e:
         logger.error(f"Chat error: {e}", exc_info=True)
+        mark_error(e)
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
+    finally:
+        ticket.release()
 
 
-@router.get("/stream")
-async def chat_stream(request: Request, session_id: str = None, q: str = ""):
-    """流式聊天接口（SSE）"""
-    logger.info(f"Chat stream request: session_id={session_id}, query_length={len(q)}")
-    
-    if not q:
-        logger.debug("Empty query, returning empty generator")
-        async def empty_generator():
-            yield b"event: done\n\n"
-        return StreamingResponse(empty_generator(), media_type="text/event-stream")
-    
-    async def event_generator():
-        full_reply = ""
-        current_session_id = session_id  # 使用局部变量，避免作用域问题
+@router.get("/routing")
+async def routing_stats():
+    """意图路由统计：各意图次数、各档位的模型与延迟"""
+    return get_graph().route_stats.snapshot()
+
+
+@router.get("/endpoints")
+async def endpoint_stats():
+    """LLM 端点池状态：各端点 EWMA 延迟、错误率、熔断与对冲统计"""
+    graph = get_graph()
+    if not graph.pool:
+        return {"endpoints": []}
+    return graph.pool.snapshot()
+
+
+@router.get("/admission")
+async def admission_stats():
+    """准入控制状态：当前并发数与排队数"""
+    return chat_admission.snapshot()
+
+
+async def run_turn(turn: Turn, session_id: str, q: str, ticket: AdmissionTicket, max_delay_ms: float, max_bytes: int) -> None:
+    """
+    在后台任务中生成一轮回复并写入 turn；与客户端连接解耦，断线后仍可续传。
+    turn 被取消时取消本任务（连带上游 LLM 请求），不保存不完整的回复，也不生成标题与提取记忆。
+    回复保存后发送 timing 事件，内容为本轮各阶段耗时，随后立即发送 done。
+    首轮对话只在本轮下发临时标题；正式标题由后台批量生成，经会话事件推送，不在本轮的流上等待。
+    """
+    with tracer.start_as_current_span("chat.turn", attributes={"chat.turn_id": turn.id, "chat.query_chars": len(q)}) as span:
+        await _run_turn(turn, session_id, q, ticket, max_delay_ms, max_bytes)
+        span.set_attribute("chat.session_id", turn.session_id or "")
+        span.set_attribute("chat.reply_chars", len(turn.text))
+        if turn.cancel_token.cancelled:
+            span.set_attribute("chat.cancel_reason", turn.cancel_token.reason)
+
+
+async def _run_turn(turn: Turn, session_id: str, q: str, ticket: AdmissionTicket, max_delay_ms: float, max_bytes: int) -> None:
+    current_session_id = session_id
+    timing = start_timing()
+    timing.record("admission", ticket.queued_ms)
+    task = asyncio.current_task()
+    stop_watching = turn.cancel_token.add_callback(task.cancel)
+    try:
+        logger.info(f"Starting turn {turn.id} for session_id={current_session_id}")
         
-        try:
-            logger.info(f"Starting event generator for session_id={current_session_id}")
-            
-            # 确保 session 存在，如果没有则创建新的
+        # 确保 session 存在，如果没有则创建新的
+        with tracer.start_as_current_span("chat.session_lookup"):
             if not current_session_id or current_session_id == '':
                 logger.info("No session_id, creating new session")
                 session = create_session_service()
                 current_session_id = session["id"]
                 logger.info(f"Created new session: {current_session_id}")
-                yield f"data: {json.dumps({'session_id': current_session_id})}\n\n".encode("utf-8")
+                turn.publish({"session_id": current_session_id})
             else:
                 # 验证 session 是否存在
                 session = get_session(current_session_id)
@@ -104,67 +180,159 @@ async def chat_stream(request: Request, session_id: str = None, q: str = ""):
                     logger.warning(f"Session {current_session_id} not found, creating new one")
                     session = create_session_service()
                     current_session_id = session["id"]
-                    yield f"data: {json.dumps({'session_id': current_session_id})}\n\n".encode("utf-8")
-            
-            # 保存用户消息
-            try:
-                logger.debug(f"Saving user message to session {current_session_id}")
+                    turn.publish({"session_id": current_session_id})
+        turn.session_id = current_session_id
+        
+        # 保存用户消息
+        try:
+            logger.debug(f"Saving user message to session {current_session_id}")
+            with tracer.start_as_current_span("chat.persist_user_message"):
                 save_message(current_session_id, "user", q)
-            except Exception as e:
-                logger.error(f"Failed to save user message: {e}", exc_info=True)
-            
-            # 流式获取回复并累积
+        except Exception as e:
+            logger.error(f"Failed to save user message: {e}", exc_info=True)
+            mark_error(e)
+        
+        # 流式获取回复，逐块写入 turn
+        try:
+            logger.info(f"Starting LLM stream for session {current_session_id}")
+            context = {"session_id": current_session_id, "cancel_token": turn.cancel_token}
+            stream = coalesce(get_graph().run_stream(q, context), max_delay_ms, max_bytes)
             try:
-                logger.info(f"Starting LLM stream for session {current_session_id}")
-                async for chunk in graph.run_stream(q, {"session_id": current_session_id}):
-                    if await request.is_disconnected():
-                        logger.warning("Client disconnected during stream")
-                        break
-                    full_reply += chunk
-                    payload = json.dumps({"delta": chunk})
-                    yield f"data: {payload}\n\n".encode("utf-8")
-                
-                logger.info(f"LLM stream completed, total length: {len(full_reply)}")
-            except Exception as e:
-                logger.error(f"Error in LLM stream: {e}", exc_info=True)
-                error_payload = json.dumps({"error": f"LLM调用失败: {str(e)}"})
-                yield f"data: {error_payload}\n\n".encode("utf-8")
+                async for chunk in stream:
+                    turn.delta(chunk)
+            finally:
+                await stream.aclose()
+            # 回复已完整生成，此后客户端离开不再中断保存与标题生成
+            stop_watching()
             
-            # 流式结束后保存完整助手消息
-            if full_reply:
-                try:
-                    logger.debug(f"Saving assistant message to session {current_session_id}")
+            logger.info(f"LLM stream completed, total length: {len(turn.text)}")
+            full_reply = turn.text
+        except asyncio.CancelledError:
+            raise
+        except SafetyAbort as e:
+            # 安全阶段中途拦截：用拒答替换客户端已收到的内容，只保存拒答
+            stop_watching()
+            logger.warning(f"Turn {turn.id} aborted by safety stage after {len(turn.text)} chars: {e}")
+            turn.retract({"snapshot": REFUSAL, "moderated": e.verdict.reason})
+            full_reply = REFUSAL
+        except Exception as e:
+            logger.error(f"Error in LLM stream: {e}", exc_info=True)
+            mark_error(e)
+            turn.publish({"error": f"LLM调用失败: {str(e)}"})
+            full_reply = turn.text
+        
+        # 流式结束后保存完整助手消息
+        if full_reply:
+            try:
+                logger.debug(f"Saving assistant message to session {current_session_id}")
+                with tracer.start_as_current_span("chat.persist_reply", attributes={"chat.reply_chars": len(full_reply)}):
                     save_message(current_session_id, "assistant", full_reply)
                     
                     # 检查是否是首次对话（用户消息 + 助手消息 = 2条消息）
                     message_count = count_messages_by_session(current_session_id)
-                    logger.debug(f"Message count: {message_count}")
-                    if message_count == 2:
-                        # 首次对话，生成摘要并更新标题
-                        try:
-                            logger.info(f"First conversation, generating summary")
-                            summary = await generate_summary(q, full_reply)
-                            update_session_title_service(current_session_id, summary)
-                            logger.info(f"Updated session title: {summary}")
-                            # 发送标题更新事件
-                            yield f"data: {json.dumps({'title_update': summary})}\n\n".encode("utf-8")
-                        except Exception as e:
-                            logger.error(f"Failed to generate summary: {e}", exc_info=True)
-                except Exception as e:
-                    logger.error(f"Failed to save assistant message: {e}", exc_info=True)
-            
-            logger.info(f"Event generator completed for session {current_session_id}")
-            yield b"event: done\n\n"
-        except Exception as e:
-            import traceback
-            error_msg = f"服务器错误: {str(e)}"
-            logger.error(f"Error in chat_stream: {traceback.format_exc()}")
-            error_payload = json.dumps({"error": error_msg})
-            yield f"data: {error_payload}\n\n".encode("utf-8")
-            yield b"event: done\n\n"
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream", headers={
+                logger.debug(f"Message count: {message_count}")
+                if message_count == 2:
+                    # 首次对话：立即下发临时标题，正式标题由后台生成后经会话事件推送
+                    try:
+                        with stage("title"):
+                            title = session_titler.schedule(current_session_id, q, full_reply)
+                        logger.info(f"First conversation, placeholder title set: {title}")
+                        turn.publish({"title_update": title})
+                    except Exception as e:
+                        logger.error(f"Failed to schedule title generation: {e}", exc_info=True)
+            except Exception as e:
+                logger.error(f"Failed to save assistant message: {e}", exc_info=True)
+                mark_error(e)
+        
+        logger.info(f"Turn {turn.id} completed for session {current_session_id}")
+    except asyncio.CancelledError:
+        if not turn.cancel_token.cancelled:
+            # 任务被外部取消（如服务关闭）：在 finally 中结束本轮后继续向上抛出
+            raise
+        # 由取消令牌触发：吞掉本次取消，记录原因后正常收尾
+        uncancel = getattr(task, "uncancel", None)
+        if uncancel is not None:
+            uncancel()
+        logger.info(f"Turn {turn.id} cancelled ({turn.cancel_token.reason}) after {len(turn.text)} chars, partial reply discarded")
+        turn.publish({"cancelled": turn.cancel_token.reason})
+    except Exception as e:
+        logger.error(f"Error in chat turn: {e}", exc_info=True)
+        mark_error(e)
+        turn.publish({"error": f"服务器错误: {str(e)}"})
+    finally:
+        stop_watching()
+        turn.publish({"timing": timing.finish().to_dict()}, event="timing")
+        ticket.release()
+        turn.publish({}, event="done")
+        turn.finish()
+
+
+async def _sse_follow(turn: Turn, after_seq: int):
+    """把 turn 的事件编码为 SSE 帧；客户端断开时生成器被关闭，不影响后台生成"""
+    yield retry_frame(settings.SSE_RETRY_MS)
+    async for turn_event in turn.follow(after_seq):
+        yield turn_event.frame
+
+
+async def _sse_expired():
+    """续传的轮次已过期：通知客户端重新加载消息并结束，避免反复重连"""
+    yield data_frame({"expired": True})
+    yield DONE_FRAME
+
+
+def _sse_response(events) -> StreamingResponse:
+    return StreamingResponse(events, media_type="text/event-stream", headers={
         "Cache-Control": "no-cache",
         "Connection": "keep-alive",
         "X-Accel-Buffering": "no"
     })
+
+
+@router.post("/turns/{turn_id}/cancel")
+async def cancel_turn(turn_id: str):
+    """主动取消进行中的一轮流式回复"""
+    turn = turn_registry.get(turn_id)
+    if turn is None:
+        raise HTTPException(status_code=404, detail="Turn not found")
+    return {"turn_id": turn_id, "cancelled": turn.cancel("client_cancelled"), "reason": turn.cancel_token.reason}
+
+
+@router.get("/stream")
+async def chat_stream(
+    request: Request,
+    session_id: str = None,
+    q: str = "",
+    coalesce_ms: float = Query(None, ge=0),
+    coalesce_bytes: int = Query(None, ge=0),
+    last_event_id: str = Query(None),
+):
+    """
+    流式聊天接口（SSE）。coalesce_ms / coalesce_bytes 可覆盖增量合并阈值，0 表示逐 token 发送。
+    每个事件带 id；断线重连时携带 Last-Event-ID 头（或 last_event_id 参数）会从断点续传，不会再次调用 LLM。
+    """
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    if resume_from:
+        resumed = turn_registry.resume(resume_from)
+        if resumed is None:
+            logger.info(f"Resume requested for unknown or expired turn: {resume_from}")
+            return _sse_response(_sse_expired())
+        turn, after_seq = resumed
+        logger.info(f"Resuming turn {turn.id} after event {after_seq}")
+        return _sse_response(_sse_follow(turn, after_seq))
+    
+    logger.info(f"Chat stream request: session_id={session_id}, query_length={len(q)}")
+    
+    if not q:
+        logger.debug("Empty query, returning empty generator")
+        async def empty_generator():
+            yield DONE_FRAME
+        return StreamingResponse(empty_generator(), media_type="text/event-stream")
+    
+    max_delay_ms = min(settings.SSE_COALESCE_MS if coalesce_ms is None else coalesce_ms, settings.SSE_COALESCE_MAX_MS)
+    max_bytes = min(settings.SSE_COALESCE_BYTES if coalesce_bytes is None else coalesce_bytes, settings.SSE_COALESCE_MAX_BYTES)
+    
+    # 名额由后台生成任务持有，本轮结束时归还
+    ticket = await _admit(request, session_id)
+    turn = turn_registry.create()
+    turn.task = asyncio.create_task(run_turn(turn, session_id, q, ticket, max_delay_ms, max_bytes))
+    return _sse_response(_sse_follow(turn, 0))
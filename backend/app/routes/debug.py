@@ -0,0 +1,71 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+import asyncio
+import logging
+import threading
+
+from ..auth import require_admin
+from ..config import settings
+from ..logging_config import get_log_levels, set_log_level
+from ..services.loop_monitor import loop_monitor
+from ..services.profiler import ProfilerBusy, sample_stacks
+
+logger = logging.getLogger(__name__)
+
+
+router = APIRouter(prefix="/debug", tags=["debug"], dependencies=[Depends(require_admin)])
+
+
+class LogLevelRequest(BaseModel):
+    logger: str = "root"
+    level: str
+
+
+@router.get("/log-levels")
+async def list_log_levels():
+    """根 logger 与显式设置过级别的 logger，以及日志队列丢弃的条数"""
+    return get_log_levels()
+
+
+@router.put("/log-levels")
+async def update_log_level(request: LogLevelRequest):
+    """运行时调整某个 logger 的级别，例如临时打开 app.services.memory 的 DEBUG；进程重启后恢复 LOG_LEVELS"""
+    try:
+        effective = set_log_level(request.logger, request.level)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.warning(f"Log level changed: {request.logger}={request.level.upper()}")
+    return {"logger": request.logger, "level": request.level.upper(), "effective": effective}
+
+
+@router.get("/loop")
+async def event_loop_report(limit: int = 20):
+    """事件循环延迟分位、阻塞次数，以及按累计阻塞时间排序的调用点（含一条折叠调用栈）"""
+    return loop_monitor.report(limit=max(1, min(limit, 200)))
+
+
+@router.delete("/loop")
+async def reset_event_loop_report():
+    loop_monitor.reset()
+    return {"ok": True}
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10, gt=0),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    threads: str = Query("loop", pattern="^(loop|all)$"),
+):
+    """
+    对进程做 seconds 秒的栈采样，返回折叠栈文本（flamegraph.pl / speedscope 可直接打开）。
+    threads=loop 只采样事件循环线程，all 采样所有线程。采样在独立线程中进行，同一时间只允许一次。
+    """
+    if seconds > settings.PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be <= {settings.PROFILE_MAX_SECONDS}")
+    thread_id = threading.get_ident() if threads == "loop" else None
+    logger.warning(f"Sampling profiler started: seconds={seconds}, interval_ms={interval_ms}, threads={threads}")
+    try:
+        return await asyncio.to_thread(sample_stacks, seconds, interval_ms / 1000, thread_id)
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
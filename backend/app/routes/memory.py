@@ -1,7 +1,16 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Header, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from ..services.memory import memory_manager
+from ..config import settings
 from typing import List, Dict, Any, Optional
+import hashlib
+import json
+import logging
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
 
 
 router = APIRouter(prefix="/memory", tags=["memory"])
@@ -15,8 +24,55 @@ class MemoryResponse(BaseModel):
     metadata: Optional[Dict[str, Any]] = None
 
 
+def _format_memory(mem: Any) -> Dict[str, Any]:
+    """统一记忆的返回格式"""
+    # 处理不同的返回格式
+    if isinstance(mem, dict):
+        metadata = mem.get("metadata") if isinstance(mem.get("metadata"), dict) else {}
+        return {
+            "id": mem.get("id", ""),
+            "memory": mem.get("memory", ""),
+            "type": metadata.get("type", "unknown"),
+            "importance": metadata.get("importance", "medium"),
+            "metadata": mem.get("metadata", {}),
+            "created_at": mem.get("created_at"),
+        }
+    # 如果是字符串格式
+    return {
+        "id": "",
+        "memory": str(mem),
+        "type": "unknown",
+        "importance": "medium",
+        "metadata": {},
+        "created_at": None,
+    }
+
+
+def _content_etag(memories: List[Any], limit: int) -> str:
+    """
+    由返回的数据本身计算 ETag（id、更新时间与文本）：变更日志只在本进程内，
+    多 worker 或绕过本进程修改记忆时，用游标做 ETag 会返回过期的 304。
+    """
+    digest = hashlib.sha1(str(limit).encode("utf-8"))
+    for mem in memories:
+        key = [mem.get("id"), mem.get("updated_at") or mem.get("created_at"), mem.get("memory")] if isinstance(mem, dict) else mem
+        digest.update(json.dumps(key, ensure_ascii=False, default=str).encode("utf-8"))
+    return f'W/"{digest.hexdigest()[:20]}"'
+
+
+def _not_modified(etag: str, if_none_match: Optional[str]) -> bool:
+    if not if_none_match:
+        return False
+    return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+
 @router.get("/{session_id}")
-async def get_memories(session_id: str, limit: int = 50) -> Dict[str, Any]:
+async def get_memories(
+    session_id: str,
+    response: Response,
+    limit: int = 50,
+    if_none_match: Optional[str] = Header(default=None),
+) -> Dict[str, Any]:
     """获取指定会话的所有记忆"""
     try:
         user_id = memory_manager.get_user_id(session_id)
@@ -24,44 +80,78 @@ async def get_memories(session_id: str, limit: int = 50) -> Dict[str, Any]:
         if not memory_manager.memory:
             return {"memories": [], "count": 0}
         
-        # 获取所有记忆
-        all_memories = await memory_manager.get_all_memories(user_id=user_id, limit=limit)
+        # 先取游标再拉数据：期间的变更会在下次增量同步中再次返回
+        cursor = memory_manager.change_log.cursor(user_id)
         
-        if not all_memories:
-            return {"memories": [], "count": 0}
+        # 获取所有记忆
+        all_memories = await memory_manager.get_all_memories(user_id=user_id, limit=limit) or []
+        etag = _content_etag(all_memories, limit)
+        if _not_modified(etag, if_none_match):
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
         
         # 格式化记忆数据
-        formatted_memories = []
-        for mem in all_memories:
-            # 处理不同的返回格式
-            if isinstance(mem, dict):
-                formatted_memories.append({
-                    "id": mem.get("id", ""),
-                    "memory": mem.get("memory", ""),
-                    "type": mem.get("metadata", {}).get("type", "unknown") if isinstance(mem.get("metadata"), dict) else "unknown",
-                    "importance": mem.get("metadata", {}).get("importance", "medium") if isinstance(mem.get("metadata"), dict) else "medium",
-                    "metadata": mem.get("metadata", {}),
-                    "created_at": mem.get("created_at"),
-                })
-            else:
-                # 如果是字符串格式
-                formatted_memories.append({
-                    "id": "",
-                    "memory": str(mem),
-                    "type": "unknown",
-                    "importance": "medium",
-                    "metadata": {},
-                    "created_at": None,
-                })
+        formatted_memories = [_format_memory(mem) for mem in all_memories]
         
         return {
             "memories": formatted_memories,
-            "count": len(formatted_memories)
+            "count": len(formatted_memories),
+            "cursor": cursor,
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get memories: {str(e)}")
 
 
+@router.get("/{session_id}/changes")
+async def get_memory_changes(
+    session_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(default=None),
+) -> Dict[str, Any]:
+    """
+    增量同步：返回游标之后新增、更新或删除的记忆；游标失效时返回全量（逐页读取，不截断）并置 reset。
+    游标与 ETag 只反映本进程记录的变更，多 worker 部署需要会话粘滞。
+    """
+    try:
+        user_id = memory_manager.get_user_id(session_id)
+        
+        if not memory_manager.memory:
+            return {"cursor": cursor, "reset": False, "changes": []}
+        
+        changes, current = memory_manager.change_log.since(user_id, cursor)
+        etag = f'W/"{current}"'
+        if changes == [] and _not_modified(etag, if_none_match):
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        
+        if changes is None:
+            # 游标为空、来自其他进程或已超出保留窗口：全量同步
+            formatted_memories = [_format_memory(mem) async for mem in memory_manager.iter_memories(user_id)]
+            return {
+                "cursor": current,
+                "reset": True,
+                "memories": formatted_memories,
+                "count": len(formatted_memories),
+            }
+        
+        return {
+            "cursor": current,
+            "reset": False,
+            "changes": [
+                {
+                    "op": entry.op,
+                    "id": entry.memory_id,
+                    # 仅文本变更的记录不带 metadata，原样返回供客户端合并
+                    "memory": _format_memory(entry.memory) if entry.memory and "metadata" in entry.memory else entry.memory,
+                }
+                for entry in changes
+            ],
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get memory changes: {str(e)}")
+
+
 @router.get("/{session_id}/search")
 async def search_memories(session_id: str, q: str, limit: int = 10) -> Dict[str, Any]:
     """搜索相关记忆"""
@@ -99,6 +189,132 @@ async def search_memories(session_id: str, q: str, limit: int = 10) -> Dict[str,
         raise HTTPException(status_code=500, detail=f"Failed to search memories: {str(e)}")
 
 
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    limit: int = Field(default=10, ge=1, le=100)
+
+
+@router.post("/{session_id}/search/batch")
+async def batch_search_memories(session_id: str, body: BatchSearchRequest) -> Dict[str, Any]:
+    """批量搜索相关记忆，返回每个查询的结果及各阶段耗时"""
+    if len(body.queries) > settings.MEMORY_BATCH_SEARCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many queries: {len(body.queries)} > {settings.MEMORY_BATCH_SEARCH_MAX_QUERIES}",
+        )
+    try:
+        user_id = memory_manager.get_user_id(session_id)
+        
+        if not memory_manager.memory or not body.queries:
+            return {"results": [{"query": q, "memories": [], "count": 0} for q in body.queries], "timings_ms": {}}
+        
+        started = time.perf_counter()
+        batch = await memory_manager.batch_search(body.queries, user_id=user_id, limit=body.limit)
+        
+        format_started = time.perf_counter()
+        results = []
+        for item in batch["results"]:
+            formatted_memories = []
+            for mem in item["memories"]:
+                formatted = _format_memory(mem)
+                formatted["score"] = mem.get("score")
+                formatted_memories.append(formatted)
+            results.append({"query": item["query"], "memories": formatted_memories, "count": len(formatted_memories)})
+        
+        timings = dict(batch["timings_ms"])
+        timings["format"] = (time.perf_counter() - format_started) * 1000
+        timings["total"] = (time.perf_counter() - started) * 1000
+        return {"results": results, "timings_ms": timings, "memory_count": batch["memory_count"]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to batch search memories: {str(e)}")
+
+
+@router.get("/{session_id}/export")
+async def export_memories(session_id: str, include_vectors: bool = False, page_size: int = 256):
+    """以 NDJSON 流式导出会话的全部记忆，每行一条"""
+    if not memory_manager.memory:
+        raise HTTPException(status_code=400, detail="Memory manager not initialized")
+    
+    user_id = memory_manager.get_user_id(session_id)
+    
+    async def ndjson_generator():
+        count = 0
+        try:
+            async for record in memory_manager.iter_memories(user_id, page_size=page_size, include_vectors=include_vectors):
+                count += 1
+                yield (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        except Exception as e:
+            # 响应头已发出，只能在流末尾写入错误行
+            logger.error(f"Memory export failed after {count} records: {e}", exc_info=True)
+            yield (json.dumps({"error": f"Export failed: {str(e)}", "exported": count}) + "\n").encode("utf-8")
+            return
+        logger.info(f"Exported {count} memories for user_id={user_id}")
+    
+    return StreamingResponse(ndjson_generator(), media_type="application/x-ndjson", headers={
+        "Content-Disposition": f'attachment; filename="memories-{session_id}.ndjson"',
+    })
+
+
+@router.post("/{session_id}/import")
+async def import_memories(request: Request, session_id: str, batch_size: int = 100):
+    """
+    导入 NDJSON 格式的记忆（与导出格式一致），以 NDJSON 流式返回进度：每写入一批输出一行累计统计，最后一行带 done。
+    请求体先读入临时文件（超过 MEMORY_IMPORT_SPOOL_BYTES 落盘）再开始响应——StreamingResponse 会同时监听客户端断开，
+    与生成器争抢请求体消息；之后逐行解析、按批写入，内存中最多保留一批。
+    """
+    if not memory_manager.memory:
+        raise HTTPException(status_code=400, detail="Memory manager not initialized")
+    
+    user_id = memory_manager.get_user_id(session_id)
+    batch_size = max(1, min(batch_size, 1000))
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.MEMORY_IMPORT_SPOOL_BYTES)
+    try:
+        async for chunk in request.stream():
+            spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    
+    def progress_line(stats: Dict[str, Any]) -> bytes:
+        return (json.dumps(stats, ensure_ascii=False) + "\n").encode("utf-8")
+    
+    async def progress_generator():
+        stats = {"processed": 0, "imported": 0, "failed": 0, "invalid": 0}
+        batch: List[Dict[str, Any]] = []
+        
+        async def flush():
+            try:
+                result = await memory_manager.import_memories(batch, user_id)
+                stats["imported"] += result["imported"]
+                stats["failed"] += result["failed"]
+            except Exception as e:
+                logger.error(f"Memory import batch failed: {e}", exc_info=True)
+                stats["failed"] += len(batch)
+            stats["processed"] += len(batch)
+            batch.clear()
+        
+        with spool:
+            for line in spool:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    batch.append(json.loads(line))
+                except json.JSONDecodeError:
+                    stats["invalid"] += 1
+                    continue
+                if len(batch) >= batch_size:
+                    await flush()
+                    yield progress_line(stats)
+            if batch:
+                await flush()
+        logger.info(f"Imported memories for user_id={user_id}: {stats}")
+        yield progress_line(dict(stats, done=True))
+    
+    return StreamingResponse(progress_generator(), media_type="application/x-ndjson")
+
+
 @router.delete("/{session_id}/{memory_id}")
 async def delete_memory(session_id: str, memory_id: str) -> Dict[str, Any]:
     """删除指定记忆"""
@@ -106,7 +322,8 @@ async def delete_memory(session_id: str, memory_id: str) -> Dict[str, Any]:
         if not memory_manager.memory:
             raise HTTPException(status_code=400, detail="Memory manager not initialized")
         
-        result = memory_manager.memory.delete(memory_id=memory_id)
+        user_id = memory_manager.get_user_id(session_id)
+        await memory_manager.delete_memory(memory_id=memory_id, user_id=user_id)
         return {"success": True, "memory_id": memory_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete memory: {str(e)}")
@@ -1,5 +1,8 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+import asyncio
+from ..config import settings
 from ..services.session import (
     create_session as create_session_service,
     get_session as get_session_service,
@@ -9,6 +12,9 @@ from ..services.session import (
     delete_session as delete_session_service
 )
 from ..services.message import get_messages_by_session
+from ..services.session_events import session_events
+from ..services.sse import DONE_FRAME, data_frame
+from ..services.summary import session_titler
 
 
 router = APIRouter(prefix="/sessions", tags=["sessions"])
@@ -68,6 +74,38 @@ async def update_title(session_id: str, body: UpdateTitleRequest) -> dict:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _title_events(session_id: str):
+    """先订阅会话事件再等待后台标题，转发期间推送的事件；标题在连接前已写入时从库里补发当前标题"""
+    queue: asyncio.Queue = asyncio.Queue()
+    unsubscribe = session_events.subscribe(session_id, queue.put_nowait)
+    try:
+        await session_titler.wait(session_id, settings.TITLE_WAIT_TIMEOUT)
+        title_sent = False
+        while not queue.empty():
+            data = queue.get_nowait()
+            title_sent = title_sent or "title_update" in data
+            yield data_frame(data)
+        if not title_sent:
+            session = get_session_service(session_id)
+            if session:
+                yield data_frame({"title_update": session["title"]})
+        yield DONE_FRAME
+    finally:
+        unsubscribe()
+
+
+@router.get("/{session_id}/events")
+async def session_events_endpoint(session_id: str):
+    """
+    会话事件流（SSE）：首轮对话的 done 之后订阅，等待后台批量生成的正式标题（最多 TITLE_WAIT_TIMEOUT 秒），
+    以 title_update 推送后发送 done 结束。
+    """
+    return StreamingResponse(_title_events(session_id), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
 @router.get("/{session_id}/messages")
 async def get_session_messages_endpoint(session_id: str) -> list:
     """获取会话消息历史"""
@@ -0,0 +1,245 @@
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Set
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+import asyncio
+import json
+import logging
+
+from ..config import settings
+from ..services.admission import chat_admission, AdmissionRejected
+from ..services.session_events import session_events
+from ..services.sse import dumps
+from ..services.turns import Turn, turn_registry
+from .chat import run_turn
+
+logger = logging.getLogger(__name__)
+
+
+router = APIRouter(prefix="/chat", tags=["chat"])
+
+
+class _TurnForwarder:
+    """把一轮对话的事件转发到 WebSocket；未确认的事件达到窗口大小时暂停，等待客户端 ack"""
+
+    def __init__(self, connection: "_Connection", turn: Turn, after_seq: int, window: int):
+        self.connection = connection
+        self.turn = turn
+        self.window = window
+        self.unacked: Deque[int] = deque()
+        self._credit = asyncio.Event()
+        self.task = asyncio.create_task(self._run(after_seq))
+
+    def ack(self, seq: int) -> None:
+        while self.unacked and self.unacked[0] <= seq:
+            self.unacked.popleft()
+        self._credit.set()
+
+    async def _run(self, after_seq: int) -> None:
+        try:
+            async for turn_event in self.turn.follow(after_seq):
+                if "session_id" in turn_event.data:
+                    self.connection.watch(turn_event.data["session_id"])
+                while self.window and len(self.unacked) >= self.window:
+                    self._credit.clear()
+                    await self._credit.wait()
+                self.unacked.append(turn_event.seq)
+                await self.connection.send({
+                    "type": "event",
+                    "turn_id": self.turn.id,
+                    "seq": turn_event.seq,
+                    "event": turn_event.event or "message",
+                    "data": turn_event.data,
+                })
+        finally:
+            self.connection.forwarders.pop(self.turn.id, None)
+
+
+class _Connection:
+    """
+    一个 WebSocket 连接上复用的多个会话与轮次。
+    所有发送经过一个有界队列与单一发送任务，避免并发写同一连接。
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.forwarders: Dict[str, _TurnForwarder] = {}
+        # 已订阅的会话 -> 取消订阅函数；连接存续期间持续接收这些会话的后台事件（如正式标题）
+        self.watched: Dict[str, Callable[[], None]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        # 已通过并发检查、尚未注册转发器的 start（正在准入排队或发送 started）
+        self._starting = 0
+        self._outbox: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_SEND_QUEUE_SIZE)
+        self._sender = asyncio.create_task(self._send_loop())
+
+    @property
+    def client(self) -> str:
+        client = self.websocket.client
+        return client.host if client else "unknown"
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        # 发送任务已退出时连接正在关闭，丢弃消息，避免在写满的队列上永久等待
+        if self._sender.done():
+            return
+        await self._outbox.put(message)
+
+    async def _send_loop(self) -> None:
+        try:
+            while True:
+                message = await self._outbox.get()
+                await self.websocket.send_text(dumps(message).decode("utf-8"))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"WebSocket send failed, closing connection: {e}")
+        # 清空队列，唤醒阻塞在 put 上的发送方；再关闭连接，使接收循环退出并清理
+        while not self._outbox.empty():
+            self._outbox.get_nowait()
+        try:
+            await self.websocket.close(code=1011)
+        except Exception:
+            pass
+
+    def watch(self, session_id: str) -> None:
+        if session_id in self.watched:
+            return
+
+        def forward(data: Dict[str, Any]) -> None:
+            try:
+                self._outbox.put_nowait({"type": "session_event", "session_id": session_id, "data": data})
+            except asyncio.QueueFull:
+                logger.warning(f"WebSocket send queue full, dropping session event for {session_id}")
+
+        self.watched[session_id] = session_events.subscribe(session_id, forward)
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _follow(self, turn: Turn, after_seq: int, window: Optional[int]) -> None:
+        if window is None:
+            window = settings.WS_TURN_WINDOW
+        self.forwarders[turn.id] = _TurnForwarder(self, turn, after_seq, max(int(window), 0))
+
+    async def handle(self, message: Dict[str, Any]) -> None:
+        kind = message.get("type")
+        if kind == "start":
+            # 准入排队可能较久，放到独立任务中，不阻塞 ack / cancel 的处理
+            self._spawn(self._start(message))
+        elif kind == "ack":
+            forwarder = self.forwarders.get(message.get("turn_id"))
+            if forwarder is not None:
+                forwarder.ack(int(message.get("seq", 0)))
+        elif kind == "cancel":
+            turn = turn_registry.get(message.get("turn_id") or "")
+            cancelled = turn.cancel("client_cancelled") if turn is not None else False
+            await self.send({"type": "cancel_result", "turn_id": message.get("turn_id"), "cancelled": cancelled})
+        elif kind == "resume":
+            await self._resume(message)
+        elif kind == "watch":
+            self.watch(str(message["session_id"]))
+        elif kind == "ping":
+            await self.send({"type": "pong"})
+        else:
+            await self.send({"type": "error", "message": f"Unknown message type: {kind}"})
+
+    async def _start(self, message: Dict[str, Any]) -> None:
+        ref = message.get("ref")
+        content = (message.get("content") or "").strip()
+        session_id = message.get("session_id") or None
+        if not content:
+            await self.send({"type": "error", "ref": ref, "message": "Empty content"})
+            return
+        # 在第一个 await 之前占位：否则一串 start 消息都会在转发器注册前通过检查
+        if len(self.forwarders) + self._starting >= settings.WS_MAX_TURNS_PER_CONNECTION:
+            await self.send({"type": "error", "ref": ref, "code": 429, "message": "Too many concurrent turns on this connection"})
+            return
+        self._starting += 1
+        try:
+            await self._start_turn(message, ref, content, session_id)
+        finally:
+            self._starting -= 1
+
+    async def _start_turn(self, message: Dict[str, Any], ref: Any, content: str, session_id: Optional[str]) -> None:
+        coalesce_ms = message.get("coalesce_ms")
+        coalesce_bytes = message.get("coalesce_bytes")
+        try:
+            max_delay_ms = min(settings.SSE_COALESCE_MS if coalesce_ms is None else max(float(coalesce_ms), 0), settings.SSE_COALESCE_MAX_MS)
+            max_bytes = min(settings.SSE_COALESCE_BYTES if coalesce_bytes is None else max(int(coalesce_bytes), 0), settings.SSE_COALESCE_MAX_BYTES)
+        except (TypeError, ValueError):
+            await self.send({"type": "error", "ref": ref, "message": "Invalid coalesce_ms / coalesce_bytes"})
+            return
+
+        if session_id:
+            self.watch(session_id)
+        key = f"session:{session_id}" if session_id else f"client:{self.client}"
+        try:
+            ticket = await chat_admission.acquire(key)
+        except AdmissionRejected as e:
+            await self.send({"type": "error", "ref": ref, "code": 429, "message": e.reason, "retry_after": e.retry_after})
+            return
+
+        turn = turn_registry.create()
+        turn.task = asyncio.create_task(run_turn(turn, session_id, content, ticket, max_delay_ms, max_bytes))
+        logger.info(f"WebSocket turn {turn.id} started for session_id={session_id}")
+        await self.send({"type": "started", "ref": ref, "turn_id": turn.id})
+        self._follow(turn, 0, message.get("window"))
+
+    async def _resume(self, message: Dict[str, Any]) -> None:
+        turn_id = message.get("turn_id") or ""
+        if turn_id in self.forwarders:
+            return
+        turn = turn_registry.get(turn_id)
+        if turn is None:
+            await self.send({"type": "event", "turn_id": turn_id, "seq": 0, "event": "message", "data": {"expired": True}})
+            return
+        after_seq = min(int(message.get("after_seq", 0)), turn.seq)
+        self._follow(turn, after_seq, message.get("window"))
+
+    async def close(self) -> None:
+        # 停止转发；各轮次在断线宽限期后由取消令牌处理
+        for unsubscribe in self.watched.values():
+            unsubscribe()
+        self.watched.clear()
+        tasks = [forwarder.task for forwarder in self.forwarders.values()] + list(self._tasks) + [self._sender]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@router.websocket("/ws")
+async def chat_ws(websocket: WebSocket):
+    """
+    WebSocket 聊天接口：一个连接上复用多个会话与轮次，消息均为 JSON。
+    客户端 -> 服务端：
+      {"type": "start", "ref", "session_id", "content", "window"?, "coalesce_ms"?, "coalesce_bytes"?}
+      {"type": "ack", "turn_id", "seq"}        确认已处理到 seq，为该轮补充发送窗口
+      {"type": "cancel", "turn_id"}            取消进行中的一轮
+      {"type": "resume", "turn_id", "after_seq"}  重连后继续接收某一轮
+      {"type": "watch", "session_id"}          订阅会话的后台事件（发起或收到该会话的轮次时自动订阅）
+      {"type": "ping"}
+    服务端 -> 客户端：started / event（data 与 SSE 事件相同，event 为 "done" 表示本轮结束）/
+      session_event（如后台生成的 title_update）/ cancel_result / error / pong
+    """
+    await websocket.accept()
+    connection = _Connection(websocket)
+    logger.info(f"WebSocket connected: {connection.client}")
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                message = json.loads(raw)
+            except json.JSONDecodeError:
+                await connection.send({"type": "error", "message": "Invalid JSON"})
+                continue
+            if not isinstance(message, dict):
+                await connection.send({"type": "error", "message": "Message must be a JSON object"})
+                continue
+            try:
+                await connection.handle(message)
+            except (KeyError, TypeError, ValueError) as e:
+                await connection.send({"type": "error", "message": f"Invalid message: {e}"})
+    except WebSocketDisconnect:
+        logger.info(f"WebSocket disconnected: {connection.client}")
+    finally:
+        await connection.close()
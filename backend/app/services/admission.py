@@ -0,0 +1,166 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+import asyncio
+import logging
+import math
+import time
+
+from ..config import settings
+from .metrics import ADMISSION_ACTIVE, ADMISSION_QUEUE_DEPTH, ADMISSION_QUEUE_WAIT
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """请求未被准入：队列已满或排队超时"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """已获得的准入名额；release 可重复调用"""
+
+    def __init__(self, controller: "AdmissionController", key: str):
+        self._controller = controller
+        self.key = key
+        self.acquired_at = time.monotonic()
+        # 在等待队列中花费的时间，计入请求的分阶段耗时
+        self.queued_ms = 0.0
+        self.released = False
+
+    def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        self._controller._release(self)
+
+
+class _Waiter:
+    def __init__(self, key: str):
+        self.key = key
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class AdmissionController:
+    """
+    聊天接口准入控制：全局并发上限 + 每个用户/会话的并发上限，
+    超出时进入有界 FIFO 队列等待，队列满或等待超时返回拒绝（附 Retry-After 建议）。
+    """
+
+    def __init__(self, global_limit: int, per_key_limit: int, queue_size: int, queue_timeout: float):
+        self.global_limit = global_limit
+        self.per_key_limit = per_key_limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._per_key: Dict[str, int] = {}
+        self._waiters: Deque[_Waiter] = deque()
+        # 名额占用时长的 EWMA（秒），用于估算 Retry-After
+        self._hold_seconds = 5.0
+
+    def _can_admit(self, key: str) -> bool:
+        return self.active < self.global_limit and self._per_key.get(key, 0) < self.per_key_limit
+
+    def _admit(self, key: str) -> AdmissionTicket:
+        self.active += 1
+        self._per_key[key] = self._per_key.get(key, 0) + 1
+        ADMISSION_ACTIVE.set(self.active)
+        return AdmissionTicket(self, key)
+
+    def _retry_after(self) -> int:
+        backlog = (len(self._waiters) + 1) / max(self.global_limit, 1)
+        return max(1, math.ceil(self._hold_seconds * backlog))
+
+    async def acquire(self, key: str) -> AdmissionTicket:
+        started = time.monotonic()
+        # 没有排队者时直接准入，否则排到队尾，由 _dispatch 按 FIFO 放行可准入的请求
+        if not self._waiters and self._can_admit(key):
+            ADMISSION_QUEUE_WAIT.labels(outcome="admitted").observe(0)
+            return self._admit(key)
+
+        if len(self._waiters) >= self.queue_size:
+            ADMISSION_QUEUE_WAIT.labels(outcome="rejected").observe(0)
+            logger.warning(f"Admission queue full ({len(self._waiters)}), rejecting key={key}")
+            raise AdmissionRejected("queue_full", self._retry_after())
+
+        waiter = _Waiter(key)
+        self._waiters.append(waiter)
+        # 排队者可能都是停在单键上限上的，其他键有全局容量时应立即准入
+        self._dispatch()
+        try:
+            ticket = await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            ADMISSION_QUEUE_WAIT.labels(outcome="timeout").observe(time.monotonic() - started)
+            logger.warning(f"Admission wait timed out after {self.queue_timeout}s for key={key}")
+            raise AdmissionRejected("queue_timeout", self._retry_after())
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        ADMISSION_QUEUE_WAIT.labels(outcome="admitted").observe(time.monotonic() - started)
+        ticket.queued_ms = (time.monotonic() - started) * 1000
+        return ticket
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        """等待者放弃排队；若名额恰好已分配则立即归还"""
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        if waiter.future.done() and not waiter.future.cancelled():
+            waiter.future.result().release()
+        else:
+            waiter.future.cancel()
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters))
+
+    def _release(self, ticket: AdmissionTicket) -> None:
+        self.active -= 1
+        remaining = self._per_key.get(ticket.key, 1) - 1
+        if remaining:
+            self._per_key[ticket.key] = remaining
+        else:
+            self._per_key.pop(ticket.key, None)
+        held = time.monotonic() - ticket.acquired_at
+        self._hold_seconds += 0.2 * (held - self._hold_seconds)
+        ADMISSION_ACTIVE.set(self.active)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """按 FIFO 顺序唤醒可以准入的等待者（跳过已达到单键上限的）"""
+        for waiter in list(self._waiters):
+            if self.active >= self.global_limit:
+                break
+            if waiter.future.done() or not self._can_admit(waiter.key):
+                continue
+            self._waiters.remove(waiter)
+            waiter.future.set_result(self._admit(waiter.key))
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters))
+
+    @asynccontextmanager
+    async def slot(self, key: str) -> AsyncIterator[AdmissionTicket]:
+        ticket = await self.acquire(key)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "active": self.active,
+            "queued": len(self._waiters),
+            "global_limit": self.global_limit,
+            "per_key_limit": self.per_key_limit,
+        }
+
+
+# 全局聊天准入控制器
+chat_admission = AdmissionController(
+    global_limit=settings.CHAT_MAX_CONCURRENCY,
+    per_key_limit=settings.CHAT_MAX_CONCURRENCY_PER_KEY,
+    queue_size=settings.CHAT_QUEUE_SIZE,
+    queue_timeout=settings.CHAT_QUEUE_TIMEOUT,
+)
@@ -0,0 +1,47 @@
+from typing import Callable, List, Optional
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CancellationToken:
+    """
+    一轮对话的取消令牌：记录取消原因，并在取消时依次调用已注册的回调（如取消生成任务）。
+    只能取消一次，之后的 cancel 调用被忽略。
+    """
+
+    def __init__(self):
+        self.reason: Optional[str] = None
+        self.cancelled_at: Optional[float] = None
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self, reason: str) -> bool:
+        if self.cancelled:
+            return False
+        self.reason = reason
+        self.cancelled_at = time.monotonic()
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Cancellation callback failed: {e}")
+        return True
+
+    def add_callback(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """注册取消回调，返回注销函数；令牌已取消时立即调用"""
+        if self.cancelled:
+            callback()
+            return lambda: None
+        self._callbacks.append(callback)
+
+        def remove() -> None:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+        return remove
@@ -0,0 +1,71 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.automap import automap_base
+from sqlalchemy.orm import Session, sessionmaker
+import logging
+import threading
+
+from ..config import settings
+from .tracing import instrument_engine
+
+logger = logging.getLogger(__name__)
+
+# 只反射用到的表，避免启动时扫描整个库（Supabase 下 public 之外还有大量表）
+_TABLES = ("chat_sessions", "chat_messages")
+
+_lock = threading.RLock()
+_engine = None
+_session_factory = None
+_models = None
+
+
+def get_engine() -> Engine:
+    """进程内共享的数据库引擎，首次使用时创建（不会立即建立连接）"""
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                _engine = create_engine(settings.DATABASE_URL, echo=False)
+                instrument_engine(_engine)
+    return _engine
+
+
+def models():
+    """automap 反射出的表模型（models().chat_sessions / models().chat_messages），整个进程只反射一次"""
+    global _models
+    if _models is None:
+        with _lock:
+            if _models is None:
+                base = automap_base()
+                base.prepare(autoload_with=get_engine(), reflection_options={"only": list(_TABLES)})
+                _models = base.classes
+    return _models
+
+
+def open_session() -> Session:
+    """新建一个 ORM 会话，用法同原来的 SessionLocal()：with open_session() as db_session"""
+    global _session_factory
+    if _session_factory is None:
+        with _lock:
+            if _session_factory is None:
+                _session_factory = sessionmaker(bind=get_engine(), expire_on_commit=False)
+    return _session_factory()
+
+
+def warm_up(connections: int) -> None:
+    """在线程池中调用：完成表反射，并预先建立若干连接放回连接池，首个请求不再付出握手开销"""
+    models()
+    engine = get_engine()
+    size = getattr(engine.pool, "size", None)
+    if callable(size):
+        connections = min(connections, size())
+    opened = []
+    try:
+        for _ in range(max(connections, 1)):
+            connection = engine.connect()
+            opened.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in opened:
+            connection.close()
+    logger.info(f"Database warmed up: {len(opened)} pooled connection(s)")
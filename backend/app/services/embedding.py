@@ -0,0 +1,123 @@
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+import asyncio
+import hashlib
+import logging
+import time
+
+import numpy as np
+
+from ..config import settings
+from .metrics import EMBEDDING_SECONDS, EMBEDDING_TEXTS
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """按 (模型, 文本) 缓存向量的 LRU"""
+
+    def __init__(self, max_items: int = 50000):
+        self.max_items = max_items
+        self._items: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha1(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        vec = self._items.get(key)
+        if vec is not None:
+            self._items.move_to_end(key)
+        return vec
+
+    def put(self, key: str, vec: np.ndarray) -> None:
+        self._items[key] = vec
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+
+class EmbeddingClient:
+    """OpenAI 兼容的批量嵌入客户端，配置与 mem0 一致（优先使用向量大模型配置）"""
+
+    def __init__(self):
+        self.model = settings.EMBEDDING_MODEL or "text-embedding-3-small"
+        self.cache = EmbeddingCache(max_items=settings.EMBEDDING_CACHE_SIZE)
+        self._client = None
+
+    @property
+    def available(self) -> bool:
+        return bool(settings.EMBEDDING_API_KEY or settings.LLM_API_KEY)
+
+    def _get_client(self):
+        if self._client is None:
+            from openai import AsyncOpenAI
+
+            api_key = settings.EMBEDDING_API_KEY or settings.LLM_API_KEY
+            base_url = settings.EMBEDDING_API_BASE or settings.LLM_API_BASE or None
+            self._client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+        return self._client
+
+    async def warm_up(self) -> bool:
+        """启动预热：在线程池中创建客户端（含 openai 的导入），再请求一次 /models 建立连接"""
+        if not self.available:
+            return False
+        client = await asyncio.to_thread(self._get_client)
+        try:
+            await client.models.list()
+        except Exception as e:
+            # 部分嵌入服务不提供 /models，客户端已创建即可
+            logger.info(f"Embedding endpoint warm-up request failed: {e}")
+        return True
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """批量嵌入，返回 L2 归一化后的 (n, dim) 矩阵；命中缓存的文本不会重复请求"""
+        keys = [EmbeddingCache.key(self.model, t) for t in texts]
+        vectors: List[Optional[np.ndarray]] = [self.cache.get(k) for k in keys]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        EMBEDDING_TEXTS.labels(source="cache").inc(len(texts) - len(missing))
+        EMBEDDING_TEXTS.labels(source="remote").inc(len(missing))
+
+        batch_size = settings.EMBEDDING_BATCH_SIZE
+        for start in range(0, len(missing), batch_size):
+            chunk = missing[start:start + batch_size]
+            started = time.perf_counter()
+            try:
+                response = await self._get_client().embeddings.create(
+                    model=self.model,
+                    input=[texts[i] for i in chunk],
+                )
+            except Exception:
+                EMBEDDING_SECONDS.labels(outcome="error").observe(time.perf_counter() - started)
+                raise
+            EMBEDDING_SECONDS.labels(outcome="ok").observe(time.perf_counter() - started)
+            for i, item in zip(chunk, sorted(response.data, key=lambda d: d.index)):
+                vec = np.asarray(item.embedding, dtype=np.float32)
+                vec /= np.linalg.norm(vec) or 1.0
+                vectors[i] = vec
+                self.cache.put(keys[i], vec)
+
+        if missing:
+            logger.debug(f"Embedded {len(missing)} texts ({len(texts) - len(missing)} cached)")
+        if not vectors:
+            return np.zeros((0, settings.EMBEDDING_DIM), dtype=np.float32)
+        return np.vstack(vectors)
+
+
+def cosine_top_k(queries: np.ndarray, matrix: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+    """对已归一化的向量做矩阵化余弦检索，返回每个查询的 [(行号, 分数)]"""
+    if not len(queries) or not len(matrix):
+        return [[] for _ in range(len(queries))]
+    scores = queries @ matrix.T
+    k = min(k, matrix.shape[0])
+    # argpartition 取前 k，再只对这 k 个排序
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    results = []
+    for row, idx in enumerate(top):
+        order = idx[np.argsort(-scores[row, idx])]
+        results.append([(int(i), float(scores[row, i])) for i in order])
+    return results
+
+
+# 全局嵌入客户端实例
+embedding_client = EmbeddingClient()
@@ -0,0 +1,140 @@
+from collections import Counter, OrderedDict
+from typing import Dict, Any, List, Tuple, Iterable, Optional, Sequence, Hashable
+import math
+import re
+
+
+_WORD_RE = re.compile(r"[a-z0-9_]+|[一-鿿]+")
+_CJK_RE = re.compile(r"[一-鿿]")
+
+
+def tokenize(text: str) -> List[str]:
+    """分词：英文/数字按单词切分，中文按字二元组（单字串保留单字）"""
+    tokens: List[str] = []
+    for run in _WORD_RE.findall(text.lower()):
+        if not _CJK_RE.match(run):
+            tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def rrf_fuse(rankings: Sequence[Sequence[Hashable]], k: int = 60, limit: Optional[int] = None) -> List[Hashable]:
+    """倒数排名融合（Reciprocal Rank Fusion），输入为若干按相关性排序的结果列表"""
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+    fused = sorted(scores, key=lambda key: scores[key], reverse=True)
+    return fused[:limit] if limit else fused
+
+
+class BM25Index:
+    """单个用户记忆文本的 BM25 倒排索引，支持增量增删改"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._docs: Dict[str, Tuple[Counter, int, str]] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, doc_id: str, text: str) -> None:
+        """新增或替换文档"""
+        if doc_id in self._docs:
+            self.remove(doc_id)
+        tf = Counter(tokenize(text))
+        length = sum(tf.values())
+        self._docs[doc_id] = (tf, length, text)
+        self._total_len += length
+        for term, count in tf.items():
+            self._postings.setdefault(term, {})[doc_id] = count
+
+    def remove(self, doc_id: str) -> None:
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        tf, length, _ = doc
+        self._total_len -= length
+        for term in tf:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(doc_id, None)
+            if not posting:
+                del self._postings[term]
+
+    def text(self, doc_id: str) -> Optional[str]:
+        doc = self._docs.get(doc_id)
+        return doc[2] if doc else None
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """返回 [(doc_id, score)]，按得分降序"""
+        n_docs = len(self._docs)
+        if not n_docs:
+            return []
+        avgdl = self._total_len / n_docs or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if not posting:
+                continue
+            df = len(posting)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in posting.items():
+                length = self._docs[doc_id][1]
+                denom = tf + self.k1 * (1 - self.b + self.b * length / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / denom
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit]
+
+
+class MemoryLexicalIndex:
+    """
+    按用户维护 BM25 索引；未加载的用户在首次检索前需调用 load（传入该用户的全部记忆），
+    之后由记忆变更钩子增量维护。最多保留 max_users 个用户的索引（LRU）。
+    """
+
+    def __init__(self, max_users: int = 1000):
+        self.max_users = max(max_users, 1)
+        self._indexes: "OrderedDict[str, BM25Index]" = OrderedDict()
+
+    def has(self, user_id: str) -> bool:
+        return user_id in self._indexes
+
+    def load(self, user_id: str, memories: Iterable[Dict[str, Any]]) -> BM25Index:
+        index = BM25Index()
+        for mem in memories:
+            if mem.get("id") and mem.get("memory"):
+                index.add(mem["id"], mem["memory"])
+        self._indexes[user_id] = index
+        self._indexes.move_to_end(user_id)
+        while len(self._indexes) > self.max_users:
+            self._indexes.popitem(last=False)
+        return index
+
+    def upsert(self, user_id: str, memory_id: str, text: str) -> None:
+        index = self._indexes.get(user_id)
+        if index is not None and text:
+            index.add(memory_id, text)
+
+    def remove(self, user_id: str, memory_id: str) -> None:
+        index = self._indexes.get(user_id)
+        if index is not None:
+            index.remove(memory_id)
+
+    def search(self, user_id: str, query: str, limit: int = 5) -> List[str]:
+        """返回命中的记忆文本，按相关性排序"""
+        index = self._indexes.get(user_id)
+        if index is None:
+            return []
+        self._indexes.move_to_end(user_id)
+        return [index.text(doc_id) for doc_id, _ in index.search(query, limit)]
+
+    def invalidate(self, user_id: str) -> None:
+        self._indexes.pop(user_id, None)
@@ -0,0 +1,207 @@
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+
+from ..config import settings
+from .metrics import EVENT_LOOP_BLOCKED_SECONDS, EVENT_LOOP_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_BACKEND_ROOT = str(Path(__file__).resolve().parents[2]) + os.sep
+_APP_ROOT = str(Path(__file__).resolve().parents[1]) + os.sep
+
+Frame = Tuple[str, int, str]
+
+
+def short_path(filename: str) -> str:
+    """应用内文件取相对 backend 的路径，第三方库取 site-packages 之后的部分"""
+    if filename.startswith(_BACKEND_ROOT):
+        return filename[len(_BACKEND_ROOT):]
+    marker = "site-packages" + os.sep
+    index = filename.rfind(marker)
+    if index >= 0:
+        return filename[index + len(marker):]
+    return filename
+
+
+def frame_stack(frame, limit: int = 64) -> List[Frame]:
+    """从最内层 frame 向外展开，返回由外到内的 (文件, 行号, 函数) 列表"""
+    stack = []
+    while frame is not None and len(stack) < limit:
+        stack.append((frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def collapse(stack: List[Frame]) -> str:
+    """折叠栈格式（flamegraph.pl / speedscope 可直接读取）的一行，不含计数"""
+    return ";".join(f"{function} ({short_path(filename)}:{lineno})" for filename, lineno, function in stack)
+
+
+class LoopMonitor:
+    """
+    事件循环看门狗：
+    - 循环内的定时任务每 LOOP_MONITOR_INTERVAL_MS 醒来一次，实际醒来时间与预期之差即循环延迟，
+      记入 event_loop_lag_seconds；超过 LOOP_BLOCK_THRESHOLD_MS 的记为一次阻塞（event_loop_blocked_seconds）；
+    - 独立线程每 LOOP_STACK_SAMPLE_MS 检查一次心跳，循环超过阈值仍未回来时对循环线程的调用栈采样，
+      按"应用内最内层调用点 + 实际阻塞的函数"归并，供 /api/debug/loop 查看最常阻塞的位置。
+    采样线程只在循环已阻塞时读取栈，正常运行时的开销是每个间隔一次定时器唤醒。
+    """
+
+    def __init__(self, interval: float, threshold: float, sample_interval: float, max_sites: int,
+                 max_samples_per_stall: int = 50):
+        self.interval = interval
+        self.threshold = threshold
+        self.sample_interval = sample_interval
+        self.max_sites = max_sites
+        self.max_samples_per_stall = max_samples_per_stall
+        self._lags: Deque[float] = deque(maxlen=600)
+        self._sites: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._beat = time.monotonic()
+        self._stall_id: Optional[float] = None
+        self._stall_samples = 0
+        self._stalls = 0
+        self._blocked_seconds = 0.0
+        self._max_stall = 0.0
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """在事件循环中调用"""
+        if self.running:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Event loop monitor started: interval={self.interval * 1000:.0f}ms, "
+                    f"block threshold={self.threshold * 1000:.0f}ms")
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    async def _tick(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            self._beat = now
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+            self._lags.append(lag)
+            if lag >= self.threshold:
+                EVENT_LOOP_BLOCKED_SECONDS.observe(lag)
+                with self._lock:
+                    self._stalls += 1
+                    self._blocked_seconds += lag
+                    self._max_stall = max(self._max_stall, lag)
+                # 用 % 参数而非 f-string，使重复的阻塞告警按同一模板限流
+                logger.warning("Event loop blocked for %.0fms", lag * 1000)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.sample_interval):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.threshold:
+                continue
+            if beat != self._stall_id:
+                # 新的一次阻塞：第一次采样代表阈值以内已经过去的时间
+                self._stall_id = beat
+                self._stall_samples = 0
+                weight = stalled
+            else:
+                weight = self.sample_interval
+            if self._stall_samples >= self.max_samples_per_stall:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            self._stall_samples += 1
+            self._record(frame_stack(frame), weight, first=self._stall_samples == 1)
+            del frame
+
+    def _record(self, stack: List[Frame], weight: float, first: bool) -> None:
+        app_frames = [f for f in stack if f[0].startswith(_APP_ROOT) and f[0] != __file__]
+        # 栈上没有应用代码时（如第三方回调）退而取阻塞函数的调用者
+        site = app_frames[-1] if app_frames else (stack[-2] if len(stack) > 1 else ("?", 0, "?"))
+        leaf = stack[-1] if stack else site
+        key = (f"{short_path(site[0])}:{site[1]} {site[2]}", f"{short_path(leaf[0])}:{leaf[1]} {leaf[2]}")
+        with self._lock:
+            entry = self._sites.get(key)
+            if entry is None:
+                if len(self._sites) >= self.max_sites:
+                    smallest = min(self._sites, key=lambda k: self._sites[k]["blocked_seconds"])
+                    del self._sites[smallest]
+                entry = self._sites[key] = {"samples": 0, "stalls": 0, "blocked_seconds": 0.0, "stack": ""}
+            entry["samples"] += 1
+            entry["stalls"] += 1 if first else 0
+            entry["blocked_seconds"] += weight
+            entry["last_seen"] = time.time()
+            entry["stack"] = collapse(stack)
+
+    def report(self, limit: int = 20) -> Dict[str, Any]:
+        lags = sorted(self._lags)
+
+        def pct(p: float) -> float:
+            return round(lags[min(len(lags) - 1, int(p * len(lags)))] * 1000, 2) if lags else 0.0
+
+        with self._lock:
+            sites = sorted(self._sites.items(), key=lambda item: item[1]["blocked_seconds"], reverse=True)[:limit]
+            top = [
+                {"site": site, "blocking_call": leaf, **{k: round(v, 4) if isinstance(v, float) else v for k, v in entry.items()}}
+                for (site, leaf), entry in sites
+            ]
+            summary = {
+                "stalls": self._stalls,
+                "blocked_seconds": round(self._blocked_seconds, 3),
+                "max_stall_ms": round(self._max_stall * 1000, 1),
+            }
+        stalled = time.monotonic() - self._beat - self.interval
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "lag_ms": {"p50": pct(0.5), "p99": pct(0.99), "max": pct(1.0), "window": len(lags)},
+            "current_stall_ms": round(stalled * 1000, 1) if self.running and stalled >= self.threshold else 0.0,
+            **summary,
+            "top_sites": top,
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._sites.clear()
+            self._stalls = 0
+            self._blocked_seconds = 0.0
+            self._max_stall = 0.0
+        self._lags.clear()
+
+
+loop_monitor = LoopMonitor(
+    interval=settings.LOOP_MONITOR_INTERVAL_MS / 1000,
+    threshold=settings.LOOP_BLOCK_THRESHOLD_MS / 1000,
+    sample_interval=settings.LOOP_STACK_SAMPLE_MS / 1000,
+    max_sites=settings.LOOP_MAX_SITES,
+)
@@ -1,19 +1,83 @@
-from typing import List, Dict, Any, Optional
-from mem0 import Memory
+from typing import List, Dict, Any, Optional, AsyncIterator
 from ..config import settings
+from .memory_profile import MemoryProfileCache, UserProfile
+from .lexical_index import MemoryLexicalIndex, rrf_fuse
+from .memory_changes import MemoryChangeLog
+from .embedding import embedding_client, cosine_top_k
+from .metrics import MEMORY_RETRIEVAL_SECONDS
+from .timing import record_stage, stage
+from .tracing import tracer
+from ..lang.llm_pool import llm_pool
+from ..lang.scheduler import Priority
+from datetime import datetime
+import asyncio
 import logging
+import hashlib
 import json
 import os
+import threading
+import time
+import uuid
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+def _api_config_summary() -> str:
+    """排查 mem0 调用失败用的单行配置摘要（不含密钥）"""
+    return (f"base_url={os.getenv('OPENAI_BASE_URL', 'unset')}, api_key={'set' if os.getenv('OPENAI_API_KEY') else 'unset'}, "
+            f"embedding_model={os.getenv('OPENAI_EMBEDDING_MODEL', 'unset')}, chat_model={settings.LLM_MODEL_CHAT}")
+
+
+# mem0 向量库 payload 中的保留字段，其余字段视为用户 metadata
+_PAYLOAD_RESERVED_KEYS = {"data", "hash", "created_at", "updated_at", "user_id", "agent_id", "run_id", "actor_id", "role"}
+
 
 class MemoryManager:
     """记忆管理器，使用 mem0 管理用户记忆"""
     
     def __init__(self):
-        self.memory: Optional[Memory] = None
-        self._initialize_memory()
+        # mem0 实例在首次访问 memory 时才初始化，见 memory 属性
+        self._memory: Optional[Any] = None
+        self._memory_state = "new"
+        self._init_lock = threading.RLock()
+        self.profile_cache = MemoryProfileCache(
+            max_items=settings.MEMORY_PROFILE_MAX_ITEMS,
+            ttl=settings.MEMORY_PROFILE_TTL,
+            max_users=settings.MEMORY_PROFILE_MAX_USERS,
+        )
+        self.lexical_index = MemoryLexicalIndex(max_users=settings.MEMORY_PROFILE_MAX_USERS)
+        self.change_log = MemoryChangeLog(
+            max_entries=settings.MEMORY_CHANGE_LOG_SIZE, max_users=settings.MEMORY_CHANGE_LOG_USERS
+        )
+        # 向量检索耗时的 EWMA（毫秒），auto 模式据此决定是否只走倒排索引
+        self._vector_latency_ms: Optional[float] = None
+        self._last_vector_probe = 0.0
+    
+    @property
+    def memory(self) -> Optional[Any]:
+        """
+        mem0 实例；首次访问时初始化（导入 mem0、连接向量库并重建集合，耗时较长），
+        服务启动时由 warm_up 在线程池中提前完成，请求路径上通常不会触发。初始化失败时为 None。
+        """
+        if self._memory_state != "ready":
+            with self._init_lock:
+                # 初始化过程中同一线程再次访问时直接返回正在构建的实例
+                if self._memory_state == "new":
+                    self._memory_state = "initializing"
+                    try:
+                        self._initialize_memory()
+                    finally:
+                        self._memory_state = "ready"
+        return self._memory
+    
+    @memory.setter
+    def memory(self, value: Optional[Any]) -> None:
+        self._memory = value
+    
+    def warm_up(self) -> bool:
+        """在线程池中调用：完成 mem0 初始化，返回是否可用"""
+        return self.memory is not None
     
     def _initialize_memory(self):
         """初始化 mem0"""
@@ -61,6 +125,9 @@ class MemoryManager:
         logger.info(f"========================")
         
         try:
+            # mem0 会连带导入向量库与模型客户端，推迟到首次使用
+            from mem0 import Memory
+            
             # 使用简化的配置，让 Mem0 使用默认设置
             if settings.MEM0_API_KEY:
                 # 使用 Mem0 API 模式
@@ -136,26 +203,13 @@ class MemoryManager:
     
     async def extract_key_memories(self, user_input: str, assistant_reply: str) -> List[Dict[str, Any]]:
         """使用 LLM 提取关键记忆信息"""
-        if not self.memory or not settings.LLM_API_KEY:
-            logger.warning("Memory or LLM_API_KEY not available, skipping memory extraction")
+        if not self.memory or not llm_pool.available:
+            logger.warning("Memory or LLM endpoint not available, skipping memory extraction")
             return []
         
         try:
-            from langchain_openai import ChatOpenAI
             from langchain_core.messages import HumanMessage
             
-            # 初始化 LLM 用于提取
-            llm_kwargs = {
-                "model": settings.LLM_MODEL_CHAT,
-                "temperature": 0.3,  # 降低温度以获得更稳定的提取
-            }
-            if settings.LLM_API_BASE:
-                llm_kwargs["base_url"] = settings.LLM_API_BASE
-            if settings.LLM_API_KEY:
-                llm_kwargs["api_key"] = settings.LLM_API_KEY
-            
-            extract_llm = ChatOpenAI(**llm_kwargs)
-            
             prompt = f"""请分析以下对话，提取值得记忆的关键信息。只提取以下类型的信息：
 1. 用户偏好（喜欢的、不喜欢的）
 2. 个人事实（姓名、职业、位置、兴趣等）
@@ -179,15 +233,16 @@ class MemoryManager:
 
 只返回 JSON 数组，不要其他文字："""
             
-            logger.info(f"Extracting memories from conversation: user_input={user_input[:50]}...")
+            logger.debug(f"Extracting memories from conversation: input_length={len(user_input)}")
             messages = [HumanMessage(content=prompt)]
-            response = await extract_llm.ainvoke(messages)
+            # 记忆提取是后台任务：以最低优先级排队，降低温度以获得更稳定的提取
+            content = await llm_pool.ainvoke(messages, settings.LLM_MODEL_CHAT, temperature=0.3, priority=Priority.BACKGROUND)
             
-            logger.info(f"Memory extraction response: {response.content[:200]}...")
+            logger.debug(f"Memory extraction response length: {len(content)}")
             
             # 解析 JSON 响应
             try:
-                content = response.content.strip()
+                content = content.strip()
                 # 移除可能的 markdown 代码块标记
                 if content.startswith("```"):
                     parts = content.split("```")
@@ -206,8 +261,8 @@ class MemoryManager:
                 logger.warning(f"Extracted memories is not a list: {type(memories)}")
                 return []
             except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse memory extraction JSON: {e}")
-                logger.error(f"Response content: {response.content}")
+                logger.warning(f"Failed to parse memory extraction JSON: {e}")
+                logger.debug(f"Unparsable extraction response: {content[:500]}")
                 # 尝试直接提取关键信息作为fallback
                 if "喜欢" in user_input or "不喜欢" in user_input or "偏好" in user_input.lower():
                     logger.info("Fallback: extracting preference from user input")
@@ -218,21 +273,11 @@ class MemoryManager:
                     }]
                 return []
         except Exception as e:
-            # 打印当前配置信息用于调试
-            logger.error(f"=== 记忆提取失败时的配置信息 ===")
-            logger.error(f"API Base URL: {os.getenv('OPENAI_BASE_URL', 'Not set')}")
-            logger.error(f"API Key: {'Set' if os.getenv('OPENAI_API_KEY') else 'Not set'}")
-            logger.error(f"Embedding Model: {os.getenv('OPENAI_EMBEDDING_MODEL', 'Not set')}")
-            logger.error(f"Chat Model: {settings.LLM_MODEL_CHAT}")
-            logger.error(f"Conversation: {conversation[:100]}...")
-            logger.error(f"User ID: {user_id}")
-            logger.error(f"=====================================")
-            
             # 如果是连接错误或认证错误，记录警告但不抛出异常
             if "Connection error" in str(e) or "Invalid token" in str(e) or "API" in str(e):
-                logger.warning(f"Memory extraction failed due to API issues, skipping: {e}")
+                logger.warning(f"Memory extraction failed due to API issues, skipping: {e} ({_api_config_summary()})")
             else:
-                logger.error(f"Failed to extract memories: {e}", exc_info=True)
+                logger.error(f"Failed to extract memories: {e} ({_api_config_summary()})", exc_info=True)
             return []
     
     async def get_all_memories(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
@@ -273,45 +318,300 @@ class MemoryManager:
             logger.error(f"Failed to get all memories: {e}", exc_info=True)
             return []
     
-    async def get_relevant_memories(self, query: str, user_id: str, limit: int = 5) -> List[str]:
-        """获取相关记忆"""
+    def _scrollable_store(self):
+        """本地模式下返回支持分页遍历的 Qdrant 客户端，否则返回 None"""
+        vector_store = getattr(self.memory, "vector_store", None)
+        client = getattr(vector_store, "client", None)
+        if client is not None and hasattr(client, "scroll") and hasattr(self.memory, "collection_name"):
+            return client
+        return None
+    
+    async def iter_memories(self, user_id: str, page_size: int = 256, include_vectors: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """
+        逐页遍历用户的全部记忆，内存占用与记忆总量无关。
+        本地模式直接分页扫描 Qdrant；API 模式退化为一次 get_all（受 MEMORY_EXPORT_FALLBACK_LIMIT 限制）。
+        """
+        if not self.memory:
+            return
+        
+        client = self._scrollable_store()
+        if client is None:
+            logger.warning("Vector store does not support scrolling, falling back to get_all for export")
+            for mem in await self.get_all_memories(user_id=user_id, limit=settings.MEMORY_EXPORT_FALLBACK_LIMIT):
+                if isinstance(mem, dict):
+                    yield mem
+            return
+        
+        from qdrant_client.models import Filter, FieldCondition, MatchValue
+        
+        scroll_filter = Filter(must=[FieldCondition(key="user_id", match=MatchValue(value=user_id))])
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=self.memory.collection_name,
+                scroll_filter=scroll_filter,
+                limit=page_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=include_vectors,
+            )
+            for point in points:
+                payload = point.payload or {}
+                record = {
+                    "id": str(point.id),
+                    "memory": payload.get("data", ""),
+                    "metadata": {k: v for k, v in payload.items() if k not in _PAYLOAD_RESERVED_KEYS},
+                    "created_at": payload.get("created_at"),
+                    "updated_at": payload.get("updated_at"),
+                }
+                if include_vectors and point.vector is not None:
+                    record["vector"] = list(point.vector)
+                    record["embedding_model"] = settings.EMBEDDING_MODEL
+                yield record
+            if offset is None:
+                break
+    
+    async def import_memories(self, records: List[Dict[str, Any]], user_id: str) -> Dict[str, int]:
+        """
+        批量导入一批记忆（不经过 LLM 提取）。本地模式下对缺少可复用向量的文本做一次批量嵌入，
+        再整批写入向量库；导入的记忆总是分配新的 id。
+        API 模式没有可直接写入的向量库，嵌入由 mem0 服务端在每次 add 时完成，无法合并为一次批量嵌入，
+        只能逐条调用 memory.add(infer=False)；这些调用放到线程中、以 MEMORY_IMPORT_API_CONCURRENCY 的并发执行。
+        """
+        records = [r for r in records if isinstance(r, dict) and r.get("memory")]
+        if not self.memory or not records:
+            return {"imported": 0, "failed": 0}
+        
+        client = self._scrollable_store()
+        if client is None:
+            semaphore = asyncio.Semaphore(max(settings.MEMORY_IMPORT_API_CONCURRENCY, 1))
+            
+            def add(rec: Dict[str, Any]):
+                metadata = rec.get("metadata") or {}
+                try:
+                    return self.memory.add(rec["memory"], user_id=user_id, metadata=metadata, infer=False)
+                except TypeError:
+                    # 旧版本 mem0 不支持 infer 参数
+                    return self.memory.add(rec["memory"], user_id=user_id, metadata=metadata)
+            
+            async def import_one(rec: Dict[str, Any]) -> bool:
+                async with semaphore:
+                    try:
+                        result = await asyncio.to_thread(add, rec)
+                        if result:
+                            self._apply_add_result(result, user_id, rec["memory"], rec.get("metadata") or {})
+                            return True
+                    except Exception as e:
+                        logger.warning(f"Failed to import memory: {e}")
+                return False
+            
+            imported = sum(await asyncio.gather(*(import_one(rec) for rec in records)))
+            return {"imported": imported, "failed": len(records) - imported}
+        
+        # 向量维度与当前嵌入模型一致时直接复用导出的向量
+        reusable = [
+            rec.get("vector") is not None
+            and rec.get("embedding_model") == settings.EMBEDDING_MODEL
+            and len(rec["vector"]) == settings.EMBEDDING_DIM
+            for rec in records
+        ]
+        to_embed = [rec["memory"] for rec, ok in zip(records, reusable) if not ok]
+        embedded = iter((await embedding_client.embed(to_embed)).tolist()) if to_embed else iter(())
+        
+        now = datetime.now().isoformat()
+        vectors, payloads, ids = [], [], []
+        for rec, ok in zip(records, reusable):
+            metadata = rec.get("metadata") or {}
+            payload = {k: v for k, v in metadata.items() if k not in _PAYLOAD_RESERVED_KEYS}
+            payload.update({
+                "data": rec["memory"],
+                "hash": hashlib.md5(rec["memory"].encode("utf-8")).hexdigest(),
+                "created_at": rec.get("created_at") or now,
+                "user_id": user_id,
+            })
+            if rec.get("updated_at"):
+                payload["updated_at"] = rec["updated_at"]
+            # 不沿用导出文件里的 id：vector_store.insert 是 upsert，沿用会覆盖同一向量库中其他用户的记忆
+            memory_id = str(uuid.uuid4())
+            vectors.append(rec["vector"] if ok else next(embedded))
+            payloads.append(payload)
+            ids.append(memory_id)
+        
+        self.memory.vector_store.insert(vectors=vectors, payloads=payloads, ids=ids)
+        for memory_id, rec in zip(ids, records):
+            self._on_memory_changed("ADD", memory_id, user_id=user_id, text=rec["memory"], metadata=rec.get("metadata") or {})
+        return {"imported": len(ids), "failed": 0}
+    
+    async def get_relevant_memories(self, query: str, user_id: str, limit: int = 5, mode: Optional[str] = None) -> List[str]:
+        """获取相关记忆，mode 可选 vector / lexical / hybrid / auto，默认取 MEMORY_RETRIEVAL_MODE"""
         if not self.memory:
             logger.debug("Memory instance is None, returning empty list")
             return []
         
+        mode = mode or settings.MEMORY_RETRIEVAL_MODE
+        if mode == "auto":
+            mode = "lexical" if self._vector_is_slow() else "hybrid"
+        if mode not in ("vector", "lexical"):
+            mode = "hybrid"
+        
+        started = time.perf_counter()
+        with tracer.start_as_current_span("memory.retrieve", attributes={"memory.mode": mode, "memory.limit": limit}) as span:
+            try:
+                results = await self._retrieve(query, user_id, limit, mode)
+            finally:
+                elapsed = time.perf_counter() - started
+                MEMORY_RETRIEVAL_SECONDS.labels(mode=mode).observe(elapsed)
+                record_stage("memory_search", elapsed * 1000)
+            span.set_attribute("memory.results", len(results))
+            return results
+    
+    async def _retrieve(self, query: str, user_id: str, limit: int, mode: str) -> List[str]:
+        if mode == "vector":
+            return await self._vector_search(query, user_id, limit)
+        
+        if mode == "lexical":
+            return await self._lexical_search(query, user_id, limit)
+        
+        vector, lexical = await asyncio.gather(
+            self._vector_search(query, user_id, limit),
+            self._lexical_search(query, user_id, limit),
+        )
+        return rrf_fuse([vector, lexical], k=settings.MEMORY_RRF_K, limit=limit)
+    
+    async def _lexical_search(self, query: str, user_id: str, limit: int) -> List[str]:
+        await self._ensure_user_snapshot(user_id)
+        lexical = self.lexical_index.search(user_id, query, limit=limit)
+        logger.debug(f"Lexical search returned {len(lexical)} memories")
+        return lexical
+    
+    async def batch_search(self, queries: List[str], user_id: str, limit: int = 10) -> Dict[str, Any]:
+        """
+        批量检索：一次拉取用户记忆（本地模式连同向量库中已存的向量），只对查询与缺少可用向量的记忆文本
+        做一次嵌入调用，再用矩阵运算完成所有查询的相似度计算。返回每个查询的结果及各阶段耗时。
+        """
+        timings: Dict[str, float] = {}
+        scan_limit = settings.MEMORY_BATCH_SEARCH_SCAN_LIMIT
+        
+        started = time.perf_counter()
+        if self._scrollable_store() is not None:
+            memories = []
+            async for mem in self.iter_memories(user_id, page_size=min(scan_limit, 256), include_vectors=True):
+                if mem.get("memory"):
+                    memories.append(mem)
+                    if len(memories) >= scan_limit:
+                        break
+        else:
+            memories = await self.get_all_memories(user_id=user_id, limit=scan_limit)
+            memories = [m for m in memories if isinstance(m, dict) and m.get("memory")]
+        stored = [self._stored_vector(m) for m in memories]
+        timings["load"] = (time.perf_counter() - started) * 1000
+        
+        started = time.perf_counter()
+        to_embed = [m["memory"] for m, vec in zip(memories, stored) if vec is None]
+        vectors = await embedding_client.embed(list(queries) + to_embed) if memories else None
+        timings["embed"] = (time.perf_counter() - started) * 1000
+        
+        started = time.perf_counter()
+        if vectors is not None:
+            embedded = iter(vectors[len(queries):])
+            matrix = np.vstack([vec if vec is not None else next(embedded) for vec in stored])
+            ranked = cosine_top_k(vectors[:len(queries)], matrix, limit)
+        else:
+            ranked = [[] for _ in queries]
+        timings["search"] = (time.perf_counter() - started) * 1000
+        
+        public = [{k: v for k, v in m.items() if k not in ("vector", "embedding_model")} for m in memories]
+        results = [
+            {"query": query, "memories": [dict(public[i], score=score) for i, score in hits]}
+            for query, hits in zip(queries, ranked)
+        ]
+        logger.debug(
+            f"Batch search for user_id={user_id}: {len(queries)} queries over {len(memories)} memories, "
+            f"timings={timings}"
+        )
+        return {"results": results, "timings_ms": timings, "memory_count": len(memories)}
+    
+    @staticmethod
+    def _stored_vector(mem: Dict[str, Any]) -> Optional[np.ndarray]:
+        """向量库中已存的向量（与当前嵌入模型、维度一致时），归一化后返回；不可用返回 None"""
+        vector = mem.get("vector")
+        if vector is None or mem.get("embedding_model") != settings.EMBEDDING_MODEL or len(vector) != settings.EMBEDDING_DIM:
+            return None
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else None
+    
+    def _vector_is_slow(self) -> bool:
+        """向量检索 EWMA 超过阈值时视为慢；每隔一段时间仍放行一次探测以便恢复"""
+        if self._vector_latency_ms is None:
+            return False
+        if self._vector_latency_ms <= settings.MEMORY_LEXICAL_FALLBACK_MS:
+            return False
+        now = time.monotonic()
+        if now - self._last_vector_probe >= settings.MEMORY_VECTOR_PROBE_INTERVAL:
+            self._last_vector_probe = now
+            return False
+        return True
+    
+    def _record_vector_latency(self, elapsed_ms: float):
+        if self._vector_latency_ms is None:
+            self._vector_latency_ms = elapsed_ms
+        else:
+            self._vector_latency_ms = 0.8 * self._vector_latency_ms + 0.2 * elapsed_ms
+    
+    async def _ensure_user_snapshot(self, user_id: str):
+        """
+        确保画像缓存与倒排索引已加载该用户的全部记忆。倒排索引只在首次使用时全量加载，
+        之后由 _on_memory_changed 增量维护；画像 TTL 到期时单独重建。
+        """
+        need_profile = self.profile_cache.get(user_id) is None
+        need_lexical = not self.lexical_index.has(user_id)
+        if not need_profile and not need_lexical:
+            return
+        
+        if self._scrollable_store() is not None:
+            # 本地模式逐页读取全部记忆；分页按 id 返回，按创建时间排序使较新的记忆在画像中靠前
+            memories = [mem async for mem in self.iter_memories(user_id)]
+            memories.sort(key=lambda m: str(m.get("created_at") or ""))
+            complete = True
+        else:
+            scan_limit = settings.MEMORY_PROFILE_SCAN_LIMIT
+            memories = await self.get_all_memories(user_id=user_id, limit=scan_limit)
+            memories = [m for m in memories if isinstance(m, dict)]
+            # 触达扫描上限时无法确认是否还有更多记忆，画像标记为不完整
+            complete = len(memories) < scan_limit
+        if need_profile:
+            self.profile_cache.load(user_id, memories, complete=complete)
+        if need_lexical:
+            self.lexical_index.load(user_id, memories)
+    
+    async def _vector_search(self, query: str, user_id: str, limit: int = 5) -> List[str]:
+        """向量检索相关记忆"""
         try:
             logger.debug(f"Searching memories: query={query[:50]}..., user_id={user_id}, limit={limit}")
             # 直接调用，不使用线程池执行器，避免 SQLite 线程安全问题
+            started = time.perf_counter()
             memories = self.memory.search(query=query, user_id=user_id, limit=limit)
+            self._record_vector_latency((time.perf_counter() - started) * 1000)
             
             logger.debug(f"Search returned: {type(memories)}, content preview: {str(memories)[:200]}")
             
-            if memories and "memories" in memories:
-                # 提取记忆文本
-                result = [mem.get("memory", "") for mem in memories["memories"]]
-                logger.debug(f"Extracted {len(result)} memories from search results")
-                return result
-            elif isinstance(memories, list):
-                logger.debug(f"Memories is a list with {len(memories)} items")
-                return memories
-            else:
+            # 不同版本的 mem0 返回 {"memories": [...]}、{"results": [...]} 或列表，元素为 dict 或字符串，统一为文本
+            if isinstance(memories, dict):
+                memories = memories.get("memories", memories.get("results"))
+            if not isinstance(memories, list):
                 logger.warning(f"Unexpected memories format: {type(memories)}")
-            return []
+                return []
+            result = [mem.get("memory", "") if isinstance(mem, dict) else str(mem) for mem in memories]
+            result = [text for text in result if text]
+            logger.debug(f"Extracted {len(result)} memories from search results")
+            return result
         except Exception as e:
-            # 打印当前配置信息用于调试
-            logger.error(f"=== 记忆搜索失败时的配置信息 ===")
-            logger.error(f"API Base URL: {os.getenv('OPENAI_BASE_URL', 'Not set')}")
-            logger.error(f"API Key: {'Set' if os.getenv('OPENAI_API_KEY') else 'Not set'}")
-            logger.error(f"Embedding Model: {os.getenv('OPENAI_EMBEDDING_MODEL', 'Not set')}")
-            logger.error(f"Search Query: {query[:50]}...")
-            logger.error(f"User ID: {user_id}")
-            logger.error(f"=====================================")
-            
             # 如果是连接错误或认证错误，记录警告但不抛出异常
             if "Connection error" in str(e) or "Invalid token" in str(e) or "API" in str(e):
-                logger.warning(f"Memory search failed due to API issues, skipping: {e}")
+                logger.warning(f"Memory search failed due to API issues, skipping: {e} ({_api_config_summary()})")
             else:
-                logger.error(f"Failed to search memories: {e}", exc_info=True)
+                logger.error(f"Failed to search memories: {e} ({_api_config_summary()})", exc_info=True)
             return []
     
     async def add_memory(self, content: str, user_id: str, metadata: Optional[Dict[str, Any]] = None):
@@ -326,30 +626,22 @@ class MemoryManager:
             logger.debug(f"Calling memory.add with content length={len(content)}")
             # 直接调用，不使用线程池执行器，避免 SQLite 线程安全问题
             result = self.memory.add(content, user_id=user_id, metadata=metadata or {})
-            logger.info(f"Memory.add returned: {result}")
+            logger.debug(f"Memory.add returned: {result}")
             
             if result:
                 memory_id = result.get("id") if isinstance(result, dict) else str(result)
-                logger.info(f"✓ Successfully added memory with id={memory_id}")
+                logger.debug(f"Added memory id={memory_id}")
+                self._apply_add_result(result, user_id, content, metadata)
             else:
                 logger.warning("Memory.add returned None or empty result")
             
             return result
         except Exception as e:
-            # 打印当前配置信息用于调试
-            logger.error(f"=== 记忆添加失败时的配置信息 ===")
-            logger.error(f"API Base URL: {os.getenv('OPENAI_BASE_URL', 'Not set')}")
-            logger.error(f"API Key: {'Set' if os.getenv('OPENAI_API_KEY') else 'Not set'}")
-            logger.error(f"Embedding Model: {os.getenv('OPENAI_EMBEDDING_MODEL', 'Not set')}")
-            logger.error(f"Memory Content: {content[:50]}...")
-            logger.error(f"User ID: {user_id}")
-            logger.error(f"=====================================")
-            
             # 如果是连接错误或认证错误，记录警告但不抛出异常
             if "Connection error" in str(e) or "Invalid token" in str(e) or "API" in str(e):
-                logger.warning(f"Memory addition failed due to API issues, skipping: {e}")
+                logger.warning(f"Memory addition failed due to API issues, skipping: {e} ({_api_config_summary()})")
             else:
-                logger.error(f"Failed to add memory: {e}", exc_info=True)
+                logger.error(f"Failed to add memory: {e} ({_api_config_summary()})", exc_info=True)
             return None
     
     async def add_conversation_memories(self, user_input: str, assistant_reply: str, user_id: str, session_id: str):
@@ -359,15 +651,13 @@ class MemoryManager:
             return
         
         try:
-            logger.info(f"=== Adding conversation memories ===")
-            logger.info(f"user_id={user_id}, session_id={session_id}")
-            logger.info(f"user_input={user_input}")
-            logger.info(f"assistant_reply length={len(assistant_reply)}")
+            logger.debug(f"Adding conversation memories: user_id={user_id}, session_id={session_id}, "
+                         f"input_length={len(user_input)}, reply_length={len(assistant_reply)}")
             
             # 首先尝试直接添加用户输入（作为测试）
             # 如果用户输入包含明显的偏好信息，直接添加
             if any(keyword in user_input for keyword in ["喜欢", "不喜欢", "偏好", "讨厌", "热爱"]):
-                logger.info("Detected preference keywords, adding direct memory")
+                logger.debug("Detected preference keywords, adding direct memory")
                 try:
                     direct_result = await self.add_memory(
                         content=user_input,
@@ -381,17 +671,16 @@ class MemoryManager:
                         }
                     )
                     if direct_result:
-                        logger.info(f"✓ Direct memory added successfully: {direct_result}")
+                        logger.debug(f"Direct memory added: {direct_result}")
                 except Exception as e:
                     logger.error(f"Failed to add direct memory: {e}", exc_info=True)
             
             # 然后尝试提取关键记忆
-            logger.info("Attempting to extract key memories using LLM...")
+            logger.debug("Attempting to extract key memories using LLM")
             key_memories = await self.extract_key_memories(user_input, assistant_reply)
             
             if not key_memories:
-                logger.warning(f"No key memories extracted from conversation")
-                logger.info("This might be normal if the conversation doesn't contain memorable information")
+                logger.debug("No key memories extracted from conversation")
                 return
             
             logger.info(f"Found {len(key_memories)} key memories to add")
@@ -404,7 +693,7 @@ class MemoryManager:
                 memory_content = memory_item.get("content", "")
                 importance = memory_item.get("importance", "medium")
                 
-                logger.info(f"Processing memory {idx+1}/{len(key_memories)}: type={memory_type}, importance={importance}")
+                logger.debug(f"Processing memory {idx+1}/{len(key_memories)}: type={memory_type}, importance={importance}")
                 logger.debug(f"Memory content: {memory_content}")
                 
                 if memory_content:
@@ -423,7 +712,7 @@ class MemoryManager:
                         if result:
                             added_count += 1
                             memory_id = result.get("id") if isinstance(result, dict) else str(result)
-                            logger.info(f"✓ Added memory {added_count}/{len(key_memories)}: id={memory_id}, type={memory_type}, content={memory_content[:50]}...")
+                            logger.debug(f"Added memory {added_count}/{len(key_memories)}: id={memory_id}, type={memory_type}")
                         else:
                             logger.warning(f"✗ Failed to add memory (result is None): {memory_content[:50]}...")
                     except Exception as e:
@@ -431,22 +720,99 @@ class MemoryManager:
                 else:
                     logger.warning(f"Memory item {idx+1} has empty content, skipping")
             
-            logger.info(f"=== Memory addition completed: {added_count}/{len(key_memories)} memories added ===")
+            logger.info(f"Memory addition completed: {added_count}/{len(key_memories)} memories added for user_id={user_id}")
         except Exception as e:
             logger.error(f"✗ Failed to add conversation memories: {e}", exc_info=True)
     
-    async def update_memory(self, memory_id: str, data: str):
+    async def update_memory(self, memory_id: str, data: str, user_id: Optional[str] = None):
         """更新记忆"""
         if not self.memory:
             return None
         
         try:
             result = self.memory.update(memory_id=memory_id, data=data)
+            self._on_memory_changed("UPDATE", memory_id, user_id=user_id, text=data)
             return result
         except Exception as e:
             logger.error(f"Failed to update memory: {e}")
             return None
     
+    async def delete_memory(self, memory_id: str, user_id: Optional[str] = None):
+        """删除记忆"""
+        if not self.memory:
+            return None
+        
+        result = self.memory.delete(memory_id=memory_id)
+        self._on_memory_changed("DELETE", memory_id, user_id=user_id)
+        return result
+    
+    async def get_memory_profile(self, user_id: str) -> Optional[UserProfile]:
+        """获取用户画像（高重要性记忆），缓存未命中时全量加载一次"""
+        if not self.memory or not settings.MEMORY_PROFILE_ENABLED:
+            return None
+        
+        with stage("memory_profile"):
+            await self._ensure_user_snapshot(user_id)
+            return self.profile_cache.get(user_id)
+    
+    def _apply_add_result(self, result: Any, user_id: str, content: str, metadata: Optional[Dict[str, Any]]):
+        """解析 memory.add 的返回，把新增/更新/删除同步到缓存"""
+        if isinstance(result, dict) and isinstance(result.get("results"), list):
+            items = result["results"]
+        elif isinstance(result, list):
+            items = result
+        elif isinstance(result, dict):
+            items = [result]
+        else:
+            return
+        
+        for item in items:
+            if not isinstance(item, dict) or not item.get("id"):
+                continue
+            event = item.get("event", "ADD")
+            if event == "NONE":
+                continue
+            self._on_memory_changed(
+                event,
+                item["id"],
+                user_id=user_id,
+                text=item.get("memory") or content,
+                metadata=metadata,
+            )
+    
+    def _on_memory_changed(
+        self,
+        event: str,
+        memory_id: str,
+        user_id: Optional[str] = None,
+        text: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+    ):
+        """记忆变更的统一入口，负责增量维护各类缓存"""
+        try:
+            if event == "DELETE":
+                user_id = self.profile_cache.remove(memory_id, user_id)
+                if user_id:
+                    self.lexical_index.remove(user_id, memory_id)
+                    self.change_log.record(user_id, "delete", memory_id)
+            elif user_id and metadata is not None:
+                self.profile_cache.upsert(user_id, memory_id, text or "", metadata)
+                self.lexical_index.upsert(user_id, memory_id, text or "")
+                self.change_log.record(user_id, "upsert", memory_id, {
+                    "id": memory_id,
+                    "memory": text or "",
+                    "metadata": metadata,
+                    "created_at": datetime.now().isoformat() if event == "ADD" else None,
+                })
+            elif text is not None:
+                user_id = self.profile_cache.update_text(memory_id, text) or user_id
+                if user_id:
+                    self.lexical_index.upsert(user_id, memory_id, text)
+                    # 仅文本变更，metadata 留空由客户端合并
+                    self.change_log.record(user_id, "upsert", memory_id, {"id": memory_id, "memory": text})
+        except Exception as e:
+            logger.warning(f"Failed to apply memory change to caches: {e}")
+    
     async def add_conversation(self, messages: List[Dict[str, str]], user_id: str):
         """添加对话记忆（保留原方法以兼容）"""
         if not self.memory:
@@ -458,7 +824,10 @@ class MemoryManager:
                 f"{msg.get('role', 'user')}: {msg.get('content', '')}"
                 for msg in messages
             ])
-            result = self.memory.add(conversation_text, user_id=user_id, metadata={"type": "conversation"})
+            metadata = {"type": "conversation"}
+            result = self.memory.add(conversation_text, user_id=user_id, metadata=metadata)
+            if result:
+                self._apply_add_result(result, user_id, conversation_text, metadata)
             return result
         except Exception as e:
             logger.error(f"Failed to add conversation memory: {e}")
@@ -0,0 +1,92 @@
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List, Deque, Tuple
+import uuid
+
+
+@dataclass
+class ChangeEntry:
+    seq: int
+    op: str  # "upsert" | "delete"
+    memory_id: str
+    memory: Optional[Dict[str, Any]] = None
+
+
+class _UserLog:
+    def __init__(self, max_entries: int, floor: int):
+        self.seq = floor
+        # 游标不小于 floor 时，之后的变更都在 entries 中
+        self.floor = floor
+        self.entries: Deque[ChangeEntry] = deque(maxlen=max_entries)
+
+
+class MemoryChangeLog:
+    """
+    按用户记录记忆变更的单调序列，供增量同步使用。
+
+    游标格式为 "{epoch}:{seq}"，epoch 每个进程随机生成：进程重启或请求落到
+    另一个 worker 时游标失效，客户端会收到 reset 并重新全量拉取。
+    seq 在进程内所有用户间全局递增、不会复用；最多保留 max_users 个用户的日志（LRU），
+    被淘汰用户的旧游标在之后的请求中判为失效。
+    """
+
+    def __init__(self, max_entries: int = 1000, max_users: int = 10000):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.max_entries = max_entries
+        self.max_users = max(max_users, 1)
+        self._seq = 0
+        # 被淘汰日志的最大 seq：没有日志的用户，只有不小于它的游标才可信
+        self._evicted_floor = 0
+        self._logs: "OrderedDict[str, _UserLog]" = OrderedDict()
+
+    def record(self, user_id: str, op: str, memory_id: str, memory: Optional[Dict[str, Any]] = None) -> int:
+        log = self._logs.get(user_id)
+        if log is None:
+            log = self._logs[user_id] = _UserLog(self.max_entries, self._evicted_floor)
+            while len(self._logs) > self.max_users:
+                _, evicted = self._logs.popitem(last=False)
+                self._evicted_floor = max(self._evicted_floor, evicted.seq)
+        else:
+            self._logs.move_to_end(user_id)
+        self._seq += 1
+        if len(log.entries) == log.entries.maxlen:
+            # 最早一条即将被挤出，早于它的游标无法再保证增量完整
+            log.floor = log.entries[0].seq
+        log.seq = self._seq
+        log.entries.append(ChangeEntry(seq=log.seq, op=op, memory_id=memory_id, memory=memory))
+        return log.seq
+
+    def cursor(self, user_id: str) -> str:
+        log = self._logs.get(user_id)
+        return f"{self.epoch}:{log.seq if log else self._evicted_floor}"
+
+    def parse_cursor(self, cursor: Optional[str]) -> Optional[int]:
+        """解析游标，epoch 不匹配或格式错误返回 None"""
+        if not cursor:
+            return None
+        epoch, _, seq = cursor.partition(":")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def since(self, user_id: str, cursor: Optional[str]) -> Tuple[Optional[List[ChangeEntry]], str]:
+        """
+        返回 (游标之后的变更, 当前游标)。同一条记忆的多次变更只保留最后一次。
+        变更为 None 表示游标无效或已超出保留窗口，需要全量同步。
+        """
+        current = self.cursor(user_id)
+        seq = self.parse_cursor(cursor)
+        log = self._logs.get(user_id)
+        floor = log.floor if log else self._evicted_floor
+        # 游标早于保留窗口（条目被挤出或日志曾被淘汰），无法保证增量完整
+        if seq is None or seq > self._seq or seq < floor:
+            return None, current
+        if log is None or seq >= log.seq:
+            return [], current
+
+        latest: Dict[str, ChangeEntry] = {}
+        for entry in log.entries:
+            if entry.seq > seq:
+                latest.pop(entry.memory_id, None)
+                latest[entry.memory_id] = entry
+        return list(latest.values()), current
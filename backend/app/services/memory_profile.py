@@ -0,0 +1,175 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, List, Iterable
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# 画像记忆的优先级：数字越小越靠前
+_IMPORTANCE_RANK = {"high": 0, "medium": 1}
+# 中等重要性时，只有这些类型会进入画像
+_PROFILE_TYPES = ("preference", "fact")
+
+
+def profile_rank(metadata: Optional[Dict[str, Any]]) -> Optional[int]:
+    """判断记忆是否属于画像，返回排序权重；不属于画像返回 None"""
+    if not isinstance(metadata, dict):
+        return None
+    importance = metadata.get("importance", "medium")
+    if importance == "high":
+        return _IMPORTANCE_RANK["high"]
+    if importance == "medium" and metadata.get("type") in _PROFILE_TYPES:
+        return _IMPORTANCE_RANK["medium"]
+    return None
+
+
+@dataclass
+class _ProfileEntry:
+    text: str
+    rank: int
+    seq: int
+
+
+@dataclass
+class UserProfile:
+    """单个用户的画像：高重要性记忆 + 长尾记忆的计数"""
+    max_items: int
+    loaded_at: float = field(default_factory=time.monotonic)
+    # complete=False 表示加载时触达了扫描上限，长尾情况未知
+    complete: bool = True
+    candidates: Dict[str, _ProfileEntry] = field(default_factory=dict)
+    tail_ids: set = field(default_factory=set)
+    _seq: int = 0
+    _compiled: Optional[str] = None
+    _compiled_texts: Optional[List[str]] = None
+
+    def upsert(self, memory_id: str, text: str, metadata: Optional[Dict[str, Any]]) -> None:
+        rank = profile_rank(metadata)
+        self._compiled = None
+        if rank is None or not text:
+            self.candidates.pop(memory_id, None)
+            self.tail_ids.add(memory_id)
+            return
+        self.tail_ids.discard(memory_id)
+        existing = self.candidates.get(memory_id)
+        self._seq += 1
+        # 保留首次出现的顺序，避免更新时画像顺序抖动
+        seq = existing.seq if existing else self._seq
+        self.candidates[memory_id] = _ProfileEntry(text=text, rank=rank, seq=seq)
+
+    def remove(self, memory_id: str) -> None:
+        if self.candidates.pop(memory_id, None) is not None:
+            self._compiled = None
+        self.tail_ids.discard(memory_id)
+
+    def _compile(self) -> None:
+        # 先按重要性，再按出现顺序（新的在前）
+        ordered = sorted(self.candidates.values(), key=lambda e: (e.rank, -e.seq))
+        self._compiled_texts = [e.text for e in ordered[: self.max_items]]
+        self._compiled = "\n".join(f"- {t}" for t in self._compiled_texts)
+
+    @property
+    def text(self) -> str:
+        """编译好的画像文本，可直接拼进系统消息"""
+        if self._compiled is None:
+            self._compile()
+        return self._compiled
+
+    @property
+    def texts(self) -> List[str]:
+        if self._compiled is None:
+            self._compile()
+        return self._compiled_texts
+
+    @property
+    def needs_search(self) -> bool:
+        """是否存在画像之外的长尾记忆，需要走向量检索"""
+        return (
+            not self.complete
+            or bool(self.tail_ids)
+            or len(self.candidates) > self.max_items
+        )
+
+
+class MemoryProfileCache:
+    """
+    按用户缓存画像，记忆增删时增量更新，TTL 到期后整体重建。
+    最多缓存 max_users 个用户（LRU）；memory_id -> user_id 的归属只为已加载的用户记录，随画像一起淘汰。
+    """
+
+    def __init__(self, max_items: int = 20, ttl: float = 600, max_users: int = 1000):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.max_users = max(max_users, 1)
+        self._profiles: "OrderedDict[str, UserProfile]" = OrderedDict()
+        # memory_id -> user_id，用于只知道 memory_id 的更新/删除
+        self._owners: Dict[str, str] = {}
+
+    def get(self, user_id: str) -> Optional[UserProfile]:
+        """获取未过期的画像，不存在或已过期返回 None"""
+        profile = self._profiles.get(user_id)
+        if profile is None:
+            return None
+        if self.ttl and time.monotonic() - profile.loaded_at > self.ttl:
+            self.invalidate(user_id)
+            return None
+        self._profiles.move_to_end(user_id)
+        return profile
+
+    def load(self, user_id: str, memories: Iterable[Dict[str, Any]], complete: bool = True) -> UserProfile:
+        """用全量记忆重建画像"""
+        self.invalidate(user_id)
+        profile = UserProfile(max_items=self.max_items, complete=complete)
+        # get_all 通常按时间正序返回，正序写入使较新的记忆 seq 更大
+        for mem in memories:
+            memory_id = mem.get("id")
+            if not memory_id:
+                continue
+            profile.upsert(memory_id, mem.get("memory", ""), mem.get("metadata"))
+            self._owners[memory_id] = user_id
+        self._profiles[user_id] = profile
+        while len(self._profiles) > self.max_users:
+            self.invalidate(next(iter(self._profiles)))
+        logger.debug(
+            f"Loaded memory profile for user_id={user_id}: "
+            f"{len(profile.candidates)} profile, {len(profile.tail_ids)} tail, complete={complete}"
+        )
+        return profile
+
+    def upsert(self, user_id: str, memory_id: str, text: str, metadata: Optional[Dict[str, Any]]) -> None:
+        """记忆新增或更新时调用；未加载的用户无需处理，下次访问时会全量加载"""
+        profile = self._profiles.get(user_id)
+        if profile is not None:
+            self._owners[memory_id] = user_id
+            profile.upsert(memory_id, text, metadata)
+
+    def update_text(self, memory_id: str, text: str) -> Optional[str]:
+        """只更新文本（metadata 不变），返回所属 user_id"""
+        user_id = self._owners.get(memory_id)
+        profile = self._profiles.get(user_id) if user_id else None
+        if profile is not None and memory_id in profile.candidates:
+            entry = profile.candidates[memory_id]
+            entry.text = text
+            profile._compiled = None
+        return user_id
+
+    def remove(self, memory_id: str, user_id: Optional[str] = None) -> Optional[str]:
+        """记忆删除时调用，返回所属 user_id"""
+        user_id = user_id or self._owners.get(memory_id)
+        self._owners.pop(memory_id, None)
+        profile = self._profiles.get(user_id) if user_id else None
+        if profile is not None:
+            profile.remove(memory_id)
+        return user_id
+
+    def owner_of(self, memory_id: str) -> Optional[str]:
+        return self._owners.get(memory_id)
+
+    def invalidate(self, user_id: str) -> None:
+        profile = self._profiles.pop(user_id, None)
+        if profile is None:
+            return
+        for memory_id in list(profile.candidates) + list(profile.tail_ids):
+            self._owners.pop(memory_id, None)
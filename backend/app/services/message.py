@@ -1,24 +1,15 @@
 from datetime import datetime
-from sqlalchemy import create_engine, select, func
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.automap import automap_base
+from sqlalchemy import select, func
 import uuid
-from ..config import settings
-
-
-# 创建数据库连接
-engine = create_engine(settings.DATABASE_URL, echo=False)
-SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
-Base = automap_base()
-Base.prepare(autoload_with=engine)
-
-# 获取表模型
-ChatMessages = Base.classes.chat_messages
+from .db import models, open_session
+from .metrics import db_timed
 
 
+@db_timed
 def save_message(session_id: str, role: str, content: str, user_id: str = None, metadata: dict = None) -> dict:
     """保存消息"""
-    with SessionLocal() as db_session:
+    ChatMessages = models().chat_messages
+    with open_session() as db_session:
         message = ChatMessages(
             id=str(uuid.uuid4()),
             session_id=session_id,
@@ -41,17 +32,21 @@ def save_message(session_id: str, role: str, content: str, user_id: str = None,
         }
 
 
+@db_timed
 def count_messages_by_session(session_id: str) -> int:
     """统计会话的消息数量"""
-    with SessionLocal() as db_session:
+    ChatMessages = models().chat_messages
+    with open_session() as db_session:
         stmt = select(func.count(ChatMessages.id)).where(ChatMessages.session_id == session_id)
         count = db_session.scalar(stmt)
         return count if count else 0
 
 
+@db_timed
 def delete_messages_by_session(session_id: str) -> int:
     """删除会话的所有消息，返回删除的数量"""
-    with SessionLocal() as db_session:
+    ChatMessages = models().chat_messages
+    with open_session() as db_session:
         stmt = select(ChatMessages).where(ChatMessages.session_id == session_id)
         messages = db_session.scalars(stmt).all()
         count = len(messages)
@@ -61,9 +56,11 @@ def delete_messages_by_session(session_id: str) -> int:
         return count
 
 
+@db_timed
 def get_messages_by_session(session_id: str, limit: int = 100) -> list:
     """获取会话的所有消息"""
-    with SessionLocal() as db_session:
+    ChatMessages = models().chat_messages
+    with open_session() as db_session:
         stmt = select(ChatMessages).where(ChatMessages.session_id == session_id).order_by(ChatMessages.created_at).limit(limit)
         messages = db_session.scalars(stmt).all()
         return [
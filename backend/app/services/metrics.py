@@ -1,8 +1,147 @@
+from functools import lru_cache, wraps
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
 from prometheus_fastapi_instrumentator import Instrumentator
 from fastapi import FastAPI
 
+from ..config import settings
+from .timing import record_stage
+
 
 def setup_metrics(app: FastAPI) -> None:
-    Instrumentator().instrument(app).expose(app)
+    """
+    HTTP 指标与 /metrics 端点。状态码按 2xx/4xx 分组、未匹配路由的请求不计入，
+    handler 标签只会是已注册的路由模板，基数有界。
+    """
+    Instrumentator(
+        should_group_status_codes=True,
+        should_ignore_untemplated=True,
+        excluded_handlers=["/metrics", "/healthz", "/readyz"],
+    ).instrument(app).expose(app, include_in_schema=False)
+
+
+@lru_cache(maxsize=1)
+def _known_models() -> frozenset:
+    return frozenset(m for m in (
+        settings.LLM_MODEL_CHAT, settings.LLM_MODEL_FAST, settings.LLM_MODEL_CODE, settings.LLM_MODEL_MODERATION,
+    ) if m)
+
+
+def model_label(model: str) -> str:
+    """模型标签只取配置中的模型名，其余归为 other，避免任意模型名撑大时序数量"""
+    return model if model in _known_models() else "other"
+
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+# LLM 调用
+LLM_TTFT = Histogram(
+    "llm_ttft_seconds",
+    "Time from requesting a streamed LLM call (including scheduler wait) to its first chunk",
+    ["model"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10, 30),
+)
+LLM_TOKENS_PER_SEC = Histogram(
+    "llm_stream_tokens_per_second",
+    "Streamed chunks (about one token each) per second after the first chunk",
+    ["model"],
+    buckets=(1, 5, 10, 20, 30, 50, 75, 100, 150, 250, 500),
+)
+LLM_CALL_SECONDS = Histogram(
+    "llm_call_duration_seconds",
+    "LLM call duration once a scheduler slot is held",
+    ["model", "kind", "outcome"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+# 记忆检索与向量化
+MEMORY_RETRIEVAL_SECONDS = Histogram(
+    "memory_retrieval_seconds",
+    "Relevant-memory retrieval latency by effective mode",
+    ["mode"],
+    buckets=_FAST_BUCKETS,
+)
+EMBEDDING_SECONDS = Histogram(
+    "embedding_request_seconds",
+    "Latency of embedding API requests (one per batch)",
+    ["outcome"],
+    buckets=_LATENCY_BUCKETS,
+)
+EMBEDDING_TEXTS = Counter("embedding_texts_total", "Texts passed to the embedding client", ["source"])
+
+# 数据库
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds",
+    "Latency of database service functions",
+    ["function"],
+    buckets=_FAST_BUCKETS,
+)
+
+
+def db_timed(func):
+    """记录数据库服务函数耗时；标签是函数名，在装饰时绑定，调用时只有一次 observe。同时计入当前请求的 db 阶段"""
+    histogram = DB_QUERY_SECONDS.labels(function=func.__name__)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            histogram.observe(elapsed)
+            record_stage("db", elapsed * 1000)
+
+    return wrapper
+
+
+# 后台任务
+BACKGROUND_QUEUE_DEPTH = Gauge("background_queue_depth", "Work items waiting or running in background queues", ["queue"])
+
+
+# 聊天接口准入控制
+ADMISSION_QUEUE_WAIT = Histogram(
+    "chat_admission_queue_wait_seconds",
+    "Time chat requests spend waiting for an admission slot",
+    ["outcome"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+ADMISSION_ACTIVE = Gauge("chat_admission_active", "Chat requests currently holding an admission slot")
+ADMISSION_QUEUE_DEPTH = Gauge("chat_admission_queue_depth", "Chat requests waiting for an admission slot")
+
+# LLM 调用优先级调度
+LLM_SCHED_QUEUE_DEPTH = Gauge("llm_scheduler_queue_depth", "LLM calls waiting for a slot", ["priority"])
+LLM_SCHED_ACTIVE = Gauge("llm_scheduler_active", "LLM calls currently running", ["priority"])
+LLM_SCHED_WAIT = Histogram(
+    "llm_scheduler_wait_seconds",
+    "Time LLM calls spend queued before running",
+    ["priority"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+LLM_SCHED_PREEMPTED = Counter("llm_scheduler_preempted_total", "Queued LLM calls preempted by higher-priority demand", ["priority"])
+
+# 对话轮次取消
+TURNS_CANCELLED = Counter("chat_turns_cancelled_total", "Chat turns cancelled before completion", ["reason"])
 
+# 安全检查
+SAFETY_STAGE_SECONDS = Histogram(
+    "safety_stage_seconds",
+    "Time spent in each safety stage",
+    ["stage"],
+    buckets=(0.00001, 0.0001, 0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+SAFETY_VERDICTS = Counter("safety_verdicts_total", "Safety verdicts by action and source", ["action", "source"])
 
+# 事件循环
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "Delay between a scheduled event loop wakeup and when it actually ran",
+    buckets=_FAST_BUCKETS,
+)
+EVENT_LOOP_BLOCKED_SECONDS = Histogram(
+    "event_loop_blocked_seconds",
+    "Event loop stalls longer than LOOP_BLOCK_THRESHOLD_MS",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
@@ -0,0 +1,42 @@
+from collections import Counter
+from typing import Optional
+import sys
+import threading
+import time
+
+from .loop_monitor import collapse, frame_stack
+
+# 同一时间只允许一次采样
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def sample_stacks(seconds: float, interval: float, thread_id: Optional[int] = None) -> str:
+    """
+    在调用线程中每 interval 秒采样一次调用栈，持续 seconds 秒，返回折叠栈文本（"栈 次数" 每行一条），
+    可直接交给 flamegraph.pl 或 speedscope。thread_id 为空时采样除自身外的所有线程，栈底加上线程名。
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        me = threading.get_ident()
+        counts: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident == me or (thread_id is not None and ident != thread_id):
+                    continue
+                stack = collapse(frame_stack(frame, limit=128))
+                if thread_id is None:
+                    stack = f"thread:{names.get(ident, ident)};{stack}"
+                counts[stack] += 1
+            frames = frame = None
+            time.sleep(interval)
+        return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+    finally:
+        _profile_lock.release()
@@ -0,0 +1,64 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+import time
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    """
+    启动预热的各项状态，供 /readyz 使用：必需项（数据库、对话图）全部完成才算就绪，
+    可选项（mem0、LLM / 嵌入连接）失败时只记录，服务以降级方式运行。
+    必需项失败后每 WARMUP_RETRY_INTERVAL 秒重试，直到成功或服务停止。
+    """
+
+    def __init__(self) -> None:
+        self.components: Dict[str, Dict[str, Any]] = {}
+        self.started = time.monotonic()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return all(c["status"] == "ok" for c in self.components.values() if c["required"]) and self.finished_at is not None
+
+    async def run(self, name: str, factory: Callable[[], Awaitable[Any]], required: bool = True) -> None:
+        """factory 每次调用返回一个新的 awaitable，重试时重新调用"""
+        component = self.components[name] = {"status": "pending", "required": required, "attempts": 0}
+        while True:
+            component["attempts"] += 1
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(factory(), timeout=settings.WARMUP_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                status, error = ("timeout", None) if isinstance(e, asyncio.TimeoutError) else ("failed", str(e)[:200])
+                component.update(status=status, error=error, duration_ms=round((time.perf_counter() - started) * 1000, 1))
+                logger.warning(f"Warm-up of {name} {status} after {component['duration_ms']}ms: {error}")
+                if not required:
+                    return
+                await asyncio.sleep(settings.WARMUP_RETRY_INTERVAL)
+                continue
+            # 可选项返回 False 表示不可用（如未配置），不算失败
+            component.update(status="ok" if result is not False else "unavailable", error=None,
+                             duration_ms=round((time.perf_counter() - started) * 1000, 1))
+            logger.info(f"Warm-up of {name} finished in {component['duration_ms']}ms ({component['status']})")
+            return
+
+    def finish(self) -> None:
+        self.finished_at = time.monotonic()
+        logger.info(f"Warm-up finished in {(self.finished_at - self.started) * 1000:.0f}ms, ready={self.ready}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "uptime_s": round(time.monotonic() - self.started, 1),
+            "warmup_ms": round((self.finished_at - self.started) * 1000, 1) if self.finished_at else None,
+            "components": self.components,
+        }
+
+
+readiness = Readiness()
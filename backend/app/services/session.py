@@ -1,25 +1,15 @@
 from datetime import datetime
-from sqlalchemy import create_engine, select
-from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.ext.automap import automap_base
+from sqlalchemy import select
 import uuid
-from ..config import settings
-
-
-# 创建数据库连接
-engine = create_engine(settings.DATABASE_URL, echo=False)
-SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
-Base = automap_base()
-Base.prepare(autoload_with=engine)
-
-# 获取表模型
-ChatSessions = Base.classes.chat_sessions
-ChatMessages = Base.classes.chat_messages
+from .db import models, open_session
+from .metrics import db_timed
 
 
+@db_timed
 def create_session(title: str = None, user_id: str = None) -> dict:
     """创建新会话"""
-    with SessionLocal() as db_session:
+    ChatSessions = models().chat_sessions
+    with open_session() as db_session:
         session_id = str(uuid.uuid4())
         session_obj = ChatSessions(
             id=session_id,
@@ -38,9 +28,11 @@ def create_session(title: str = None, user_id: str = None) -> dict:
         }
 
 
+@db_timed
 def get_session(session_id: str) -> dict:
     """获取会话信息"""
-    with SessionLocal() as db_session:
+    ChatSessions = models().chat_sessions
+    with open_session() as db_session:
         stmt = select(ChatSessions).where(ChatSessions.id == session_id)
         session_obj = db_session.scalar(stmt)
         if not session_obj:
@@ -53,9 +45,11 @@ def get_session(session_id: str) -> dict:
         }
 
 
+@db_timed
 def list_sessions(user_id: str = None, limit: int = 50) -> list:
     """列出所有会话"""
-    with SessionLocal() as db_session:
+    ChatSessions = models().chat_sessions
+    with open_session() as db_session:
         stmt = select(ChatSessions)
         if user_id:
             stmt = stmt.where(ChatSessions.user_id == user_id)
@@ -72,9 +66,11 @@ def list_sessions(user_id: str = None, limit: int = 50) -> list:
         ]
 
 
+@db_timed
 def update_session_title(session_id: str, title: str) -> dict:
     """更新会话标题"""
-    with SessionLocal() as db_session:
+    ChatSessions = models().chat_sessions
+    with open_session() as db_session:
         stmt = select(ChatSessions).where(ChatSessions.id == session_id)
         session_obj = db_session.scalar(stmt)
         if not session_obj:
@@ -90,9 +86,11 @@ def update_session_title(session_id: str, title: str) -> dict:
         }
 
 
+@db_timed
 def get_session_messages(session_id: str) -> list:
     """获取会话消息历史"""
-    with SessionLocal() as db_session:
+    ChatMessages = models().chat_messages
+    with open_session() as db_session:
         stmt = select(ChatMessages).where(ChatMessages.session_id == session_id).order_by(ChatMessages.created_at)
         messages = db_session.scalars(stmt).all()
         return [
@@ -107,11 +105,13 @@ def get_session_messages(session_id: str) -> list:
         ]
 
 
+@db_timed
 def delete_session(session_id: str) -> bool:
     """删除会话及其所有消息"""
+    ChatSessions = models().chat_sessions
     from ..services.message import delete_messages_by_session
     
-    with SessionLocal() as db_session:
+    with open_session() as db_session:
         # 先删除所有消息
         delete_messages_by_session(session_id)
         
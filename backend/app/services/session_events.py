@@ -0,0 +1,43 @@
+from typing import Any, Callable, Dict, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+SessionListener = Callable[[Dict[str, Any]], None]
+
+
+class SessionEventHub:
+    """
+    按会话分发的进程内事件（如后台生成的标题）。
+    订阅者是同步回调：进行中的 SSE 轮次写入自己的事件缓冲，WebSocket 连接放入发送队列。
+    """
+
+    def __init__(self):
+        self._listeners: Dict[str, List[SessionListener]] = {}
+
+    def subscribe(self, session_id: str, listener: SessionListener) -> Callable[[], None]:
+        """订阅某个会话的事件，返回取消订阅函数"""
+        self._listeners.setdefault(session_id, []).append(listener)
+
+        def unsubscribe() -> None:
+            listeners = self._listeners.get(session_id)
+            if listeners and listener in listeners:
+                listeners.remove(listener)
+                if not listeners:
+                    del self._listeners[session_id]
+
+        return unsubscribe
+
+    def publish(self, session_id: str, data: Dict[str, Any]) -> int:
+        """向当前仍连接的订阅者推送事件，返回送达的订阅者数"""
+        listeners = list(self._listeners.get(session_id, ()))
+        for listener in listeners:
+            try:
+                listener(data)
+            except Exception as e:
+                logger.warning(f"Session event listener failed for {session_id}: {e}")
+        return len(listeners)
+
+
+# 全局会话事件中心
+session_events = SessionEventHub()
@@ -0,0 +1,137 @@
+from typing import Any, AsyncIterator, List, Optional
+import asyncio
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson 为可选依赖
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    """序列化为紧凑 JSON 字节串，优先使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# 预先构造的帧片段，避免每个 token 都做 f-string 拼接与 encode
+_DATA_PREFIX = b"data: "
+_DELTA_PREFIX = b'data: {"delta":'
+_FRAME_END = b"\n\n"
+_OBJECT_FRAME_END = b"}\n\n"
+# 浏览器不会派发没有 data 行的事件，done 事件需带一个空对象
+DONE_FRAME = b"event: done\ndata: {}\n\n"
+
+
+def retry_frame(retry_ms: int) -> bytes:
+    """设置客户端断线后的重连间隔"""
+    return b"retry: %d\n\n" % retry_ms
+
+
+def data_frame(payload: Any) -> bytes:
+    """任意 JSON 负载的 SSE data 帧"""
+    return _DATA_PREFIX + dumps(payload) + _FRAME_END
+
+
+def delta_frame(text: str) -> bytes:
+    """增量文本帧，等价于 data_frame({"delta": text})"""
+    return _DELTA_PREFIX + dumps(text) + _OBJECT_FRAME_END
+
+
+def event_frame(event_id: str, body: bytes, event: Optional[str] = None) -> bytes:
+    """给 data 帧加上 id（以及可选事件名），客户端重连时通过 Last-Event-ID 回传 id"""
+    head = b"id: " + event_id.encode("utf-8") + b"\n"
+    if event:
+        head += b"event: " + event.encode("utf-8") + b"\n"
+    return head + body
+
+
+class _Coalescer:
+    """读取上游的单个任务：块写入缓冲，由首块、字节阈值、定时器或结束事件唤醒消费方"""
+
+    def __init__(self, chunks: AsyncIterator[str], max_delay: float, max_bytes: int):
+        self.loop = asyncio.get_running_loop()
+        self.chunks = chunks
+        self.max_delay = max_delay
+        self.max_bytes = max_bytes
+        self.buffer: List[str] = []
+        self.size = 0
+        self.first = True
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._waiter: Optional[asyncio.Future] = None
+        self.task = asyncio.ensure_future(self._pump())
+
+    def _wake(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def _pump(self) -> None:
+        try:
+            async for chunk in self.chunks:
+                self.buffer.append(chunk)
+                if self.max_bytes > 0:
+                    self.size += len(chunk.encode("utf-8"))
+                if self.first or (self.max_bytes > 0 and self.size >= self.max_bytes):
+                    # 首块立即发送以保证首 token 延迟
+                    self.first = False
+                    self._wake()
+                    # 上游连续就绪时也让出一次事件循环，使消费方及时发送
+                    await asyncio.sleep(0)
+                elif self._timer is None:
+                    self._timer = self.loop.call_later(self.max_delay, self._wake)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._wake()
+
+    async def next(self) -> Optional[str]:
+        """取出下一批合并后的文本；上游结束且缓冲为空时返回 None"""
+        while not self.buffer:
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return None
+            self._waiter = self.loop.create_future()
+            await self._waiter
+        text = "".join(self.buffer)
+        self.buffer, self.size = [], 0
+        return text
+
+    async def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        if not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except BaseException:
+                pass
+
+
+async def coalesce(chunks: AsyncIterator[str], max_delay_ms: float, max_bytes: int) -> AsyncIterator[str]:
+    """
+    合并相邻的文本块：首块立即产出以保证首 token 延迟，其后缓冲到
+    max_delay_ms 毫秒或 max_bytes 字节（UTF-8）任一阈值即产出一次；
+    max_delay_ms 为 0 时合并同一轮事件循环内到达的块。两个阈值都为 0 时原样透传。
+    """
+    if max_delay_ms <= 0 and max_bytes <= 0:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    coalescer = _Coalescer(chunks, max_delay_ms / 1000, max_bytes)
+    try:
+        while True:
+            text = await coalescer.next()
+            if text is None:
+                return
+            yield text
+    finally:
+        await coalescer.close()
@@ -1,28 +1,39 @@
-from langchain_openai import ChatOpenAI
+from typing import Dict, List, Optional, Tuple
 from langchain_core.messages import HumanMessage
+from opentelemetry.trace import SpanContext
 from ..config import settings
+from ..lang.llm_pool import llm_pool
+from ..lang.scheduler import Priority
+from .session import get_session, update_session_title
+from .metrics import BACKGROUND_QUEUE_DEPTH
+from .session_events import session_events
+from .tracing import background_span, current_span_context, mark_error
+import asyncio
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+
+def placeholder_title(user_message: str) -> str:
+    """截取用户消息前 50 个字符作为临时标题"""
+    summary = user_message.strip()[:50]
+    return summary + ("..." if len(user_message) > 50 else "")
+
+
+def _clean_title(title: str) -> str:
+    # 清理可能的多余文字并限制长度
+    return title.strip().replace("标题：", "").replace("标题", "").strip().strip('"“”')[:50]
 
 
 async def generate_summary(user_message: str, assistant_reply: str = None) -> str:
     """生成对话摘要作为会话标题"""
     # 如果 LLM 未配置，使用截取前50字符作为标题
-    if not settings.LLM_API_KEY:
-        summary = user_message.strip()[:50]
-        return summary + ("..." if len(user_message) > 50 else "")
+    if not llm_pool.available:
+        return placeholder_title(user_message)
     
     try:
-        # 创建临时 LLM 实例用于生成摘要
-        llm_kwargs = {
-            "model": settings.LLM_MODEL_CHAT,
-            "temperature": 0.3,  # 降低温度以获得更稳定的摘要
-        }
-        if settings.LLM_API_BASE:
-            llm_kwargs["base_url"] = settings.LLM_API_BASE
-        if settings.LLM_API_KEY:
-            llm_kwargs["api_key"] = settings.LLM_API_KEY
-        
-        llm = ChatOpenAI(**llm_kwargs)
-        
         # 使用 LLM 生成摘要
         prompt = f"""请为以下对话生成一个简洁的标题（不超过15字，只返回标题，不要其他文字）：
 
@@ -34,8 +45,9 @@ async def generate_summary(user_message: str, assistant_reply: str = None) -> st
         messages = [HumanMessage(content=prompt)]
         
         try:
-            response = await llm.ainvoke(messages)
-            summary = response.content.strip()
+            # 标题是近线任务：优先级低于对话回复、高于后台记忆提取；降低温度以获得更稳定的摘要
+            response = await llm_pool.ainvoke(messages, settings.LLM_MODEL_CHAT, temperature=0.3, priority=Priority.NEARLINE)
+            summary = response.strip()
             # 清理可能的多余文字
             summary = summary.replace("标题：", "").replace("标题", "").strip()
             # 限制长度
@@ -45,12 +57,160 @@ async def generate_summary(user_message: str, assistant_reply: str = None) -> st
                 summary = user_message.strip()[:50]
             return summary
         except Exception as e:
-            print(f"Failed to generate summary with LLM: {e}")
+            logger.warning(f"Failed to generate summary with LLM: {e}", exc_info=True)
             # 降级到截取
-            summary = user_message.strip()[:50]
-            return summary + ("..." if len(user_message) > 50 else "")
+            return placeholder_title(user_message)
     except Exception as e:
-        print(f"Error generating summary: {e}")
-        summary = user_message.strip()[:50]
-        return summary + ("..." if len(user_message) > 50 else "")
+        logger.warning(f"Error generating summary: {e}", exc_info=True)
+        return placeholder_title(user_message)
+
+
+
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.S)
+
+
+class SessionTitler:
+    """
+    后台标题生成：首轮对话结束时先写入截断的临时标题，再把会话放入待处理队列；
+    后台任务攒够 batch_size 个或等待 batch_window 秒后，用一次 LLM 调用为整批会话生成标题，
+    写库并通过会话事件推送 title_update。用户在此期间手动改过标题的会话不会被覆盖。
+    """
+
+    def __init__(self, batch_size: int, batch_window: float):
+        self.batch_size = max(batch_size, 1)
+        self.batch_window = batch_window
+        # session_id -> (用户消息, 助手回复, 临时标题)
+        self._pending: Dict[str, Tuple[str, str, str]] = {}
+        # session_id -> 发起请求的 span，批次 span 通过 Link 关联回去
+        self._origins: Dict[str, Optional[SpanContext]] = {}
+        # session_id -> 正式标题处理完成时置位的 future，供会话事件流等待
+        self._done: Dict[str, asyncio.Future] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # 抓取时读取队列长度，生成路径上没有额外开销
+        BACKGROUND_QUEUE_DEPTH.labels(queue="session_titles").set_function(lambda: len(self._pending))
+
+    def schedule(self, session_id: str, user_message: str, assistant_reply: str) -> str:
+        """写入并返回临时标题；LLM 可用时排队生成正式标题"""
+        title = placeholder_title(user_message)
+        update_session_title(session_id, title)
+        if not llm_pool.available:
+            return title
+        self._pending[session_id] = (user_message, assistant_reply, title)
+        self._origins[session_id] = current_span_context()
+        if session_id not in self._done:
+            self._done[session_id] = asyncio.get_running_loop().create_future()
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return title
+
+    async def wait(self, session_id: str, timeout: float) -> Optional[str]:
+        """等待会话的正式标题处理完成，返回写入的标题；未排队或已处理完、生成失败、超时返回 None"""
+        future = self._done.get(session_id)
+        if future is None:
+            return None
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def _resolve(self, session_id: str, title: Optional[str]) -> None:
+        future = self._done.pop(session_id, None)
+        if future is not None and not future.done():
+            future.set_result(title)
+
+    async def _run(self) -> None:
+        while self._pending:
+            if len(self._pending) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.batch_window)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            batch = list(self._pending.items())[:self.batch_size]
+            origins = []
+            for session_id, _ in batch:
+                del self._pending[session_id]
+                origins.append(self._origins.pop(session_id, None))
+            with background_span("title.generate", origins, {"title.batch_size": len(batch)}) as span:
+                titles: Dict[str, str] = {}
+                try:
+                    try:
+                        titles = await self._generate(batch)
+                    except Exception as e:
+                        logger.error(f"Batched title generation failed for {len(batch)} sessions: {e}", exc_info=True)
+                        mark_error(e)
+                    # 整批失败或批量结果缺项的会话逐个生成，避免永久停留在临时标题
+                    missing = [item for item in batch if item[0] not in titles]
+                    if missing and len(batch) > 1:
+                        titles.update(await self._generate_each(missing))
+                    span.set_attribute("title.generated", len(titles))
+                    for session_id, (_, _, placeholder) in batch:
+                        title = titles.get(session_id)
+                        if title and self._apply(session_id, title, placeholder):
+                            self._resolve(session_id, title)
+                finally:
+                    for session_id, _ in batch:
+                        self._resolve(session_id, None)
+
+    async def _generate_each(self, batch: List[Tuple[str, Tuple[str, str, str]]]) -> Dict[str, str]:
+        """逐个会话调用 generate_summary（失败时其本身退回临时标题）"""
+        results = await asyncio.gather(
+            *(generate_summary(user_message, assistant_reply) for _, (user_message, assistant_reply, _) in batch)
+        )
+        return {session_id: title for (session_id, _), title in zip(batch, results) if title}
+
+    async def _generate(self, batch: List[Tuple[str, Tuple[str, str, str]]]) -> Dict[str, str]:
+        if len(batch) == 1:
+            session_id, (user_message, assistant_reply, _) = batch[0]
+            return {session_id: await generate_summary(user_message, assistant_reply)}
+
+        conversations = "\n\n".join(
+            f"[{index}]\n用户：{user_message[:200]}\n助手：{assistant_reply[:200]}"
+            for index, (_, (user_message, assistant_reply, _)) in enumerate(batch, start=1)
+        )
+        prompt = f"""请分别为以下 {len(batch)} 段对话各生成一个简洁的标题（每个不超过15字）。
+
+{conversations}
+
+以 JSON 对象返回，键为对话编号，值为标题，例如 {{"1": "标题一", "2": "标题二"}}。只返回 JSON："""
+        # 标题是近线任务：优先级低于对话回复、高于后台记忆提取
+        response = await llm_pool.ainvoke(
+            [HumanMessage(content=prompt)], settings.LLM_MODEL_CHAT, temperature=0.3, priority=Priority.NEARLINE
+        )
+        match = _JSON_OBJECT_RE.search(response)
+        if not match:
+            logger.warning(f"Batched title response is not JSON: {response[:200]}")
+            return {}
+        parsed = json.loads(match.group(0))
+        titles = {}
+        for index, (session_id, _) in enumerate(batch, start=1):
+            title = _clean_title(str(parsed.get(str(index), "")))
+            if title:
+                titles[session_id] = title
+        logger.info(f"Generated {len(titles)}/{len(batch)} titles in one call")
+        return titles
+
+    def _apply(self, session_id: str, title: str, placeholder: str) -> bool:
+        """写入并推送正式标题，返回是否写入"""
+        if title == placeholder:
+            return False
+        try:
+            session = get_session(session_id)
+            if not session or session.get("title") != placeholder:
+                # 会话已删除或标题已被用户修改
+                return False
+            update_session_title(session_id, title)
+        except Exception as e:
+            logger.error(f"Failed to update title for session {session_id}: {e}", exc_info=True)
+            return False
+        delivered = session_events.publish(session_id, {"title_update": title})
+        logger.info(f"Updated session title: {title} (pushed to {delivered} listener(s))")
+        return True
+
 
+# 全局标题生成器
+session_titler = SessionTitler(batch_size=settings.TITLE_BATCH_SIZE, batch_window=settings.TITLE_BATCH_WINDOW)
@@ -0,0 +1,71 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+import time
+
+
+class TimingCollector:
+    """
+    单个请求的分阶段耗时：同名阶段累加（如一轮内的多次数据库调用），
+    结束后输出为 Server-Timing 头或 SSE 的 timing 事件。
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.total_ms: Optional[float] = None
+
+    def record(self, name: str, ms: float) -> None:
+        # 请求结束后才完成的后台工作（记忆提取、正式标题）不再计入
+        if self.total_ms is not None:
+            return
+        self.stages[name] = self.stages.get(name, 0.0) + ms
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def finish(self) -> "TimingCollector":
+        if self.total_ms is None:
+            self.total_ms = (time.perf_counter() - self.started) * 1000
+        return self
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "total_ms": round(self.total_ms if self.total_ms is not None else (time.perf_counter() - self.started) * 1000, 1),
+            "stages": {name: {"ms": round(ms, 1), "count": self.counts[name]} for name, ms in self.stages.items()},
+        }
+
+    def server_timing(self) -> str:
+        """Server-Timing 头的值，浏览器开发者工具的 Timing 面板可直接展示"""
+        parts = [f"{name};dur={ms:.1f}" for name, ms in self.stages.items()]
+        parts.append(f"total;dur={self.finish().total_ms:.1f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[TimingCollector]] = ContextVar("request_timing", default=None)
+
+
+def start_timing() -> TimingCollector:
+    """为当前请求（及其后创建的任务）开始收集耗时"""
+    collector = TimingCollector()
+    _current.set(collector)
+    return collector
+
+
+def record_stage(name: str, ms: float) -> None:
+    collector = _current.get()
+    if collector is not None:
+        collector.record(name, ms)
+
+
+@contextmanager
+def stage(name: str):
+    """记录一段代码的耗时；当前没有请求上下文时只多一次 ContextVar 读取"""
+    collector = _current.get()
+    if collector is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        collector.record(name, (time.perf_counter() - started) * 1000)
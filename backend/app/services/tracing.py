@@ -1,18 +1,146 @@
+from collections import OrderedDict
+from typing import List, Optional
+import logging
+import random
+import threading
+
 from opentelemetry import trace
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import SpanProcessor
+from opentelemetry.trace import Link, SpanContext, Status, StatusCode
 from ..config import settings
 
+logger = logging.getLogger(__name__)
+
+# 未调用 init_tracing 时为 no-op tracer，各处直接使用即可
+tracer = trace.get_tracer("ai-chat-backend")
+
+
+class TailSamplingProcessor(SpanProcessor):
+    """
+    进程内的尾部采样：同一 trace 的 span 先缓存，本地根 span 结束时再决定是否导出——
+    出错或耗时超过 OTEL_TAIL_LATENCY_MS 的 trace 全部保留，其余按 OTEL_TAIL_SAMPLE_RATIO 抽样。
+    根 span 结束后才结束的 span（如后台记忆提取）沿用已做出的决定。
+    缓存的 trace 数超过 max_traces 时丢弃最早的未决 trace。
+    """
+
+    def __init__(self, delegate, ratio: float, latency_ms: float, max_traces: int):
+        self.delegate = delegate
+        self.ratio = ratio
+        self.latency_ns = latency_ms * 1_000_000
+        self.max_traces = max_traces
+        self._pending: "OrderedDict[int, List]" = OrderedDict()
+        self._decisions: "OrderedDict[int, bool]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_start(self, span, parent_context=None) -> None:
+        pass
+
+    def _keep(self, root, spans) -> bool:
+        if any(s.status.status_code == StatusCode.ERROR for s in spans):
+            return True
+        if root.end_time - root.start_time >= self.latency_ns:
+            return True
+        return random.random() < self.ratio
+
+    def on_end(self, span) -> None:
+        trace_id = span.context.trace_id
+        is_local_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            keep = self._decisions.get(trace_id)
+            if keep is not None:
+                spans = [span]
+            elif not is_local_root:
+                self._pending.setdefault(trace_id, []).append(span)
+                while len(self._pending) > self.max_traces:
+                    self._pending.popitem(last=False)
+                return
+            else:
+                spans = self._pending.pop(trace_id, [])
+                spans.append(span)
+                keep = self._keep(span, spans)
+                self._decisions[trace_id] = keep
+                while len(self._decisions) > self.max_traces:
+                    self._decisions.popitem(last=False)
+        if keep:
+            for s in spans:
+                self.delegate.on_end(s)
+
+    def shutdown(self) -> None:
+        self.delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.delegate.force_flush(timeout_millis)
+
+
+def mark_error(error: BaseException) -> None:
+    """把异常记录到当前 span 并标记为出错；被捕获而不再抛出的错误也能让尾部采样保留该 trace"""
+    span = trace.get_current_span()
+    span.record_exception(error)
+    span.set_status(Status(StatusCode.ERROR, str(error)[:200]))
+
 
-def init_tracing() -> None:
+def current_span_context() -> Optional[SpanContext]:
+    """当前 span 的上下文，供稍后在后台任务中建立 Link"""
+    context = trace.get_current_span().get_span_context()
+    return context if context.is_valid else None
+
+
+def background_span(name: str, origins=(), attributes=None):
+    """
+    后台批处理的根 span：不挂在最先触发它的请求下，而是通过 Link 关联到每个来源请求，
+    避免一个批次的耗时算进某个请求的 trace。
+    """
+    links = [Link(context) for context in origins if context is not None]
+    return tracer.start_as_current_span(name, context=Context(), links=links, attributes=attributes)
+
+
+def instrument_engine(engine) -> None:
+    """数据库引擎在首次使用时才创建（见 services/db.py），创建后再接入 SQLAlchemy 自动埋点"""
+    if not settings.OTEL_EXPORTER_OTLP_ENDPOINT:
+        return
+    try:
+        from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+    except ImportError:
+        return
+    SQLAlchemyInstrumentor().instrument(engine=engine)
+
+
+def init_tracing(app=None) -> None:
+    """
+    配置了 OTEL_EXPORTER_OTLP_ENDPOINT 时启用追踪：头部按 OTEL_HEAD_SAMPLE_RATIO 采样，
+    导出前再经过尾部采样；并自动埋点 FastAPI 与 httpx（LLM 与嵌入请求），数据库引擎见 instrument_engine。
+    """
     if not settings.OTEL_EXPORTER_OTLP_ENDPOINT:
         return
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
     resource = Resource.create({"service.name": settings.OTEL_SERVICE_NAME})
-    provider = TracerProvider(resource=resource)
+    provider = TracerProvider(resource=resource, sampler=ParentBased(TraceIdRatioBased(settings.OTEL_HEAD_SAMPLE_RATIO)))
     span_exporter = OTLPSpanExporter(endpoint=settings.OTEL_EXPORTER_OTLP_ENDPOINT, insecure=True)
-    provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    processor = BatchSpanProcessor(span_exporter)
+    if settings.OTEL_TAIL_SAMPLING:
+        processor = TailSamplingProcessor(
+            processor,
+            ratio=settings.OTEL_TAIL_SAMPLE_RATIO,
+            latency_ms=settings.OTEL_TAIL_LATENCY_MS,
+            max_traces=settings.OTEL_TAIL_MAX_TRACES,
+        )
+    provider.add_span_processor(processor)
     trace.set_tracer_provider(provider)
 
-
+    try:
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+        from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+    except ImportError as e:
+        logger.warning(f"OpenTelemetry instrumentation packages missing, only manual spans are exported: {e}")
+        return
+    if app is not None:
+        # 不为每个 ASGI send/receive 建 span：流式回复每帧一次，开销与噪声都很大
+        FastAPIInstrumentor.instrument_app(app, excluded_urls="healthz,readyz,metrics", exclude_spans=["receive", "send"])
+    HTTPXClientInstrumentor().instrument()
+    logger.info(f"Tracing enabled, exporting to {settings.OTEL_EXPORTER_OTLP_ENDPOINT}")
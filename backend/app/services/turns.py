@@ -0,0 +1,222 @@
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+import asyncio
+import logging
+import time
+import uuid
+
+from ..config import settings
+from .cancellation import CancellationToken
+from .metrics import TURNS_CANCELLED
+from .sse import data_frame, delta_frame, event_frame
+
+logger = logging.getLogger(__name__)
+
+
+class TurnEvent:
+    """一轮对话中的一个事件；SSE 帧在首次使用时编码并缓存，供所有订阅者共享"""
+
+    __slots__ = ("turn_id", "seq", "data", "event", "text_start", "_frame")
+
+    def __init__(self, turn_id: str, seq: int, data: Dict[str, Any], event: Optional[str] = None, text_start: int = 0):
+        self.turn_id = turn_id
+        self.seq = seq
+        self.data = data
+        self.event = event
+        # 本事件之前的回复长度，用于在事件被挤出缓冲后构造快照
+        self.text_start = text_start
+        self._frame: Optional[bytes] = None
+
+    @property
+    def id(self) -> str:
+        return f"{self.turn_id}:{self.seq}"
+
+    @property
+    def frame(self) -> bytes:
+        if self._frame is None:
+            if self.event is None and len(self.data) == 1 and "delta" in self.data:
+                body = delta_frame(self.data["delta"])
+            else:
+                body = data_frame(self.data)
+            self._frame = event_frame(self.id, body, self.event)
+        return self._frame
+
+
+class Turn:
+    """
+    一轮对话的输出缓冲：生成在后台任务中进行，与客户端连接解耦。
+    事件按 seq 递增写入环形缓冲，断线重连的客户端从 Last-Event-ID 之后继续；
+    所需事件已被挤出缓冲时，先发送一个快照事件（缓冲中最早事件之前的完整回复），再从缓冲继续。
+    最后一个订阅者离开后等待 disconnect_grace 秒，仍无人重连则以 client_disconnected 取消本轮。
+    """
+
+    def __init__(self, turn_id: str, buffer_size: int, disconnect_grace: float = 0.0):
+        self.id = turn_id
+        self.events: Deque[TurnEvent] = deque(maxlen=buffer_size)
+        self.seq = 0
+        self.text = ""
+        self.session_id: Optional[str] = None
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.cancel_token = CancellationToken()
+        self.subscribers = 0
+        self.disconnect_grace = disconnect_grace
+        self._grace_handle: Optional[asyncio.TimerHandle] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, data: Dict[str, Any], event: Optional[str] = None) -> TurnEvent:
+        self.seq += 1
+        turn_event = TurnEvent(self.id, self.seq, data, event, len(self.text))
+        self.events.append(turn_event)
+        self._notify()
+        return turn_event
+
+    def delta(self, text: str) -> None:
+        self.publish({"delta": text})
+        self.text += text
+
+    def retract(self, data: Dict[str, Any]) -> TurnEvent:
+        """
+        撤回已发出的增量（如安全拦截）：清空缓冲与回复，发布替换用的快照事件 data。
+        之后重连或落后的订阅者只会收到空快照与 data，不会再收到被撤回的内容。
+        """
+        self.events.clear()
+        self.text = ""
+        turn_event = self.publish(data)
+        self.text = data.get("snapshot", "")
+        return turn_event
+
+    def finish(self) -> None:
+        if self.done:
+            return
+        self.done = True
+        self.finished_at = time.monotonic()
+        if self._grace_handle is not None:
+            self._grace_handle.cancel()
+            self._grace_handle = None
+        self._notify()
+
+    def cancel(self, reason: str) -> bool:
+        """取消本轮生成；已结束或已取消时返回 False"""
+        if self.done or not self.cancel_token.cancel(reason):
+            return False
+        logger.info(f"Turn {self.id} cancelled: {reason}")
+        TURNS_CANCELLED.labels(reason=reason).inc()
+        return True
+
+    def _subscribe(self) -> None:
+        self.subscribers += 1
+        if self._grace_handle is not None:
+            self._grace_handle.cancel()
+            self._grace_handle = None
+
+    def _unsubscribe(self) -> None:
+        self.subscribers -= 1
+        if self.subscribers or self.done:
+            return
+        if self.disconnect_grace <= 0:
+            self.cancel("client_disconnected")
+        else:
+            # 给断线重连留出时间，期间有人续传则取消计时
+            self._grace_handle = asyncio.get_running_loop().call_later(
+                self.disconnect_grace, self._on_abandoned
+            )
+
+    def _on_abandoned(self) -> None:
+        self._grace_handle = None
+        if not self.subscribers:
+            self.cancel("client_disconnected")
+
+    def _snapshot(self) -> TurnEvent:
+        oldest = self.events[0]
+        data: Dict[str, Any] = {"snapshot": self.text[:oldest.text_start]}
+        if self.session_id:
+            data["session_id"] = self.session_id
+        return TurnEvent(self.id, oldest.seq - 1, data, text_start=0)
+
+    async def follow(self, after_seq: int = 0) -> AsyncIterator[TurnEvent]:
+        """产出 seq 大于 after_seq 的事件，直到本轮结束"""
+        cursor = after_seq
+        self._subscribe()
+        try:
+            while True:
+                while cursor < self.seq:
+                    oldest = self.events[0].seq
+                    if cursor + 1 < oldest:
+                        logger.info(f"Turn {self.id}: events after {cursor} evicted, sending snapshot up to {oldest - 1}")
+                        snapshot = self._snapshot()
+                        cursor = snapshot.seq
+                        yield snapshot
+                        continue
+                    # 每次按 seq 重新定位：产出期间缓冲可能追加或挤出事件
+                    turn_event = self.events[cursor + 1 - oldest]
+                    cursor = turn_event.seq
+                    yield turn_event
+                if self.done:
+                    return
+                await self._changed.wait()
+        finally:
+            self._unsubscribe()
+
+
+def parse_event_id(event_id: str) -> Optional[Tuple[str, int]]:
+    """解析 "turn_id:seq" 形式的事件 ID"""
+    turn_id, sep, seq = (event_id or "").strip().rpartition(":")
+    if not sep or not turn_id or not seq.isdigit():
+        return None
+    return turn_id, int(seq)
+
+
+class TurnRegistry:
+    """进行中与刚结束的对话轮次；结束超过 TTL 的轮次在访问时清理"""
+
+    def __init__(self, ttl: float, buffer_size: int, disconnect_grace: float = 0.0):
+        self.ttl = ttl
+        self.buffer_size = buffer_size
+        self.disconnect_grace = disconnect_grace
+        self._turns: Dict[str, Turn] = {}
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        expired = [
+            turn_id for turn_id, turn in self._turns.items()
+            if turn.finished_at is not None and now - turn.finished_at > self.ttl
+        ]
+        for turn_id in expired:
+            del self._turns[turn_id]
+
+    def create(self) -> Turn:
+        self._purge()
+        turn = Turn(uuid.uuid4().hex, self.buffer_size, self.disconnect_grace)
+        self._turns[turn.id] = turn
+        return turn
+
+    def get(self, turn_id: str) -> Optional[Turn]:
+        self._purge()
+        return self._turns.get(turn_id)
+
+    def resume(self, last_event_id: str) -> Optional[Tuple[Turn, int]]:
+        """按 Last-Event-ID 找到对应轮次与续传位置；轮次不存在或已过期时返回 None"""
+        parsed = parse_event_id(last_event_id)
+        if parsed is None:
+            return None
+        turn = self.get(parsed[0])
+        if turn is None:
+            return None
+        return turn, min(parsed[1], turn.seq)
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+
+# 全局对话轮次注册表
+turn_registry = TurnRegistry(
+    ttl=settings.SSE_REPLAY_TTL,
+    buffer_size=settings.SSE_REPLAY_BUFFER_EVENTS,
+    disconnect_grace=settings.TURN_DISCONNECT_GRACE,
+)
@@ -0,0 +1,91 @@
+"""
+LLM 连接池测试台：在本地启动多个假端点（快 / 长尾 / 不稳定），
+用 LLMPool 并发发起流式请求，对比开启与关闭对冲时的 TTFT 分布与故障转移情况。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_llm_pool.py --requests 200 --concurrency 10
+    python benchmarks/bench_llm_pool.py --hedge --requests 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_openai import FakeProfile, create_fake_app, serve  # noqa: E402
+
+
+PROFILES = [
+    FakeProfile(name="fast-tail", ttft_ms=120, ttft_tail_ms=1500, ttft_tail_prob=0.1, tokens_per_sec=200),
+    FakeProfile(name="steady", ttft_ms=250, tokens_per_sec=200),
+    FakeProfile(name="flaky", ttft_ms=100, tokens_per_sec=200, error_rate=0.3),
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+async def main(args):
+    # 在导入 app 之前设置对冲参数
+    os.environ.setdefault("LLM_API_KEY", "fake")
+    os.environ["LLM_HEDGE_MIN_SAMPLES"] = str(args.hedge_min_samples)
+    os.environ["LLM_HEDGE_MIN_MS"] = str(args.hedge_min_ms)
+    from langchain_core.messages import HumanMessage
+    from app.lang.llm_pool import LLMEndpoint, LLMPool
+
+    servers = []
+    endpoints = []
+    for index, profile in enumerate(PROFILES):
+        port = args.base_port + index
+        servers.append(await serve(create_fake_app(profile), port))
+        endpoints.append(LLMEndpoint(profile.name, f"http://127.0.0.1:{port}/v1", "fake"))
+    pool = LLMPool(endpoints, hedge_enabled=args.hedge, hedge_percentile=args.hedge_percentile)
+
+    ttfts, totals, errors = [], [], 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            first = None
+            try:
+                async for _ in pool.astream([HumanMessage(content=f"request {i}")], model="fake-model"):
+                    if first is None:
+                        first = time.perf_counter() - started
+                ttfts.append(first * 1000)
+                totals.append((time.perf_counter() - started) * 1000)
+            except Exception:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    for server in servers:
+        server.should_exit = True
+
+    print(f"hedging={'on' if args.hedge else 'off'} requests={args.requests} concurrency={args.concurrency} "
+          f"elapsed={elapsed:.1f}s errors={errors}")
+    print(f"TTFT ms: p50={percentile(ttfts, 50):.0f} p90={percentile(ttfts, 90):.0f} p99={percentile(ttfts, 99):.0f}")
+    print(f"turn ms: p50={percentile(totals, 50):.0f} p99={percentile(totals, 99):.0f}")
+    print(json.dumps(pool.snapshot(), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM pool failover/hedging harness")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--hedge", action="store_true")
+    parser.add_argument("--hedge-percentile", type=float, default=90)
+    parser.add_argument("--hedge-min-samples", type=int, default=10)
+    parser.add_argument("--hedge-min-ms", type=float, default=50)
+    parser.add_argument("--base-port", type=int, default=9101)
+    asyncio.run(main(parser.parse_args()))
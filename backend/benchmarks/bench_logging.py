@@ -0,0 +1,159 @@
+"""
+日志开销基准：模拟一轮对话在请求线程上产生的日志调用，对比三种配置下每轮阻塞调用方的时间。
+
+- legacy：原 setup_logging——终端与 RotatingFileHandler 同步写在调用线程上，并强制
+  app.services.memory / app.lang.graph / app.routes.chat 为 DEBUG，日志内容为原来每轮的完整输入与多行配置转储；
+- queue：同样的旧日志调用，但经过 QueueHandler，格式化与写盘移到 QueueListener 线程；
+- current：队列管道 + 精简后的每轮日志（INFO 级别下只剩少数几条）。
+
+终端输出写到 /dev/null，文件写到临时目录；"drain" 为 QueueListener 写完剩余日志的时间，不计入请求线程；
+"dropped" 为队列写满时丢弃的条数（不为 0 时调大 LOG_QUEUE_SIZE 再比较）。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_logging.py --turns 2000
+    python benchmarks/bench_logging.py --turns 2000 --format text --input-chars 2000
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.logging_config import get_log_levels, setup_logging, stop_logging  # noqa: E402
+
+memory_log = logging.getLogger("app.services.memory")
+graph_log = logging.getLogger("app.lang.graph")
+chat_log = logging.getLogger("app.routes.chat")
+
+
+def legacy_turn(user_input: str, reply: str, turn: int) -> None:
+    """改动前每轮（含一次记忆提取）在请求路径上的日志"""
+    session_context = {"session_id": f"s{turn}", "user_id": "u1", "history": ["..."] * 6}
+    graph_log.info(f"run_stream called: user_input={user_input[:100]}..., session_context={session_context}")
+    graph_log.debug(f"Retrieved 5 relevant memories for query: {user_input[:50]}...")
+    memory_log.info(f"=== Adding conversation memories ===")
+    memory_log.info(f"user_id=u1, session_id=s{turn}")
+    memory_log.info(f"user_input={user_input}")
+    memory_log.info(f"assistant_reply length={len(reply)}")
+    memory_log.info("Attempting to extract key memories using LLM...")
+    memory_log.info(f"Extracting memories from conversation: user_input={user_input[:50]}...")
+    memory_log.info(f"Memory extraction response: {reply[:200]}...")
+    for idx in range(2):
+        memory_log.info(f"Processing memory {idx+1}/2: type=preference, importance=high")
+        memory_log.info(f"Memory.add returned: {{'results': [{{'id': 'm{turn}-{idx}', 'event': 'ADD'}}]}}")
+        memory_log.info(f"✓ Successfully added memory with id=m{turn}-{idx}")
+        memory_log.info(f"✓ Added memory {idx+1}/2: id=m{turn}-{idx}, type=preference, content={user_input[:50]}...")
+    memory_log.info(f"=== Memory addition completed: 2/2 memories added ===")
+    chat_log.debug(f"Turn t{turn} finished")
+
+
+def current_turn(user_input: str, reply: str, turn: int) -> None:
+    """改动后同一轮的日志调用"""
+    graph_log.debug(f"run_stream called: input_length={len(user_input)}, session_id=s{turn}")
+    graph_log.debug("Retrieved 5 relevant memories")
+    memory_log.debug(f"Adding conversation memories: user_id=u1, session_id=s{turn}, "
+                     f"input_length={len(user_input)}, reply_length={len(reply)}")
+    memory_log.debug("Attempting to extract key memories using LLM")
+    memory_log.debug(f"Extracting memories from conversation: input_length={len(user_input)}")
+    memory_log.debug(f"Memory extraction response length: {len(reply)}")
+    for idx in range(2):
+        memory_log.debug(f"Processing memory {idx+1}/2: type=preference, importance=high")
+        memory_log.debug(f"Memory.add returned: {{'results': [{{'id': 'm{turn}-{idx}', 'event': 'ADD'}}]}}")
+        memory_log.debug(f"Added memory id=m{turn}-{idx}")
+        memory_log.debug(f"Added memory {idx+1}/2: id=m{turn}-{idx}, type=preference")
+    memory_log.info(f"Memory addition completed: 2/2 memories added for user_id=u1")
+    chat_log.debug(f"Turn t{turn} finished")
+
+
+def setup_legacy(log_dir: Path, stream) -> None:
+    """改动前的 setup_logging（同步处理器 + 强制 DEBUG）"""
+    fmt = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s", "%Y-%m-%d %H:%M:%S")
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.setLevel(logging.INFO)
+    console = logging.StreamHandler(stream)
+    console.setFormatter(fmt)
+    root.addHandler(console)
+    file_handler = RotatingFileHandler(log_dir / "app.log", maxBytes=10 * 1024 * 1024, backupCount=5, encoding="utf-8")
+    file_handler.setFormatter(fmt)
+    root.addHandler(file_handler)
+    for name in ("app.services.memory", "app.lang.graph", "app.routes.chat"):
+        logging.getLogger(name).setLevel(logging.DEBUG)
+
+
+def reset_levels() -> None:
+    for name in ("app.services.memory", "app.lang.graph", "app.routes.chat"):
+        logging.getLogger(name).setLevel(logging.NOTSET)
+
+
+def run_mode(mode: str, args, stream) -> dict:
+    user_input = ("我喜欢用 Python 写后端，" * args.input_chars)[:args.input_chars]
+    reply = "好的，" * 200
+    with tempfile.TemporaryDirectory() as tmp:
+        reset_levels()
+        if mode == "legacy":
+            setup_legacy(Path(tmp), stream)
+        else:
+            setup_logging(level="INFO", fmt=args.format, log_dir=Path(tmp), stream=stream)
+            if mode == "queue":
+                # 与 legacy 输出相同的条数，只比较写入方式
+                for name in ("app.services.memory", "app.lang.graph", "app.routes.chat"):
+                    logging.getLogger(name).setLevel(logging.DEBUG)
+        emit = current_turn if mode == "current" else legacy_turn
+
+        for turn in range(min(args.turns, 100)):
+            emit(user_input, reply, turn)
+        samples = []
+        for turn in range(args.turns):
+            started = time.perf_counter()
+            emit(user_input, reply, turn)
+            samples.append((time.perf_counter() - started) * 1e6)
+
+        dropped = 0 if mode == "legacy" else get_log_levels()["dropped"]
+        drain_started = time.perf_counter()
+        if mode == "legacy":
+            for handler in logging.getLogger().handlers:
+                handler.flush()
+                handler.close()
+            logging.getLogger().handlers.clear()
+        else:
+            stop_logging()
+        drain_ms = (time.perf_counter() - drain_started) * 1000
+        log_bytes = sum(p.stat().st_size for p in Path(tmp).glob("app.log*"))
+    samples.sort()
+    return {
+        "mode": mode,
+        "mean_us": statistics.fmean(samples),
+        "p50_us": samples[len(samples) // 2],
+        "p99_us": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        "drain_ms": drain_ms,
+        "dropped": dropped,
+        "kb_per_turn": log_bytes / 1024 / (args.turns + min(args.turns, 100)),
+    }
+
+
+def main(args):
+    with open(os.devnull, "w", encoding="utf-8") as stream:
+        results = [run_mode(mode, args, stream) for mode in args.modes]
+    reset_levels()
+    print(f"turns={args.turns} input_chars={args.input_chars} format={args.format}")
+    for r in results:
+        print(
+            f"{r['mode']:<8} per-turn on caller: mean={r['mean_us']:8.1f}us p50={r['p50_us']:8.1f}us "
+            f"p99={r['p99_us']:8.1f}us | drain={r['drain_ms']:7.1f}ms dropped={r['dropped']} | file {r['kb_per_turn']:.2f} KB/turn"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-turn logging cost: legacy sync handlers vs queue pipeline")
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--input-chars", type=int, default=500, help="length of the simulated user input")
+    parser.add_argument("--format", choices=["json", "text"], default="json", help="format for the queue modes")
+    parser.add_argument("--modes", nargs="+", choices=["legacy", "queue", "current"], default=["legacy", "queue", "current"])
+    main(parser.parse_args())
@@ -0,0 +1,155 @@
+"""
+记忆检索基准：对比 vector / lexical / hybrid 三种模式的延迟与召回率。
+
+默认使用合成语料 + 本地哈希向量模拟向量检索，并用 --embed-latency-ms 模拟远程嵌入耗时；
+加 --live 时改为调用真实的 memory_manager（需配置好 mem0 与嵌入服务，且用户已有记忆）。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_memory_retrieval.py --docs 2000 --queries 200
+    python benchmarks/bench_memory_retrieval.py --live --user-id session_xxx --queries-file queries.txt
+"""
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.lexical_index import BM25Index, rrf_fuse, tokenize  # noqa: E402
+
+
+SUBJECTS = ["猫", "狗", "咖啡", "绿茶", "爬山", "游泳", "Python", "Rust", "爵士乐", "摇滚", "寿司", "火锅",
+            "马拉松", "摄影", "围棋", "滑雪", "Kubernetes", "PostgreSQL", "科幻小说", "油画"]
+CITIES = ["北京", "上海", "深圳", "杭州", "成都", "西安", "南京", "武汉", "广州", "重庆"]
+TEMPLATES = [
+    ("用户喜欢{s}，尤其是周末的时候", "我周末喜欢什么"),
+    ("用户不喜欢{s}", "有什么是我不喜欢的"),
+    ("用户在{c}工作，主要做{s}相关的事情", "我在哪里做{s}"),
+    ("用户计划下个月去{c}学习{s}", "下个月的{s}计划"),
+    ("用户的朋友在{c}开了一家{s}店", "朋友在{c}开的店"),
+]
+
+
+def build_corpus(n_docs: int, n_queries: int, seed: int):
+    rng = random.Random(seed)
+    docs = {}
+    queries = []
+    for i in range(n_docs):
+        template, question = rng.choice(TEMPLATES)
+        s, c = rng.choice(SUBJECTS), rng.choice(CITIES)
+        doc_id = f"m{i}"
+        docs[doc_id] = template.format(s=s, c=c)
+        if len(queries) < n_queries and rng.random() < max(n_queries / n_docs, 0.05):
+            # 查询包含文档的关键实体，模拟用户换一种说法提问
+            queries.append((f"{question.format(s=s, c=c)}？{s} {c}", doc_id))
+    return docs, queries
+
+
+def hash_embed(text: str, dims: int = 256):
+    """本地字 n-gram 哈希向量，用作向量检索的替身"""
+    vec = [0.0] * dims
+    for token in tokenize(text):
+        h = int(hashlib.md5(token.encode("utf-8")).hexdigest(), 16)
+        vec[h % dims] += 1.0 if (h >> 8) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+class SimulatedVectorStore:
+    def __init__(self, docs, embed_latency_ms: float):
+        self.embed_latency_ms = embed_latency_ms
+        self.vectors = {doc_id: hash_embed(text) for doc_id, text in docs.items()}
+
+    async def search(self, query: str, limit: int):
+        # 远程嵌入调用是向量路径的主要耗时
+        await asyncio.sleep(self.embed_latency_ms / 1000)
+        q = hash_embed(query)
+        scored = [(sum(a * b for a, b in zip(q, vec)), doc_id) for doc_id, vec in self.vectors.items()]
+        scored.sort(reverse=True)
+        return [doc_id for _, doc_id in scored[:limit]]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+async def run_synthetic(args):
+    docs, queries = build_corpus(args.docs, args.queries, args.seed)
+    index = BM25Index()
+    started = time.perf_counter()
+    for doc_id, text in docs.items():
+        index.add(doc_id, text)
+    build_ms = (time.perf_counter() - started) * 1000
+    store = SimulatedVectorStore(docs, args.embed_latency_ms)
+
+    async def vector(q):
+        return await store.search(q, args.k)
+
+    async def lexical(q):
+        return [doc_id for doc_id, _ in index.search(q, args.k)]
+
+    async def hybrid(q):
+        vec, lex = await asyncio.gather(vector(q), lexical(q))
+        return rrf_fuse([vec, lex], limit=args.k)
+
+    print(f"corpus: {len(docs)} docs, {len(queries)} queries, k={args.k}, "
+          f"simulated embed latency={args.embed_latency_ms}ms, index build={build_ms:.1f}ms")
+    print(f"{'mode':<8} {'recall@k':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, fn in (("vector", vector), ("lexical", lexical), ("hybrid", hybrid)):
+        latencies, hits = [], 0
+        for query, expected in queries:
+            t0 = time.perf_counter()
+            result = await fn(query)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            hits += expected in result
+        recall = hits / len(queries) if queries else 0.0
+        print(f"{name:<8} {recall:>9.3f} {percentile(latencies, 50):>9.2f} {percentile(latencies, 99):>9.2f}")
+
+
+async def run_live(args):
+    from app.services.memory import memory_manager
+
+    queries = [line.strip() for line in Path(args.queries_file).read_text(encoding="utf-8").splitlines() if line.strip()]
+    # 以 vector 模式的结果作为召回参照
+    reference = {q: await memory_manager.get_relevant_memories(q, args.user_id, args.k, mode="vector") for q in queries}
+    print(f"live: user_id={args.user_id}, {len(queries)} queries, k={args.k}")
+    print(f"{'mode':<8} {'overlap@k':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for mode in ("vector", "lexical", "hybrid"):
+        latencies, overlap = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            result = await memory_manager.get_relevant_memories(q, args.user_id, args.k, mode=mode)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            ref = set(reference[q])
+            overlap.append(len(ref & set(result)) / len(ref) if ref else 1.0)
+        print(f"{mode:<8} {statistics.mean(overlap):>9.3f} {percentile(latencies, 50):>9.2f} {percentile(latencies, 99):>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory retrieval benchmark")
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embed-latency-ms", type=float, default=150.0)
+    parser.add_argument("--live", action="store_true")
+    parser.add_argument("--user-id")
+    parser.add_argument("--queries-file")
+    args = parser.parse_args()
+    if args.live:
+        if not args.user_id or not args.queries_file:
+            parser.error("--live requires --user-id and --queries-file")
+        asyncio.run(run_live(args))
+    else:
+        asyncio.run(run_synthetic(args))
+
+
+if __name__ == "__main__":
+    main()
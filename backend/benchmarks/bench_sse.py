@@ -0,0 +1,97 @@
+"""
+SSE 编码基准：对比逐 token 发送（json.dumps + f-string + encode）与帧合并 + 预构造前缀的编码路径。
+
+每个产出的帧对应一次 ASGI http.response.body 消息，也就是一次 socket 写（send 系统调用）。
+基准把帧写入本地 socketpair 并在另一端读出，"writes/reply" 即每个回复的 send 次数；
+CPU 以进程 CPU 时间（含编码与系统调用）换算到每 1k token。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_sse.py --replies 50 --tokens 500 --tokens-per-sec 300
+    python benchmarks/bench_sse.py --coalesce-ms 30 --coalesce-bytes 1024
+"""
+import argparse
+import asyncio
+import json
+import socket
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.sse import coalesce, delta_frame  # noqa: E402
+
+
+async def token_source(tokens: int, tokens_per_sec: float):
+    """模拟上游 token 流；tokens_per_sec 为 0 时不间断产出"""
+    interval = 1 / tokens_per_sec if tokens_per_sec > 0 else 0
+    for i in range(tokens):
+        if interval:
+            await asyncio.sleep(interval)
+        yield f"词{i} "
+
+
+async def legacy_frames(args):
+    async for chunk in token_source(args.tokens, args.tokens_per_sec):
+        payload = json.dumps({"delta": chunk})
+        yield f"data: {payload}\n\n".encode("utf-8")
+
+
+async def coalesced_frames(args):
+    stream = coalesce(token_source(args.tokens, args.tokens_per_sec), args.coalesce_ms, args.coalesce_bytes)
+    async for chunk in stream:
+        yield delta_frame(chunk)
+
+
+async def run(name, make_frames, args):
+    writes = 0
+    written = 0
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+
+    loop = asyncio.get_running_loop()
+
+    async def drain(sock):
+        while await loop.sock_recv(sock, 65536):
+            pass
+
+    async def one():
+        nonlocal writes, written
+        client, server = socket.socketpair()
+        client.setblocking(False)
+        server.setblocking(False)
+        reader = asyncio.create_task(drain(client))
+        try:
+            async for frame in make_frames(args):
+                await loop.sock_sendall(server, frame)
+                writes += 1
+                written += len(frame)
+        finally:
+            server.close()
+            await reader
+            client.close()
+
+    await asyncio.gather(*(one() for _ in range(args.replies)))
+    cpu = time.process_time() - cpu_started
+    elapsed = time.perf_counter() - started
+    total_tokens = args.replies * args.tokens
+    print(f"{name:10s} cpu/1k tokens={cpu / total_tokens * 1000 * 1000:7.2f}ms "
+          f"writes/reply={writes / args.replies:7.1f} bytes/reply={written / args.replies:9.0f} "
+          f"wall={elapsed:.2f}s")
+
+
+async def main(args):
+    print(f"replies={args.replies} tokens/reply={args.tokens} tokens/sec={args.tokens_per_sec} "
+          f"coalesce_ms={args.coalesce_ms} coalesce_bytes={args.coalesce_bytes}")
+    await run("legacy", legacy_frames, args)
+    await run("coalesced", coalesced_frames, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SSE frame encoding benchmark")
+    parser.add_argument("--replies", type=int, default=50, help="concurrent replies")
+    parser.add_argument("--tokens", type=int, default=500, help="tokens per reply")
+    parser.add_argument("--tokens-per-sec", type=float, default=300.0)
+    parser.add_argument("--coalesce-ms", type=float, default=15.0)
+    parser.add_argument("--coalesce-bytes", type=int, default=512)
+    asyncio.run(main(parser.parse_args()))
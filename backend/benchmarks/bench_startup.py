@@ -0,0 +1,125 @@
+"""
+启动开销基准：在全新的子进程中用 python -X importtime 导入 app.main，统计导入耗时，
+并列出导入最慢的顶层依赖，用于跟踪"重依赖延迟导入"的效果、防止回退。
+
+- wall：子进程从启动到导入完成的总时间（含解释器启动），取多次运行的中位数与最小值；
+- import：-X importtime 报告的 app.main 累计导入时间；
+- top：按顶层包归并各模块自身耗时后最重的依赖（如 sqlalchemy、langchain_core）。
+
+导入 app.main 不应连接数据库或外部服务；子进程里 DATABASE_URL 默认指向一个临时 sqlite 文件，
+如果导入时仍有连接或反射发生，会体现在 sqlalchemy 的耗时里。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --runs 5 --output startup.json
+    python benchmarks/bench_startup.py --runs 5 --baseline startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def parse_importtime(stderr: str):
+    """解析 -X importtime 输出，返回 {模块: (自身 us, 累计 us)}"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue
+        name = parts[2].strip()
+        # 同一模块只记录第一次（真正执行导入的那次）
+        modules.setdefault(name, (self_us, cumulative_us))
+    return modules
+
+
+def top_packages(modules, limit: int):
+    """按顶层包名归并自身耗时，得到各依赖对启动的实际贡献"""
+    totals = defaultdict(int)
+    for name, (self_us, _) in modules.items():
+        totals[name.split(".")[0]] += self_us
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [{"package": name, "self_ms": round(us / 1000, 1)} for name, us in ranked]
+
+
+def run_once(module: str, env) -> dict:
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        tail = "\n".join(line for line in proc.stderr.splitlines() if not line.startswith("import time:"))[-2000:]
+        raise SystemExit(f"import {module} failed:\n{tail}")
+    modules = parse_importtime(proc.stderr)
+    import_us = modules.get(module, (0, 0))[1]
+    return {"wall_ms": wall_ms, "import_ms": import_us / 1000, "modules": modules}
+
+
+def main(args) -> None:
+    env = dict(os.environ)
+    env.setdefault("LLM_API_KEY", "fake")
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as tmpdir:
+        env.setdefault("DATABASE_URL", f"sqlite:///{tmpdir}/startup.db")
+        # 第一次运行用于生成字节码缓存，不计入结果
+        run_once(args.module, env)
+        runs = [run_once(args.module, env) for _ in range(args.runs)]
+
+    wall = [r["wall_ms"] for r in runs]
+    imports = [r["import_ms"] for r in runs]
+    fastest = min(runs, key=lambda r: r["import_ms"])
+    report = {
+        "module": args.module,
+        "runs": args.runs,
+        "wall_ms": {"median": round(statistics.median(wall), 1), "min": round(min(wall), 1)},
+        "import_ms": {"median": round(statistics.median(imports), 1), "min": round(min(imports), 1)},
+        "modules_imported": len(fastest["modules"]),
+        "top": top_packages(fastest["modules"], args.top),
+    }
+
+    print(f"import {args.module}: median {report['import_ms']['median']}ms "
+          f"(min {report['import_ms']['min']}ms), wall median {report['wall_ms']['median']}ms, "
+          f"{report['modules_imported']} modules")
+    print(f"{'package':<32}{'self ms':>10}")
+    for entry in report["top"]:
+        print(f"{entry['package']:<32}{entry['self_ms']:>10}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        before, after = baseline["import_ms"]["median"], report["import_ms"]["median"]
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"\nvs baseline: {before}ms -> {after}ms ({change:+.1f}%)")
+        before_top = {e["package"]: e["self_ms"] for e in baseline.get("top", [])}
+        for entry in report["top"]:
+            if entry["package"] not in before_top:
+                print(f"  new in top: {entry['package']} ({entry['self_ms']}ms)")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        print(f"\nreport written to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time startup benchmark")
+    parser.add_argument("--module", default="app.main", help="要导入的模块")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="列出导入耗时最高的前 N 个顶层包")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--baseline", help="与之前 --output 写出的结果对比")
+    main(parser.parse_args())
@@ -0,0 +1,257 @@
+"""
+本地 OpenAI 兼容假服务，用于在不消耗真实 LLM 的情况下测试与压测后端。
+
+提供 /v1/chat/completions（流式与非流式）、/v1/embeddings 与 /v1/models。
+可配置首 token 延迟分布（固定 / 对数正态 + 长尾）、token 速率与抖动、错误注入
+（请求前 500、429 限流、流中途断开）。单独运行：
+    python benchmarks/fake_openai.py --port 9001 --ttft-ms 200 --ttft-dist lognormal --tokens-per-sec 50 --error-rate 0.05
+然后把 LLM_API_BASE 与 EMBEDDING_API_BASE 指向 http://127.0.0.1:9001/v1。
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class FakeProfile:
+    name: str = "fake"
+    ttft_ms: float = 200.0
+    # fixed：固定为 ttft_ms；lognormal：以 ttft_ms 为中位数、ttft_sigma 为对数标准差
+    ttft_dist: str = "fixed"
+    ttft_sigma: float = 0.5
+    # 以 ttft_tail_prob 的概率把首 token 延迟拉长到 ttft_tail_ms，模拟长尾
+    ttft_tail_ms: float = 0.0
+    ttft_tail_prob: float = 0.0
+    tokens_per_sec: float = 50.0
+    # token 间隔的相对抖动（0.2 表示 ±20%）
+    token_jitter: float = 0.0
+    reply_tokens: int = 64
+    # 请求前返回 500 / 429 的概率，以及流式输出中途断开的概率
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    midstream_error_rate: float = 0.0
+    embedding_dim: int = 1536
+    embedding_latency_ms: float = 20.0
+
+    def sample_ttft(self) -> float:
+        if self.ttft_tail_prob and random.random() < self.ttft_tail_prob:
+            return self.ttft_tail_ms / 1000
+        if self.ttft_dist == "lognormal" and self.ttft_ms > 0:
+            return random.lognormvariate(math.log(self.ttft_ms), self.ttft_sigma) / 1000
+        return self.ttft_ms / 1000
+
+    def sample_interval(self) -> float:
+        if self.tokens_per_sec <= 0:
+            return 0.0
+        interval = 1 / self.tokens_per_sec
+        if self.token_jitter:
+            interval *= max(0.0, 1 + random.uniform(-self.token_jitter, self.token_jitter))
+        return interval
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]", re.I)
+
+
+@lru_cache(maxsize=65536)
+def _token_vector(token: str, dim: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(token.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+def fake_embedding(text: str, dim: int) -> np.ndarray:
+    """确定性的词袋哈希向量：共享词越多余弦相似度越高，足以驱动检索与缓存逻辑"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in _TOKEN_RE.findall(text.lower()) or [text]:
+        vector += _token_vector(token, dim)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+def _reply_tokens(profile: FakeProfile):
+    return [f"tok{i} " for i in range(profile.reply_tokens)]
+
+
+def create_fake_app(profile: FakeProfile) -> FastAPI:
+    app = FastAPI(title=f"Fake OpenAI ({profile.name})")
+    app.state.profile = profile
+    app.state.requests = 0
+
+    def error_response():
+        return JSONResponse(
+            status_code=500,
+            content={"error": {"message": f"injected error from {profile.name}", "type": "server_error"}},
+        )
+
+    def injected_error():
+        roll = random.random()
+        if roll < profile.error_rate:
+            return error_response()
+        if roll < profile.error_rate + profile.rate_limit_rate:
+            return JSONResponse(
+                status_code=429,
+                headers={"Retry-After": "1"},
+                content={"error": {"message": f"injected rate limit from {profile.name}", "type": "rate_limit_error"}},
+            )
+        return None
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "fake-model", "object": "model", "owned_by": profile.name}]}
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        error = injected_error()
+        if error is not None:
+            return error
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dim = int(body.get("dimensions") or profile.embedding_dim)
+        await asyncio.sleep(profile.embedding_latency_ms / 1000)
+        data = []
+        for index, text in enumerate(inputs):
+            vector = fake_embedding(str(text), dim)
+            if body.get("encoding_format") == "base64":
+                # openai SDK 在装有 numpy 时默认请求 base64 编码的 float32
+                embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = sum(len(str(text)) for text in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "fake-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        model = body.get("model", "fake-model")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        error = injected_error()
+        if error is not None:
+            return error
+
+        tokens = _reply_tokens(profile)
+        ttft = profile.sample_ttft()
+
+        if not body.get("stream"):
+            await asyncio.sleep(ttft + sum(profile.sample_interval() for _ in tokens))
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": len(tokens), "total_tokens": 10 + len(tokens)},
+            }
+
+        def chunk(delta, finish_reason=None):
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+        # 流式输出中途断开：在随机位置抛出异常，连接被异常关闭
+        break_at = random.randrange(1, len(tokens)) if len(tokens) > 1 and random.random() < profile.midstream_error_rate else None
+
+        async def stream():
+            await asyncio.sleep(ttft)
+            yield chunk({"role": "assistant", "content": ""})
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(profile.sample_interval())
+                if i == break_at:
+                    raise ConnectionError(f"injected mid-stream failure from {profile.name}")
+                yield chunk({"content": token})
+            yield chunk({}, "stop")
+            yield b"data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+async def serve(app: FastAPI, port: int, host: str = "127.0.0.1"):
+    """在当前事件循环中启动假服务，返回 uvicorn.Server（调用 should_exit=True 停止）"""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server
+
+
+def add_profile_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--ttft-ms", type=float, default=200.0)
+    parser.add_argument("--ttft-dist", choices=["fixed", "lognormal"], default="fixed")
+    parser.add_argument("--ttft-sigma", type=float, default=0.5)
+    parser.add_argument("--ttft-tail-ms", type=float, default=0.0)
+    parser.add_argument("--ttft-tail-prob", type=float, default=0.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--token-jitter", type=float, default=0.0)
+    parser.add_argument("--reply-tokens", type=int, default=64)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--midstream-error-rate", type=float, default=0.0)
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    parser.add_argument("--embedding-latency-ms", type=float, default=20.0)
+
+
+def profile_from_args(args, name: str = "fake") -> FakeProfile:
+    return FakeProfile(
+        name=name,
+        ttft_ms=args.ttft_ms,
+        ttft_dist=args.ttft_dist,
+        ttft_sigma=args.ttft_sigma,
+        ttft_tail_ms=args.ttft_tail_ms,
+        ttft_tail_prob=args.ttft_tail_prob,
+        tokens_per_sec=args.tokens_per_sec,
+        token_jitter=args.token_jitter,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        midstream_error_rate=args.midstream_error_rate,
+        embedding_dim=args.embedding_dim,
+        embedding_latency_ms=args.embedding_latency_ms,
+    )
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    add_profile_args(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_fake_app(profile_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
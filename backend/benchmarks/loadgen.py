@@ -0,0 +1,212 @@
+"""
+后端负载生成器：以闭环并发（每个 worker 收到回复后立即发下一轮）压测 /api/chat 与 /api/chat/stream，
+逐个并发级别报告 TTFT、增量间隔、每轮耗时 p50/p99、吞吐与错误率。
+
+配合 fake_openai.py 使用，不消耗真实 LLM（在 backend 目录下）：
+    python benchmarks/fake_openai.py --port 9001 --ttft-ms 200 --ttft-dist lognormal --tokens-per-sec 50
+    LLM_API_BASE=http://127.0.0.1:9001/v1 EMBEDDING_API_BASE=http://127.0.0.1:9001/v1 LLM_API_KEY=fake \\
+        uvicorn app.main:app --port 8000
+    python benchmarks/loadgen.py --base-url http://127.0.0.1:8000 --endpoint stream --concurrency 1,8,32 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import httpx
+
+
+DEFAULT_PROMPTS = [
+    "你好，介绍一下你自己",
+    "帮我写一段 Python 快速排序",
+    "解释一下 TCP 三次握手",
+    "推荐几本关于分布式系统的书",
+    "把这句话翻译成英文：今天天气很好",
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+@dataclass
+class TurnResult:
+    ok: bool
+    total_ms: float
+    ttft_ms: Optional[float] = None
+    gaps_ms: List[float] = field(default_factory=list)
+    chars: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class LevelStats:
+    endpoint: str
+    concurrency: int
+    elapsed: float = 0.0
+    results: List[TurnResult] = field(default_factory=list)
+
+    def summary(self) -> dict:
+        ok = [r for r in self.results if r.ok]
+        errors = len(self.results) - len(ok)
+        ttfts = [r.ttft_ms for r in ok if r.ttft_ms is not None]
+        gaps = [gap for r in ok for gap in r.gaps_ms]
+        totals = [r.total_ms for r in ok]
+        error_kinds: dict = {}
+        for r in self.results:
+            if not r.ok:
+                error_kinds[r.error] = error_kinds.get(r.error, 0) + 1
+        return {
+            "endpoint": self.endpoint,
+            "concurrency": self.concurrency,
+            "turns": len(self.results),
+            "errors": errors,
+            "error_rate": round(errors / len(self.results), 4) if self.results else 0.0,
+            "error_kinds": error_kinds,
+            "turns_per_sec": round(len(ok) / self.elapsed, 2) if self.elapsed else 0.0,
+            "chars_per_sec": round(sum(r.chars for r in ok) / self.elapsed, 1) if self.elapsed else 0.0,
+            "ttft_ms": {"p50": round(percentile(ttfts, 50), 1), "p99": round(percentile(ttfts, 99), 1)},
+            "inter_token_ms": {"p50": round(percentile(gaps, 50), 1), "p99": round(percentile(gaps, 99), 1)},
+            "turn_ms": {"p50": round(percentile(totals, 50), 1), "p99": round(percentile(totals, 99), 1)},
+        }
+
+
+async def run_chat(client: httpx.AsyncClient, prompt: str, session_id: Optional[str]) -> Tuple[TurnResult, Optional[str]]:
+    started = time.perf_counter()
+    try:
+        response = await client.post("/api/chat", json={"session_id": session_id, "content": prompt})
+    except httpx.HTTPError as e:
+        return TurnResult(False, (time.perf_counter() - started) * 1000, error=type(e).__name__), session_id
+    total = (time.perf_counter() - started) * 1000
+    if response.status_code != 200:
+        return TurnResult(False, total, error=f"http_{response.status_code}"), session_id
+    body = response.json()
+    return TurnResult(True, total, chars=len(body.get("reply", ""))), body.get("session_id") or session_id
+
+
+async def run_stream(client: httpx.AsyncClient, prompt: str, session_id: Optional[str]) -> Tuple[TurnResult, Optional[str]]:
+    """读取 SSE：delta 计入 TTFT 与增量间隔（开启合并时即帧间隔），error / cancelled 计为失败，event: done 结束"""
+    started = time.perf_counter()
+    params = {"q": prompt}
+    if session_id:
+        params["session_id"] = session_id
+    result = TurnResult(False, 0.0)
+    last_delta = None
+    event, data_lines = None, []
+    try:
+        async with client.stream("GET", "/api/chat/stream", params=params) as response:
+            if response.status_code != 200:
+                result.error = f"http_{response.status_code}"
+                return result, session_id
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                    continue
+                if line.startswith("data:"):
+                    data_lines.append(line[5:].lstrip())
+                    continue
+                if line or not data_lines:
+                    continue
+                # 空行：分发一个事件
+                payload = json.loads("\n".join(data_lines))
+                data_lines = []
+                if event == "done":
+                    result.ok = result.error is None
+                    break
+                event = None
+                now = time.perf_counter()
+                if "delta" in payload:
+                    if last_delta is None:
+                        result.ttft_ms = (now - started) * 1000
+                    else:
+                        result.gaps_ms.append((now - last_delta) * 1000)
+                    last_delta = now
+                    result.chars += len(payload["delta"])
+                if "session_id" in payload:
+                    session_id = payload["session_id"]
+                if "error" in payload:
+                    result.error = "stream_error"
+                elif "cancelled" in payload:
+                    result.error = "cancelled"
+            else:
+                result.error = result.error or "no_done_event"
+    except httpx.HTTPError as e:
+        result.error = type(e).__name__
+    except json.JSONDecodeError:
+        result.error = "bad_event"
+    result.total_ms = (time.perf_counter() - started) * 1000
+    return result, session_id
+
+
+async def run_level(args, endpoint: str, concurrency: int) -> LevelStats:
+    stats = LevelStats(endpoint, concurrency)
+    runner = run_stream if endpoint == "stream" else run_chat
+    limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout, limits=limits) as client:
+        deadline = time.perf_counter() + args.warmup + args.duration
+        measure_from = time.perf_counter() + args.warmup
+
+        async def worker(index: int):
+            rng = random.Random(index)
+            session_id = None
+            while time.perf_counter() < deadline:
+                turn_started = time.perf_counter()
+                result, returned_session = await runner(client, rng.choice(args.prompts), session_id)
+                # 默认每轮新建会话；--reuse-sessions 时每个 worker 在同一会话中持续对话
+                session_id = returned_session if args.reuse_sessions else None
+                if turn_started >= measure_from:
+                    stats.results.append(result)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        stats.elapsed = max(time.perf_counter() - max(started, measure_from), 1e-9)
+    return stats
+
+
+def print_summary(summary: dict) -> None:
+    print(
+        f"{summary['endpoint']:<6} c={summary['concurrency']:<4} turns={summary['turns']:<6} "
+        f"err={summary['error_rate']:.1%} tput={summary['turns_per_sec']:.2f}/s {summary['chars_per_sec']:.0f} chars/s | "
+        f"ttft p50={summary['ttft_ms']['p50']:.0f} p99={summary['ttft_ms']['p99']:.0f} | "
+        f"itl p50={summary['inter_token_ms']['p50']:.1f} p99={summary['inter_token_ms']['p99']:.1f} | "
+        f"turn p50={summary['turn_ms']['p50']:.0f} p99={summary['turn_ms']['p99']:.0f} ms"
+    )
+    if summary["error_kinds"]:
+        print(f"       errors: {summary['error_kinds']}")
+
+
+async def main(args):
+    endpoints = ["chat", "stream"] if args.endpoint == "both" else [args.endpoint]
+    summaries = []
+    for endpoint in endpoints:
+        for concurrency in args.concurrency:
+            stats = await run_level(args, endpoint, concurrency)
+            summary = stats.summary()
+            summaries.append(summary)
+            print_summary(summary)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, ensure_ascii=False, indent=2)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Closed-loop load generator for /api/chat and /api/chat/stream")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", choices=["chat", "stream", "both"], default="stream")
+    parser.add_argument("--concurrency", type=lambda s: [int(x) for x in s.split(",") if x], default=[1, 8, 32],
+                        help="comma-separated concurrency levels, e.g. 1,8,32")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before each level")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--prompt", dest="prompts", action="append", help="prompt to send (repeatable)")
+    parser.add_argument("--reuse-sessions", action="store_true")
+    parser.add_argument("--output", help="write per-level results as JSON")
+    parsed = parser.parse_args()
+    parsed.prompts = parsed.prompts or DEFAULT_PROMPTS
+    asyncio.run(main(parsed))
@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# 测试不连接外部服务
+os.environ.setdefault("LLM_API_KEY", "fake")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+from app.services.admission import AdmissionController, AdmissionRejected
+
+
+def test_key_at_cap_does_not_block_other_keys():
+    async def scenario():
+        admission = AdmissionController(global_limit=10, per_key_limit=1, queue_size=10, queue_timeout=0.2)
+        await admission.acquire("busy")
+        # 同一会话超过单键上限，进入队列
+        parked = asyncio.create_task(admission.acquire("busy"))
+        await asyncio.sleep(0)
+        assert not parked.done()
+        ticket = await asyncio.wait_for(admission.acquire("other"), timeout=0.1)
+        assert ticket.queued_ms < 100
+        parked.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_waiter_times_out_when_its_key_stays_busy():
+    async def scenario():
+        admission = AdmissionController(global_limit=10, per_key_limit=1, queue_size=10, queue_timeout=0.05)
+        await admission.acquire("busy")
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire("busy")
+        assert admission.snapshot()["queued"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,87 @@
+import asyncio
+
+from app.services.cancellation import CancellationToken
+from app.services.turns import Turn
+
+
+def test_token_cancels_once_and_runs_callbacks():
+    token = CancellationToken()
+    called = []
+    token.add_callback(lambda: called.append("a"))
+    remove = token.add_callback(lambda: called.append("b"))
+    remove()
+
+    assert token.cancel("client_cancelled")
+    assert not token.cancel("client_disconnected")
+    assert token.reason == "client_cancelled"
+    assert called == ["a"]
+
+
+def test_callback_added_after_cancel_runs_immediately():
+    token = CancellationToken()
+    token.cancel("client_cancelled")
+    called = []
+    token.add_callback(lambda: called.append(True))
+    assert called == [True]
+
+
+def test_failing_callback_does_not_stop_others():
+    token = CancellationToken()
+    called = []
+
+    def broken():
+        raise RuntimeError("boom")
+
+    token.add_callback(broken)
+    token.add_callback(lambda: called.append(True))
+    assert token.cancel("client_cancelled")
+    assert called == [True]
+
+
+def test_turn_cancelled_after_disconnect_grace():
+    async def scenario():
+        turn = Turn("t1", buffer_size=16, disconnect_grace=0.02)
+        turn.delta("a")
+        follower = turn.follow(0)
+        await follower.__anext__()
+        await follower.aclose()
+        assert not turn.cancel_token.cancelled
+        await asyncio.sleep(0.05)
+        assert turn.cancel_token.reason == "client_disconnected"
+
+    asyncio.run(scenario())
+
+
+def test_reconnect_within_grace_keeps_turn_running():
+    async def scenario():
+        turn = Turn("t1", buffer_size=16, disconnect_grace=0.05)
+        turn.delta("a")
+        follower = turn.follow(0)
+        await follower.__anext__()
+        await follower.aclose()
+        await asyncio.sleep(0.01)
+        resumed = turn.follow(1)
+        waiting = asyncio.ensure_future(resumed.__anext__())
+        await asyncio.sleep(0.08)
+        assert not turn.cancel_token.cancelled
+        turn.delta("b")
+        assert (await waiting).data == {"delta": "b"}
+        await resumed.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_cancel_interrupts_running_task_and_is_ignored_after_finish():
+    async def scenario():
+        turn = Turn("t1", buffer_size=16)
+        turn.task = asyncio.ensure_future(asyncio.sleep(10))
+        turn.cancel_token.add_callback(turn.task.cancel)
+        assert turn.cancel("client_cancelled")
+        await asyncio.sleep(0)
+        assert turn.task.cancelled()
+
+        finished = Turn("t2", buffer_size=16)
+        finished.finish()
+        assert not finished.cancel("client_cancelled")
+
+    asyncio.run(scenario())
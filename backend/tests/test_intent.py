@@ -0,0 +1,28 @@
+import asyncio
+
+import pytest
+
+from app.lang.intent import classify_intent
+
+
+def _intent(text: str) -> str:
+    return asyncio.run(classify_intent(text))[0]
+
+
+@pytest.mark.parametrize("text", ["hi", "Hello!", "hey there", "你好", "你好呀～", "谢谢！", "哈哈哈", "在吗？", "hi, thanks"])
+def test_greetings_are_chitchat(text):
+    assert _intent(text) == "chitchat"
+
+
+@pytest.mark.parametrize("text", ["which is faster?", "what is this?", "do they know?", "I think so", "你好，今天天气怎么样", "hi what is rust"])
+def test_short_questions_are_not_chitchat(text):
+    assert _intent(text) == "general_qa"
+
+
+@pytest.mark.parametrize("text", ["what is the capital of France?", "rapid growth"])
+def test_code_keywords_match_whole_words(text):
+    assert _intent(text) != "code_helper"
+
+
+def test_code_question_routes_to_code_helper():
+    assert _intent("python error in my loop") == "code_helper"
@@ -0,0 +1,58 @@
+from app.services.lexical_index import BM25Index, MemoryLexicalIndex, rrf_fuse, tokenize
+
+
+def test_tokenize_words_and_chinese_bigrams():
+    assert tokenize("I like Python3 编程") == ["i", "like", "python3", "编程"]
+    assert tokenize("喜欢咖啡") == ["喜欢", "欢咖", "咖啡"]
+    assert tokenize("猫") == ["猫"]
+
+
+def test_bm25_ranks_rarer_and_denser_matches_higher():
+    index = BM25Index()
+    index.add("coffee", "用户喜欢喝咖啡，每天早上一杯咖啡")
+    index.add("tea", "用户喜欢喝茶")
+    index.add("city", "用户住在上海")
+
+    ranked = [doc_id for doc_id, _ in index.search("咖啡", limit=5)]
+    assert ranked == ["coffee"]
+    ranked = [doc_id for doc_id, _ in index.search("喜欢喝咖啡", limit=5)]
+    assert ranked[:2] == ["coffee", "tea"]
+    assert "city" not in ranked
+
+
+def test_bm25_replace_and_remove_update_postings():
+    index = BM25Index()
+    index.add("m1", "likes python")
+    index.add("m2", "likes rust")
+    index.add("m1", "likes go")
+
+    assert index.search("python") == []
+    assert [doc_id for doc_id, _ in index.search("go")] == ["m1"]
+    index.remove("m2")
+    assert index.search("rust") == []
+    assert len(index) == 1
+
+
+def test_rrf_prefers_items_ranked_well_in_both_lists():
+    vector = ["a", "b", "c"]
+    lexical = ["c", "b", "d"]
+    # b 在两路中都排第二，总分高于只在一路排第一的 a 与 d；c 一路第一一路第三，最高
+    assert rrf_fuse([vector, lexical], k=60) == ["c", "b", "a", "d"]
+    assert rrf_fuse([vector, lexical], k=60, limit=2) == ["c", "b"]
+
+
+def test_memory_index_requires_load_and_evicts_least_recent_user():
+    indexes = MemoryLexicalIndex(max_users=2)
+    indexes.upsert("u1", "m0", "ignored before load")
+    assert indexes.search("u1", "ignored") == []
+
+    indexes.load("u1", [{"id": "m1", "memory": "住在北京"}])
+    indexes.load("u2", [{"id": "m2", "memory": "住在上海"}])
+    assert indexes.search("u1", "北京") == ["住在北京"]
+    indexes.load("u3", [])
+
+    assert not indexes.has("u2")
+    assert indexes.has("u1")
+    indexes.upsert("u1", "m3", "喜欢北京烤鸭")
+    indexes.remove("u1", "m1")
+    assert indexes.search("u1", "北京") == ["喜欢北京烤鸭"]
@@ -0,0 +1,135 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.config import settings
+from app.lang import llm_pool as pool_module
+from app.lang.llm_pool import LLMEndpoint, LLMPool
+
+
+class _FakeLLM:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+
+    async def ainvoke(self, messages):
+        self.endpoint.calls += 1
+        if self.endpoint.fail:
+            raise ConnectionError(f"{self.endpoint.name} down")
+        return SimpleNamespace(content=f"reply from {self.endpoint.name}", usage_metadata=None)
+
+    async def astream(self, messages):
+        self.endpoint.calls += 1
+        if self.endpoint.delay:
+            await asyncio.sleep(self.endpoint.delay)
+        if self.endpoint.fail:
+            raise ConnectionError(f"{self.endpoint.name} down")
+        for token in ("hello ", "from ", self.endpoint.name):
+            yield SimpleNamespace(content=token)
+            if self.endpoint.fail_after_first:
+                raise ConnectionError(f"{self.endpoint.name} dropped")
+
+
+class _FakeEndpoint(LLMEndpoint):
+    def __init__(self, name, fail=False, delay=0.0, fail_after_first=False, ttft_ms=None):
+        super().__init__(name, base_url="", api_key="fake")
+        self.fail = fail
+        self.delay = delay
+        self.fail_after_first = fail_after_first
+        self.ttft_ms = ttft_ms
+        self.calls = 0
+
+    def llm(self, model, temperature):
+        return _FakeLLM(self)
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _stream(pool):
+    async def collect():
+        return "".join([chunk async for chunk in pool.astream([], "m")])
+
+    return asyncio.run(collect())
+
+
+def test_ranked_prefers_lower_ttft_and_unprobed_endpoints():
+    slow = _FakeEndpoint("slow", ttft_ms=800)
+    fast = _FakeEndpoint("fast", ttft_ms=100)
+    fresh = _FakeEndpoint("fresh")
+    assert [ep.name for ep in LLMPool([slow, fast, fresh]).ranked()] == ["fresh", "fast", "slow"]
+
+
+def test_stream_fails_over_before_first_token():
+    broken = _FakeEndpoint("broken", fail=True, ttft_ms=10)
+    backup = _FakeEndpoint("backup", ttft_ms=500)
+    pool = LLMPool([broken, backup])
+
+    assert _stream(pool) == "hello from backup"
+    assert pool.stats["failovers"] == 1
+    assert broken.consecutive_errors == 1
+    assert backup.requests == 1
+
+
+def test_stream_error_after_first_token_is_not_retried():
+    flaky = _FakeEndpoint("flaky", fail_after_first=True, ttft_ms=10)
+    backup = _FakeEndpoint("backup", ttft_ms=500)
+    pool = LLMPool([flaky, backup])
+
+    with pytest.raises(ConnectionError):
+        _stream(pool)
+    assert backup.calls == 0
+    assert flaky.consecutive_errors == 1
+
+
+def test_invoke_fails_over_and_raises_when_all_endpoints_fail():
+    broken = _FakeEndpoint("broken", fail=True, ttft_ms=10)
+    backup = _FakeEndpoint("backup", ttft_ms=500)
+    pool = LLMPool([broken, backup])
+    assert asyncio.run(pool.ainvoke([], "m")) == "reply from backup"
+
+    backup.fail = True
+    with pytest.raises(ConnectionError):
+        asyncio.run(pool.ainvoke([], "m"))
+
+
+def test_circuit_opens_after_threshold_and_closes_after_cooldown(monkeypatch):
+    clock = _FakeClock()
+    monkeypatch.setattr(pool_module.time, "monotonic", clock)
+    broken = _FakeEndpoint("broken", fail=True, ttft_ms=10)
+    backup = _FakeEndpoint("backup", ttft_ms=500)
+    pool = LLMPool([broken, backup])
+
+    for _ in range(settings.LLM_BREAKER_THRESHOLD):
+        assert asyncio.run(pool.ainvoke([], "m")) == "reply from backup"
+    assert broken.is_open
+    assert pool.ranked()[-1] is broken
+
+    # 熔断期间不再先试故障端点
+    calls = broken.calls
+    asyncio.run(pool.ainvoke([], "m"))
+    assert broken.calls == calls
+
+    clock.now += settings.LLM_BREAKER_COOLDOWN + 1
+    assert not broken.is_open
+    broken.fail = False
+    broken.error_rate = 0.0
+    assert asyncio.run(pool.ainvoke([], "m")) == "reply from broken"
+    assert broken.consecutive_errors == 0
+
+
+def test_hedge_sends_second_request_when_first_token_is_late(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_MS", 10)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MAX_MS", 20)
+    slow = _FakeEndpoint("slow", delay=1.0, ttft_ms=10)
+    quick = _FakeEndpoint("quick", ttft_ms=500)
+    pool = LLMPool([slow, quick], hedge_enabled=True)
+
+    assert _stream(pool) == "hello from quick"
+    assert pool.stats["hedged"] == 1
+    assert pool.stats["hedge_wins"] == 1
@@ -0,0 +1,78 @@
+from app.services.memory_changes import MemoryChangeLog
+
+
+def _ops(changes):
+    return [(entry.op, entry.memory_id) for entry in changes]
+
+
+def test_since_returns_changes_after_cursor_and_keeps_latest_per_memory():
+    log = MemoryChangeLog(max_entries=10)
+    start = log.cursor("u1")
+    log.record("u1", "upsert", "m1", {"memory": "v1"})
+    log.record("u1", "upsert", "m2", {"memory": "x"})
+    middle = log.cursor("u1")
+    log.record("u1", "upsert", "m1", {"memory": "v2"})
+    log.record("u1", "delete", "m2")
+
+    changes, current = log.since("u1", start)
+    assert _ops(changes) == [("upsert", "m1"), ("delete", "m2")]
+    assert changes[0].memory == {"memory": "v2"}
+    assert _ops(log.since("u1", middle)[0]) == [("upsert", "m1"), ("delete", "m2")]
+    assert log.since("u1", current) == ([], current)
+
+
+def test_other_users_changes_do_not_appear():
+    log = MemoryChangeLog(max_entries=10)
+    cursor = log.cursor("u1")
+    log.record("u2", "upsert", "other")
+    log.record("u1", "upsert", "mine")
+    assert _ops(log.since("u1", cursor)[0]) == [("upsert", "mine")]
+
+
+def test_invalid_cursor_requires_reset():
+    log = MemoryChangeLog(max_entries=10)
+    log.record("u1", "upsert", "m1")
+    for cursor in (None, "", "garbage", f"other-epoch:1", f"{log.epoch}:x", f"{log.epoch}:999"):
+        changes, current = log.since("u1", cursor)
+        assert changes is None
+        assert current == log.cursor("u1")
+
+
+def test_cursor_older_than_retained_window_requires_reset():
+    log = MemoryChangeLog(max_entries=3)
+    stale = log.cursor("u1")
+    log.record("u1", "upsert", "m1")
+    kept = log.cursor("u1")
+    for index in range(2, 5):
+        log.record("u1", "upsert", f"m{index}")
+
+    # m1 已被挤出：m1 之前的游标失效，m1 之后的游标仍可增量同步
+    assert log.since("u1", stale)[0] is None
+    assert _ops(log.since("u1", kept)[0]) == [("upsert", "m2"), ("upsert", "m3"), ("upsert", "m4")]
+
+
+def test_evicted_user_keeps_up_to_date_cursor_and_resets_older_one():
+    log = MemoryChangeLog(max_entries=10, max_users=2)
+    before = log.cursor("u1")
+    log.record("u1", "upsert", "m1")
+    latest = log.cursor("u1")
+    log.record("u2", "upsert", "m2")
+    log.record("u3", "upsert", "m3")  # 淘汰 u1
+
+    # 早于 u1 最后一次变更的游标无法确认缺了什么，需要全量同步
+    assert log.since("u1", before)[0] is None
+    # 淘汰时已是最新的游标仍然完整：之后 u1 的变更都会进入新日志
+    assert log.since("u1", latest)[0] == []
+    log.record("u1", "upsert", "m4")
+    assert _ops(log.since("u1", latest)[0]) == [("upsert", "m4")]
+
+
+def test_rebuilt_log_does_not_accept_cursors_from_before_eviction():
+    log = MemoryChangeLog(max_entries=10, max_users=1)
+    log.record("u1", "upsert", "a")
+    after_a = log.cursor("u1")
+    log.record("u1", "upsert", "b")
+    log.record("u2", "upsert", "c")  # 淘汰 u1，"b" 随之丢失
+    log.record("u1", "upsert", "d")  # u1 以新日志重建
+
+    assert log.since("u1", after_a)[0] is None
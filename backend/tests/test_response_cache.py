@@ -0,0 +1,84 @@
+import asyncio
+
+import numpy as np
+
+from app.lang import response_cache
+from app.lang.response_cache import ResponseCache, normalize_prompt
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class _FakeEmbedding:
+    available = True
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    async def embed(self, texts):
+        return np.array([self.vectors[text] for text in texts], dtype=np.float32)
+
+
+def _lookup(cache, prompt, system="sys", model="m"):
+    return asyncio.run(cache.lookup(prompt, system, model))
+
+
+def test_normalize_prompt_ignores_case_whitespace_and_trailing_punctuation():
+    assert normalize_prompt("  What   is  Python？！ ") == normalize_prompt("what is python")
+
+
+def test_exact_hit_after_store_and_miss_on_other_context():
+    cache = ResponseCache(max_items=10, ttl=60)
+    miss = _lookup(cache, "什么是 Python？")
+    assert miss.answer is None
+    cache.store(miss, "一种编程语言")
+
+    hit = _lookup(cache, "什么是 python")
+    assert (hit.answer, hit.tier) == ("一种编程语言", "exact")
+    assert _lookup(cache, "什么是 python", system="other").answer is None
+    assert _lookup(cache, "什么是 python", model="other").answer is None
+
+
+def test_entry_expires_after_ttl(monkeypatch):
+    clock = _FakeClock()
+    monkeypatch.setattr(response_cache.time, "monotonic", clock)
+    cache = ResponseCache(max_items=10, ttl=60)
+    cache.store(_lookup(cache, "hi there"), "hello")
+
+    clock.now += 59
+    assert _lookup(cache, "hi there").answer == "hello"
+    clock.now += 2
+    assert _lookup(cache, "hi there").answer is None
+    assert len(cache._entries) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_items=2, ttl=60)
+    for prompt in ("a", "b"):
+        cache.store(_lookup(cache, prompt), prompt.upper())
+    assert _lookup(cache, "a").answer == "A"
+    cache.store(_lookup(cache, "c"), "C")
+
+    assert _lookup(cache, "b").answer is None
+    assert _lookup(cache, "a").answer == "A"
+    assert _lookup(cache, "c").answer == "C"
+
+
+def test_semantic_hit_requires_threshold_and_same_context(monkeypatch):
+    monkeypatch.setattr(response_cache, "embedding_client", _FakeEmbedding({
+        "how do i learn python": [1.0, 0.0],
+        "best way to learn python": [0.96, 0.28],
+        "what is the weather": [0.0, 1.0],
+    }))
+    cache = ResponseCache(max_items=10, ttl=60, semantic_threshold=0.9)
+    cache.store(_lookup(cache, "How do I learn Python?"), "多写代码")
+
+    hit = _lookup(cache, "best way to learn python")
+    assert (hit.answer, hit.tier) == ("多写代码", "semantic")
+    assert _lookup(cache, "what is the weather").answer is None
+    assert _lookup(cache, "best way to learn python", system="other").answer is None
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from app.lang import safety
+from app.lang.safety import ALLOW, BLOCK, SafetyAbort, SafetyStage, Verdict
+
+ID_NUMBER = "110101199003071234"
+
+
+async def _chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def _guarded(*chunks) -> str:
+    async def collect():
+        stage = SafetyStage("你好")
+        return "".join([piece async for piece in stage.guard(_chunks(*chunks))])
+
+    return asyncio.run(collect())
+
+
+def test_id_number_redacted_in_single_chunk():
+    reply = _guarded(f"身份证号 {ID_NUMBER}，请核对。")
+    assert ID_NUMBER not in reply
+    assert "*" * 18 in reply
+
+
+def test_id_number_redacted_when_chunk_ends_with_it():
+    reply = _guarded(f"身份证号 {ID_NUMBER}", "，请核对。")
+    assert ID_NUMBER not in reply
+    assert reply == f"身份证号 {'*' * 18}，请核对。"
+
+
+def test_id_number_split_across_chunks_is_redacted():
+    reply = _guarded("身份证号 1101011990", "03071234，请核对。")
+    assert ID_NUMBER not in reply
+    assert "*" * 18 in reply
+
+
+def test_trailing_latin_x_is_not_held():
+    async def collect():
+        stage = SafetyStage("hello")
+        stream = stage.guard(_chunks("Put it in the box", " and run Linux"))
+        return [piece async for piece in stream]
+
+    assert asyncio.run(collect()) == ["Put it in the box", " and run Linux"]
+
+
+def test_id_number_with_check_letter_split_before_x_is_redacted():
+    reply = _guarded("身份证号 11010119900307123", "X，请核对。")
+    assert reply == f"身份证号 {'*' * 18}，请核对。"
+
+
+def _moderated(monkeypatch, answer, *chunks):
+    calls = []
+
+    async def fake_moderate(text, output=False):
+        calls.append((text, output))
+        return Verdict(BLOCK, "unsafe", source="output_llm") if answer == BLOCK else Verdict(ALLOW, source="output_llm")
+
+    monkeypatch.setattr(safety, "moderate_with_llm", fake_moderate)
+    return _guarded(*chunks), calls
+
+
+def test_refusal_mentioning_blocked_topic_is_not_aborted(monkeypatch):
+    refusal = "我不能告诉你如何制作炸弹，这很危险。"
+    reply, calls = _moderated(monkeypatch, ALLOW, "我不能告诉你如何", "制作炸弹，", "这很危险。")
+    assert reply == refusal
+    assert calls == [("我不能告诉你如何制作炸弹，", True)]
+
+
+def test_output_rule_match_aborts_only_when_moderation_blocks(monkeypatch):
+    with pytest.raises(SafetyAbort) as excinfo:
+        _moderated(monkeypatch, BLOCK, "自制炸弹的步骤如下：", "第一步……", "第二步……")
+    assert excinfo.value.verdict.source == "output_llm"
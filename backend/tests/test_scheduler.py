@@ -0,0 +1,53 @@
+import asyncio
+
+from app.lang.scheduler import LLMScheduler, Priority
+
+
+def _scheduler(**limits) -> LLMScheduler:
+    class_limits = {Priority.INTERACTIVE: 4, Priority.NEARLINE: 2, Priority.BACKGROUND: 1}
+    class_limits.update({Priority[k.upper()]: v for k, v in limits.items()})
+    return LLMScheduler(total_limit=4, class_limits=class_limits, background_reserve=1, preempt_depth=100)
+
+
+def test_queued_background_does_not_delay_interactive():
+    async def scenario():
+        scheduler = _scheduler()
+        await scheduler.acquire(Priority.BACKGROUND)
+        # 第二个后台请求因类别上限排队
+        parked = asyncio.create_task(scheduler.acquire(Priority.BACKGROUND))
+        await asyncio.sleep(0)
+        assert not parked.done()
+        await asyncio.wait_for(scheduler.acquire(Priority.INTERACTIVE), timeout=0.1)
+        assert scheduler.active[Priority.INTERACTIVE] == 1
+        parked.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_nearline_at_class_limit_does_not_block_background():
+    async def scenario():
+        scheduler = _scheduler(nearline=1)
+        await scheduler.acquire(Priority.NEARLINE)
+        parked = asyncio.create_task(scheduler.acquire(Priority.NEARLINE))
+        await asyncio.sleep(0)
+        assert not parked.done()
+        await asyncio.wait_for(scheduler.acquire(Priority.BACKGROUND), timeout=0.1)
+        parked.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_blocked_interactive_holds_back_lower_priorities():
+    async def scenario():
+        scheduler = _scheduler(interactive=1)
+        await scheduler.acquire(Priority.INTERACTIVE)
+        interactive = asyncio.create_task(scheduler.acquire(Priority.INTERACTIVE))
+        await asyncio.sleep(0)
+        nearline = asyncio.create_task(scheduler.acquire(Priority.NEARLINE))
+        await asyncio.sleep(0)
+        assert not interactive.done() and not nearline.done()
+        scheduler._release(Priority.INTERACTIVE)
+        await asyncio.wait_for(interactive, timeout=0.1)
+        await asyncio.wait_for(nearline, timeout=0.1)
+
+    asyncio.run(scenario())
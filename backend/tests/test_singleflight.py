@@ -0,0 +1,141 @@
+import asyncio
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from app.lang.singleflight import SingleFlight, make_key
+
+
+def test_make_key_depends_on_model_messages_and_params():
+    messages = [SystemMessage(content="sys"), HumanMessage(content="hi")]
+    key = make_key("m", messages, {"temperature": 0.7})
+    assert key == make_key("m", list(messages), {"temperature": 0.7})
+    assert key != make_key("other", messages, {"temperature": 0.7})
+    assert key != make_key("m", [HumanMessage(content="sys"), HumanMessage(content="hi")], {"temperature": 0.7})
+    assert key != make_key("m", messages, {"temperature": 0.2})
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    async def scenario():
+        flights = SingleFlight()
+        calls = 0
+
+        async def upstream():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flights.call("k", upstream) for _ in range(5)))
+        assert results == ["answer"] * 5
+        assert calls == 1
+        # 完成后不再合并，下一次调用重新发起
+        assert await flights.call("k", upstream) == "answer"
+        assert calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_call_error_propagates_to_every_waiter():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def upstream():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream failed")
+
+        results = await asyncio.gather(*(flights.call("k", upstream) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) and str(r) == "upstream failed" for r in results)
+        assert flights._calls == {}
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_one_waiter_keeps_shared_call_running():
+    async def scenario():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def upstream():
+            await release.wait()
+            return "answer"
+
+        first = asyncio.create_task(flights.call("k", upstream))
+        second = asyncio.create_task(flights.call("k", upstream))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await second == "answer"
+        assert first.cancelled()
+
+    asyncio.run(scenario())
+
+
+def test_stream_fans_out_and_late_joiner_replays_from_start():
+    async def scenario():
+        flights = SingleFlight()
+        starts = 0
+        halfway = asyncio.Event()
+
+        async def upstream():
+            nonlocal starts
+            starts += 1
+            for index, chunk in enumerate(["a", "b", "c", "d"]):
+                if index == 2:
+                    halfway.set()
+                    await asyncio.sleep(0.01)
+                yield chunk
+
+        async def collect():
+            return "".join([chunk async for chunk in flights.stream("k", upstream)])
+
+        first = asyncio.create_task(collect())
+        await halfway.wait()
+        second = asyncio.create_task(collect())
+        assert await asyncio.gather(first, second) == ["abcd", "abcd"]
+        assert starts == 1
+
+    asyncio.run(scenario())
+
+
+def test_stream_error_propagates_to_every_subscriber():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def upstream():
+            yield "partial"
+            await asyncio.sleep(0.01)
+            raise RuntimeError("stream broke")
+
+        async def collect():
+            return [chunk async for chunk in flights.stream("k", upstream)]
+
+        results = await asyncio.gather(collect(), collect(), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert flights._streams == {}
+
+    asyncio.run(scenario())
+
+
+def test_last_subscriber_leaving_cancels_upstream_stream():
+    async def scenario():
+        flights = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def upstream():
+            try:
+                yield "first"
+                await asyncio.sleep(10)
+                yield "never"
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        stream = flights.stream("k", upstream)
+        assert await stream.__anext__() == "first"
+        await stream.aclose()
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        assert flights._streams == {}
+
+    asyncio.run(scenario())
+
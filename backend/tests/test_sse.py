@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+import pytest
+
+from app.services.sse import coalesce, data_frame, delta_frame, event_frame
+
+
+async def _chunks(*chunks, pause=0.0):
+    for chunk in chunks:
+        yield chunk
+        await asyncio.sleep(pause)
+
+
+def _coalesced(chunks, max_delay_ms, max_bytes):
+    async def collect():
+        return [text async for text in coalesce(chunks, max_delay_ms, max_bytes)]
+
+    return asyncio.run(collect())
+
+
+def test_zero_thresholds_pass_chunks_through():
+    assert _coalesced(_chunks("a", "b", "c"), 0, 0) == ["a", "b", "c"]
+
+
+def test_first_chunk_is_sent_alone_and_rest_merged_within_delay():
+    out = _coalesced(_chunks("你", "好", "世", "界", pause=0.001), max_delay_ms=200, max_bytes=0)
+    assert out[0] == "你"
+    assert "".join(out) == "你好世界"
+    assert len(out) == 2
+
+
+def test_delay_threshold_flushes_slow_streams():
+    async def slow():
+        yield "a"
+        yield "b"
+        await asyncio.sleep(0.05)
+        yield "c"
+
+    assert _coalesced(slow(), max_delay_ms=10, max_bytes=0) == ["a", "b", "c"]
+
+
+def test_byte_threshold_counts_utf8_bytes():
+    # 每个汉字 3 字节：阈值 6 字节即每两个字发送一次，不等待 1 秒的定时器
+    async def scenario():
+        started = asyncio.get_running_loop().time()
+        out = [text async for text in coalesce(_chunks("你", "好", "世", "界", "！"), 1000, 6)]
+        return out, asyncio.get_running_loop().time() - started
+
+    out, elapsed = asyncio.run(scenario())
+    assert out == ["你", "好世", "界！"]
+    assert elapsed < 0.5
+
+
+def test_upstream_error_is_raised_after_buffered_text():
+    async def broken():
+        yield "partial"
+        yield " text"
+        raise RuntimeError("upstream failed")
+
+    async def collect(received):
+        async for text in coalesce(broken(), 50, 0):
+            received.append(text)
+
+    received = []
+    with pytest.raises(RuntimeError):
+        asyncio.run(collect(received))
+    assert "".join(received) == "partial text"
+
+
+def test_prebuilt_frames_match_json_encoding():
+    assert delta_frame('say "hi"\n') == data_frame({"delta": 'say "hi"\n'})
+    frame = event_frame("turn:3", data_frame({"x": 1}), event="done")
+    head, body = frame.split(b"data: ", 1)
+    assert head == b"id: turn:3\nevent: done\n"
+    assert json.loads(body) == {"x": 1}
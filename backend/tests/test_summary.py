@@ -0,0 +1,133 @@
+import asyncio
+import json
+import re
+
+import pytest
+
+from app.services import summary
+from app.services.session_events import session_events
+from app.services.summary import SessionTitler
+
+
+class _FakePool:
+    available = True
+
+    def __init__(self, fail_batches=False, skip=()):
+        self.prompts = []
+        self.fail_batches = fail_batches
+        self.skip = set(skip)
+
+    async def ainvoke(self, messages, model, temperature=0.7, priority=None):
+        prompt = messages[-1].content
+        self.prompts.append(prompt)
+        # 与真实调用一样让出事件循环
+        await asyncio.sleep(0.01)
+        numbers = re.findall(r"^\[(\d+)\]$", prompt, re.M)
+        if not numbers:
+            user = re.search(r"用户：(.*)", prompt).group(1)
+            return f"单独:{user}"
+        if self.fail_batches:
+            raise RuntimeError("batch call failed")
+        users = re.findall(r"用户：(.*)", prompt)
+        return json.dumps({n: f"批量:{u}" for n, u in zip(numbers, users) if u not in self.skip}, ensure_ascii=False)
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    titles = {}
+
+    def update_session_title(session_id, title):
+        titles[session_id] = title
+
+    monkeypatch.setattr(summary, "update_session_title", update_session_title)
+    monkeypatch.setattr(summary, "get_session", lambda session_id: {"id": session_id, "title": titles[session_id]} if session_id in titles else None)
+    return titles
+
+
+def _run(titler, items, after=None):
+    async def scenario():
+        pushed = []
+        stops = [session_events.subscribe(sid, lambda data, sid=sid: pushed.append((sid, data))) for sid, _ in items]
+        for session_id, message in items:
+            titler.schedule(session_id, message, "回复")
+        if after is not None:
+            after()
+        results = await asyncio.gather(*(titler.wait(sid, timeout=2) for sid, _ in items))
+        for stop in stops:
+            stop()
+        return results, pushed
+
+    return asyncio.run(scenario())
+
+
+def test_pending_sessions_are_titled_in_one_batched_call(monkeypatch, sessions):
+    pool = _FakePool()
+    monkeypatch.setattr(summary, "llm_pool", pool)
+    titler = SessionTitler(batch_size=8, batch_window=0.01)
+
+    results, pushed = _run(titler, [("s1", "问题一"), ("s2", "问题二"), ("s3", "问题三")])
+    assert results == ["批量:问题一", "批量:问题二", "批量:问题三"]
+    assert len(pool.prompts) == 1
+    assert sessions == {"s1": "批量:问题一", "s2": "批量:问题二", "s3": "批量:问题三"}
+    assert ("s2", {"title_update": "批量:问题二"}) in pushed
+
+
+def test_full_batch_is_sent_without_waiting_for_window(monkeypatch, sessions):
+    pool = _FakePool()
+    monkeypatch.setattr(summary, "llm_pool", pool)
+    titler = SessionTitler(batch_size=2, batch_window=10)
+
+    results, _ = _run(titler, [("s1", "问题一"), ("s2", "问题二")])
+    assert results == ["批量:问题一", "批量:问题二"]
+    assert len(pool.prompts) == 1
+
+
+def test_failed_batch_falls_back_to_one_call_per_session(monkeypatch, sessions):
+    pool = _FakePool(fail_batches=True)
+    monkeypatch.setattr(summary, "llm_pool", pool)
+    titler = SessionTitler(batch_size=8, batch_window=0.01)
+
+    results, _ = _run(titler, [("s1", "问题一"), ("s2", "问题二")])
+    assert results == ["单独:问题一", "单独:问题二"]
+    assert len(pool.prompts) == 3
+
+
+def test_sessions_missing_from_batch_result_are_retried(monkeypatch, sessions):
+    pool = _FakePool(skip={"问题二"})
+    monkeypatch.setattr(summary, "llm_pool", pool)
+    titler = SessionTitler(batch_size=8, batch_window=0.01)
+
+    results, _ = _run(titler, [("s1", "问题一"), ("s2", "问题二")])
+    assert results == ["批量:问题一", "单独:问题二"]
+    assert len(pool.prompts) == 2
+
+
+def test_title_renamed_by_user_is_not_overwritten(monkeypatch, sessions):
+    monkeypatch.setattr(summary, "llm_pool", _FakePool())
+    titler = SessionTitler(batch_size=8, batch_window=0.01)
+
+    def rename():
+        sessions["s1"] = "我的标题"
+
+    results, pushed = _run(titler, [("s1", "问题一"), ("s2", "问题二")], after=rename)
+    assert results == [None, "批量:问题二"]
+    assert sessions["s1"] == "我的标题"
+    assert all(sid != "s1" for sid, _ in pushed)
+
+
+def test_placeholder_only_when_llm_unavailable(monkeypatch, sessions):
+    pool = _FakePool()
+    pool.available = False
+    monkeypatch.setattr(summary, "llm_pool", pool)
+    titler = SessionTitler(batch_size=8, batch_window=0.01)
+
+    long_message = "很长的问题" * 20
+
+    async def scenario():
+        title = titler.schedule("s1", long_message, "回复")
+        return title, await titler.wait("s1", timeout=0.1)
+
+    title, final = asyncio.run(scenario())
+    assert title == long_message[:50] + "..."
+    assert final is None
+    assert pool.prompts == []
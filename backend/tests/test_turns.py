@@ -0,0 +1,77 @@
+import asyncio
+
+from app.services import turns
+from app.services.turns import Turn, TurnRegistry, parse_event_id
+
+
+def test_retract_drops_blocked_text_for_resuming_clients():
+    async def scenario():
+        turn = Turn("t1", buffer_size=16)
+        turn.delta("blocked ")
+        turn.delta("content")
+        turn.retract({"snapshot": "refused"})
+        turn.finish()
+        # 从最开始续传（Last-Event-ID 为 0）的客户端
+        replayed = [event.data async for event in turn.follow(0)]
+        assert all("delta" not in data for data in replayed)
+        assert replayed[-1] == {"snapshot": "refused"}
+        assert "blocked" not in str(replayed)
+        assert turn.text == "refused"
+
+    asyncio.run(scenario())
+
+
+def _collect(turn, after_seq):
+    async def collect():
+        return [event async for event in turn.follow(after_seq)]
+
+    return asyncio.run(collect())
+
+
+def test_parse_event_id():
+    assert parse_event_id("abc:12") == ("abc", 12)
+    assert parse_event_id("a:b:3") == ("a:b", 3)
+    assert parse_event_id("abc") is None
+    assert parse_event_id("abc:x") is None
+    assert parse_event_id("") is None
+
+
+def test_resume_continues_after_last_event_id():
+    turn = Turn("t1", buffer_size=16)
+    for text in ("a", "b", "c"):
+        turn.delta(text)
+    turn.publish({}, event="done")
+    turn.finish()
+
+    events = _collect(turn, 2)
+    assert [event.seq for event in events] == [3, 4]
+    assert events[0].frame == b'id: t1:3\ndata: {"delta":"c"}\n\n'
+    assert events[1].frame == b"id: t1:4\nevent: done\ndata: {}\n\n"
+
+
+def test_resume_sends_snapshot_when_events_were_evicted():
+    turn = Turn("t1", buffer_size=2)
+    turn.session_id = "s1"
+    for text in ("a", "b", "c", "d"):
+        turn.delta(text)
+    turn.finish()
+
+    events = _collect(turn, 1)
+    assert events[0].data == {"snapshot": "ab", "session_id": "s1"}
+    assert [event.data for event in events[1:]] == [{"delta": "c"}, {"delta": "d"}]
+    assert events[0].data["snapshot"] + "".join(e.data["delta"] for e in events[1:]) == "abcd"
+
+
+def test_registry_resume_and_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(turns.time, "monotonic", lambda: now[0])
+    registry = TurnRegistry(ttl=60, buffer_size=16)
+    turn = registry.create()
+    turn.delta("hi")
+
+    assert registry.resume(f"{turn.id}:99") == (turn, 1)
+    assert registry.resume("unknown:1") is None
+    turn.finish()
+    now[0] += 61
+    assert registry.resume(f"{turn.id}:1") is None
+    assert len(registry) == 0